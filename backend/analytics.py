@@ -0,0 +1,190 @@
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# SQLite file for analysis records; unset disables the sink
+ANALYTICS_DB = os.getenv("ANALYTICS_DB", "")
+ANALYTICS_BUFFER = int(os.getenv("ANALYTICS_BUFFER", "10000"))
+ANALYTICS_BATCH = int(os.getenv("ANALYTICS_BATCH", "500"))
+ANALYTICS_FLUSH_SECONDS = float(os.getenv("ANALYTICS_FLUSH_SECONDS", "1.0"))
+
+RECORDS = metrics.REGISTRY.counter(
+    "rhinovate_analytics_records_total",
+    "Analysis records by outcome: written, dropped because the buffer was full, or failed to write",
+    ["result"],
+)
+WRITER_UP = metrics.REGISTRY.gauge(
+    "rhinovate_analytics_writer_up",
+    "1 while the analytics writer thread is running, 0 once it has stopped on an error",
+)
+FLUSH_SECONDS = metrics.REGISTRY.histogram(
+    "rhinovate_analytics_flush_seconds",
+    "Time to write one batch of analysis records",
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS analyses (
+    id INTEGER PRIMARY KEY,
+    created REAL NOT NULL,
+    source_key TEXT,
+    quality TEXT,
+    intensities TEXT,
+    symmetry_score REAL,
+    facial_harmony_score INTEGER,
+    measurements TEXT,
+    operations TEXT,
+    variants TEXT,
+    timings TEXT
+)
+"""
+COLUMNS = ("created", "source_key", "quality", "intensities", "symmetry_score", "facial_harmony_score",
+           "measurements", "operations", "variants", "timings")
+INSERT = f"INSERT INTO analyses ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})"
+
+
+def _dumps(value: Any) -> Optional[str]:
+    # Measurements hold numpy scalars; float() covers them
+    return None if value is None else json.dumps(value, default=float, separators=(",", ":"))
+
+
+class AnalyticsSink:
+    """Analysis records written to SQLite in batches by a background thread.
+
+    record() only appends to a bounded in-memory queue and never blocks the
+    request: when the writer falls behind and the queue is full, the record is
+    dropped and counted. Serialization and all SQLite work happen on the
+    writer thread, which owns the connection; the database runs in WAL mode so
+    readers never stall it. Records still queued are flushed on close().
+    A batch that fails to write is counted as failed and the writer moves on;
+    if the writer itself cannot run (e.g. the database cannot be opened), it
+    is logged, `alive` turns False and every record is counted as failed.
+    """
+
+    def __init__(self, path: str, capacity: int = ANALYTICS_BUFFER, batch_size: int = ANALYTICS_BATCH,
+                 flush_interval: float = ANALYTICS_FLUSH_SECONDS):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue(maxsize=capacity)
+        self.alive = True
+        WRITER_UP.set(1)
+        self._writer = threading.Thread(target=self._run, name="analytics-writer", daemon=True)
+        self._writer.start()
+
+    def record(self, **fields) -> bool:
+        """Queue one analysis (see COLUMNS); False when it was dropped"""
+        if not self.alive:
+            RECORDS.inc(result="failed")
+            return False
+        fields.setdefault("created", time.time())
+        try:
+            self._queue.put_nowait(fields)
+            return True
+        except queue.Full:
+            RECORDS.inc(result="dropped")
+            return False
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Flush what is queued and stop the writer"""
+        if self._writer.is_alive():
+            # The sentinel must get in even if the buffer is full
+            self._queue.put(None)
+            self._writer.join(timeout)
+
+    def _run(self) -> None:
+        try:
+            connection = self._connect()
+        except Exception:
+            logger.exception("Analytics writer could not open %s; analysis records will not be kept", self.path)
+            self._stop()
+            return
+        try:
+            while True:
+                batch = self._next_batch()
+                stop = batch and batch[-1] is None
+                records = [record for record in batch if record is not None]
+                if records:
+                    self._write(connection, records)
+                if stop:
+                    return
+        except Exception:
+            logger.exception("Analytics writer stopped")
+            self._stop()
+        finally:
+            connection.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path)
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            # WAL with NORMAL sync survives crashes of the process; only an OS crash can lose the last batches
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(SCHEMA)
+            connection.commit()
+        except Exception:
+            connection.close()
+            raise
+        return connection
+
+    def _stop(self) -> None:
+        """Mark the writer dead and count whatever is still queued as failed"""
+        self.alive = False
+        WRITER_UP.set(0)
+        while True:
+            try:
+                record = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if record is not None:
+                RECORDS.inc(result="failed")
+
+    def _next_batch(self) -> List[Optional[Dict[str, Any]]]:
+        """Wait up to a flush interval for a record, then take whatever else is ready, up to a batch"""
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        while len(batch) < self.batch_size and batch[-1] is not None:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, connection: sqlite3.Connection, records: List[Dict[str, Any]]) -> None:
+        start = time.perf_counter()
+        try:
+            rows = [
+                (
+                    record["created"], record.get("source_key"), record.get("quality"),
+                    _dumps(record.get("intensities")), record.get("symmetry_score"),
+                    record.get("facial_harmony_score"), _dumps(record.get("measurements")),
+                    _dumps(record.get("operations")), _dumps(record.get("variants")), _dumps(record.get("timings")),
+                )
+                for record in records
+            ]
+            with connection:
+                connection.executemany(INSERT, rows)
+        except Exception:
+            # One unserializable record or a locked database costs this batch, not the writer
+            logger.exception("Could not write %d analysis records", len(records))
+            RECORDS.inc(len(records), result="failed")
+            return
+        RECORDS.inc(len(records), result="written")
+        FLUSH_SECONDS.observe(time.perf_counter() - start)
+
+
+def sink_from_env() -> Optional[AnalyticsSink]:
+    """The sink configured by ANALYTICS_* environment variables; None unless ANALYTICS_DB is set"""
+    if not ANALYTICS_DB:
+        return None
+    return AnalyticsSink(ANALYTICS_DB)
@@ -1,6 +1,37 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Sequence
+import copy
 import json
 
+# Intensity levels offered side by side, as multipliers on the rule limits.
+# The default rules are already at the edge of what the renderer accepts
+# (e.g. nose factors below 0.70), so levels only scale them down.
+INTENSITY_LEVELS = {
+    "conservative": 0.5,
+    "moderate": 0.75,
+    "aggressive": 1.0,
+}
+
+# (section, key) of the limits an intensity level scales
+SCALED_LIMITS = [
+    ("global", "max_symmetry_delta"),
+    ("nose", "max_reduction"),
+    ("nose", "tip_refinement"),
+    ("nose", "bridge_refinement"),
+    ("jaw", "max_asymmetry_correction"),
+]
+
+def parse_intensities(value: Optional[str]) -> List[str]:
+    """Parse "conservative,moderate" (or "all") into intensity level names; empty means none"""
+    if not value:
+        return []
+    if value == "all":
+        return list(INTENSITY_LEVELS)
+    levels = list(dict.fromkeys(level.strip() for level in value.split(",") if level.strip()))
+    unknown = [level for level in levels if level not in INTENSITY_LEVELS]
+    if unknown:
+        raise ValueError(f"Unknown intensity levels {unknown}, expected some of {list(INTENSITY_LEVELS)}")
+    return levels
+
 class BeautyRulesEngine:
     def __init__(self):
         # Beauty rules configuration
@@ -34,17 +65,34 @@ class BeautyRulesEngine:
             }
         }
     
-    def plan_changes(self, measurements: Dict[str, Any]) -> List[Dict[str, Any]]:
-        """Plan cosmetic changes based on facial measurements"""
+    def rules_for_intensity(self, intensity: float) -> Dict[str, Any]:
+        """Copy of the rules with the scalable limits multiplied by `intensity`"""
+        rules = copy.deepcopy(self.BEAUTY_RULES)
+        for section, key in SCALED_LIMITS:
+            rules[section][key] *= intensity
+        return rules
+    
+    def plan_variants(self, measurements: Dict[str, Any],
+                      levels: Optional[Sequence[str]] = None) -> Dict[str, List[Dict[str, Any]]]:
+        """Plan the same measurements at several intensity levels (default all), by name"""
+        return {
+            level: self.plan_changes(measurements, self.rules_for_intensity(INTENSITY_LEVELS[level]))
+            for level in (levels or INTENSITY_LEVELS)
+        }
+    
+    def plan_changes(self, measurements: Dict[str, Any],
+                     rules: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Plan cosmetic changes based on facial measurements, by default with BEAUTY_RULES"""
+        rules = rules or self.BEAUTY_RULES
         operations = []
         
         # 1) Symmetry correction
         current_symmetry = measurements.get("symmetry_score", 1.0)
-        target_symmetry = self.BEAUTY_RULES["global"]["target_symmetry"]
+        target_symmetry = rules["global"]["target_symmetry"]
         
         if current_symmetry < target_symmetry:
             delta = min(target_symmetry - current_symmetry, 
-                       self.BEAUTY_RULES["global"]["max_symmetry_delta"])
+                       rules["global"]["max_symmetry_delta"])
             operations.append({
                 "region": "face", 
                 "type": "symmetry", 
@@ -54,12 +102,12 @@ class BeautyRulesEngine:
         
         # 2) Nose width correction - comprehensive rhinoplasty
         nose_ratio = measurements.get("nose_to_ipd_ratio", 1.0)
-        ideal_nose_ratio = self.BEAUTY_RULES["nose"]["ideal_nose_to_ipd"]
+        ideal_nose_ratio = rules["nose"]["ideal_nose_to_ipd"]
         
         if nose_ratio > ideal_nose_ratio:
             # Nose is too wide - significant reduction needed
             excess = nose_ratio / ideal_nose_ratio - 1.0
-            shrink_factor = min(excess, self.BEAUTY_RULES["nose"]["max_reduction"])
+            shrink_factor = min(excess, rules["nose"]["max_reduction"])
             
             # Main width reduction
             operations.append({
@@ -74,7 +122,7 @@ class BeautyRulesEngine:
                 operations.append({
                     "region": "nose",
                     "type": "refine_tip",
-                    "factor": 1 - self.BEAUTY_RULES["nose"]["tip_refinement"],
+                    "factor": 1 - rules["nose"]["tip_refinement"],
                     "priority": 2
                 })
             
@@ -83,7 +131,7 @@ class BeautyRulesEngine:
                 operations.append({
                     "region": "nose",
                     "type": "refine_bridge",
-                    "factor": 1 - self.BEAUTY_RULES["nose"]["bridge_refinement"],
+                    "factor": 1 - rules["nose"]["bridge_refinement"],
                     "priority": 2
                 })
         elif nose_ratio < ideal_nose_ratio * 0.85:
@@ -92,13 +140,13 @@ class BeautyRulesEngine:
             operations.append({
                 "region": "nose",
                 "type": "refine_tip",
-                "factor": 1 - self.BEAUTY_RULES["nose"]["tip_refinement"] * 0.5,  # Half strength
+                "factor": 1 - rules["nose"]["tip_refinement"] * 0.5,  # Half strength
                 "priority": 2
             })
             operations.append({
                 "region": "nose",
                 "type": "refine_bridge",
-                "factor": 1 - self.BEAUTY_RULES["nose"]["bridge_refinement"] * 0.5,  # Half strength
+                "factor": 1 - rules["nose"]["bridge_refinement"] * 0.5,  # Half strength
                 "priority": 2
             })
         else:
@@ -107,13 +155,13 @@ class BeautyRulesEngine:
             operations.append({
                 "region": "nose",
                 "type": "refine_tip",
-                "factor": 1 - self.BEAUTY_RULES["nose"]["tip_refinement"] * 0.7,  # 70% strength
+                "factor": 1 - rules["nose"]["tip_refinement"] * 0.7,  # 70% strength
                 "priority": 2
             })
         
         # 3) Jaw asymmetry correction
         jaw_asymmetry = measurements.get("jaw_asymmetry", 0)
-        max_correction = self.BEAUTY_RULES["jaw"]["max_asymmetry_correction"]
+        max_correction = rules["jaw"]["max_asymmetry_correction"]
         
         if jaw_asymmetry > 1.0:  # Only correct if asymmetry > 1mm
             correction = min(jaw_asymmetry, max_correction)
@@ -140,7 +188,7 @@ class BeautyRulesEngine:
         # 5) Facial thirds adjustment
         facial_thirds = measurements.get("facial_thirds", {})
         if facial_thirds:
-            thirds_ops = self._analyze_facial_thirds(facial_thirds)
+            thirds_ops = self._analyze_facial_thirds(facial_thirds, rules)
             operations.extend(thirds_ops)
         
         # Sort by priority
@@ -148,10 +196,11 @@ class BeautyRulesEngine:
         
         return operations
     
-    def _analyze_facial_thirds(self, facial_thirds: Dict[str, float]) -> List[Dict[str, Any]]:
+    def _analyze_facial_thirds(self, facial_thirds: Dict[str, float],
+                               rules: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
         """Analyze facial thirds and suggest improvements"""
         operations = []
-        rules = self.BEAUTY_RULES["facial_thirds"]
+        rules = (rules or self.BEAUTY_RULES)["facial_thirds"]
         tolerance = rules["tolerance"]
         
         # Check each third
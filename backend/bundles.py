@@ -0,0 +1,92 @@
+import json
+import struct
+import uuid
+from typing import Any, List, Tuple
+
+try:
+    import orjson
+except ImportError:  # optional speedup
+    orjson = None
+
+DELIVERY_MODES = ("json", "multipart", "binary")
+
+BINARY_MAGIC = b"RHNV"
+BINARY_VERSION = 1
+BINARY_CONTENT_TYPE = "application/x-rhinovate-bundle"
+
+# (name, content type, body)
+Part = Tuple[str, str, bytes]
+
+
+def dumps_json(obj: Any) -> bytes:
+    """Serialize JSON-compatible data, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":")).encode()
+
+
+def parse_delivery(value: str) -> str:
+    if value not in DELIVERY_MODES:
+        raise ValueError(f"Unknown delivery '{value}', expected one of {list(DELIVERY_MODES)}")
+    return value
+
+
+def encode_multipart(parts: List[Part]) -> Tuple[bytes, str]:
+    """Build a multipart/mixed body; returns (body, content type)"""
+    boundary = uuid.uuid4().hex
+    chunks = []
+    for name, content_type, body in parts:
+        chunks.append(
+            f"--{boundary}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Disposition: inline; name=\"{name}\"\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n".encode()
+        )
+        chunks.append(body)
+        chunks.append(b"\r\n")
+    chunks.append(f"--{boundary}--\r\n".encode())
+    return b"".join(chunks), f"multipart/mixed; boundary={boundary}"
+
+
+def encode_binary(parts: List[Part]) -> Tuple[bytes, str]:
+    """Build a length-prefixed bundle; returns (body, content type).
+
+    Layout (big-endian): b"RHNV", u8 version, u8 part count, then per part
+    u16 name length, name, u16 content type length, content type,
+    u32 body length, body.
+    """
+    chunks = [BINARY_MAGIC, struct.pack(">BB", BINARY_VERSION, len(parts))]
+    for name, content_type, body in parts:
+        name_bytes = name.encode()
+        type_bytes = content_type.encode()
+        chunks.append(struct.pack(">H", len(name_bytes)) + name_bytes)
+        chunks.append(struct.pack(">H", len(type_bytes)) + type_bytes)
+        chunks.append(struct.pack(">I", len(body)))
+        chunks.append(body)
+    return b"".join(chunks), BINARY_CONTENT_TYPE
+
+
+def decode_binary(data: bytes) -> List[Part]:
+    """Inverse of encode_binary, for clients and tests"""
+    if data[:4] != BINARY_MAGIC:
+        raise ValueError("Not a Rhinovate bundle")
+    version, count = struct.unpack_from(">BB", data, 4)
+    if version != BINARY_VERSION:
+        raise ValueError(f"Unsupported bundle version {version}")
+    offset = 6
+    parts = []
+    for _ in range(count):
+        fields = []
+        for fmt in (">H", ">H", ">I"):
+            (length,) = struct.unpack_from(fmt, data, offset)
+            offset += struct.calcsize(fmt)
+            fields.append(data[offset:offset + length])
+            offset += length
+        parts.append((fields[0].decode(), fields[1].decode(), fields[2]))
+    return parts
+
+
+def encode_bundle(mode: str, parts: List[Part]) -> Tuple[bytes, str]:
+    if mode == "multipart":
+        return encode_multipart(parts)
+    return encode_binary(parts)
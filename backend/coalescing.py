@@ -0,0 +1,79 @@
+import asyncio
+import hashlib
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+import metrics
+
+COALESCE_REQUESTS = os.getenv("COALESCE_REQUESTS", "1") != "0"
+
+COALESCED_REQUESTS = metrics.REGISTRY.counter(
+    "rhinovate_coalesced_requests_total",
+    "Requests by single-flight role: leader computed the result, coalesced awaited an identical in-flight one",
+    ["route", "role"],
+)
+
+
+def request_key(data: bytes, *options: Any) -> str:
+    """Content hash of an upload together with every option that changes the result"""
+    digest = hashlib.sha256(data)
+    digest.update(repr(options).encode())
+    return digest.hexdigest()
+
+
+class SingleFlight:
+    """Runs one computation per key at a time; concurrent callers share its result.
+
+    The first caller for a key starts the work as its own task and every
+    caller, the first included, awaits it through a shield, so a disconnecting
+    client does not cancel the work its duplicates are waiting on; only when
+    every caller has gone is the work itself cancelled. Errors are shared the
+    same way. Keys are forgotten as soon as the work finishes: this collapses
+    retries and simultaneous uploads, it is not a cache.
+    """
+
+    def __init__(self, route: str):
+        self.route = route
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._waiters: Dict[asyncio.Task, int] = {}
+
+    async def run(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            COALESCED_REQUESTS.inc(route=self.route, role="leader")
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+            return await self._wait(key, task)
+
+        COALESCED_REQUESTS.inc(route=self.route, role="coalesced")
+        start = time.perf_counter()
+        try:
+            return await self._wait(key, task)
+        finally:
+            metrics.record_stage("coalesced_wait", time.perf_counter() - start)
+
+    async def _wait(self, key: str, task: asyncio.Task) -> Any:
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            self._waiters[task] -= 1
+            if not self._waiters[task]:
+                del self._waiters[task]
+                if not task.done():
+                    # Later duplicates start afresh rather than join abandoned work
+                    if self._inflight.get(key) is task:
+                        del self._inflight[key]
+                    task.cancel()
+
+    def _finished(self, key: str, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Retrieve the outcome so an error nobody awaited any more is not logged as lost
+        if not task.cancelled():
+            task.exception()
+
+    def __len__(self) -> int:
+        return len(self._inflight)
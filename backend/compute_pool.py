@@ -0,0 +1,340 @@
+import atexit
+import itertools
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from multiprocessing import shared_memory
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+import deadlines
+import execution
+import metrics
+from metrics import stage
+from morph import MorphGenerator
+
+# Opt-in: 0 keeps all analysis and rendering in the API process
+COMPUTE_WORKERS = int(os.getenv("COMPUTE_WORKERS", "0"))
+COMPUTE_SLOTS = int(os.getenv("COMPUTE_SLOTS", str(2 * COMPUTE_WORKERS)))
+COMPUTE_SLOT_MB = float(os.getenv("COMPUTE_SLOT_MB", "64"))
+COMPUTE_TIMEOUT = float(os.getenv("COMPUTE_TIMEOUT_SECONDS", "120"))
+
+
+POOL_FALLBACKS = metrics.REGISTRY.counter(
+    "rhinovate_compute_pool_fallbacks_total",
+    "Frames processed in the API process because they did not fit a shared-memory slot",
+    ["task"],
+)
+RETIRED_SLOTS = metrics.REGISTRY.gauge(
+    "rhinovate_compute_slots_retired",
+    "Shared-memory slots held back because their caller timed out before the worker replied",
+)
+
+
+def _slot_frame(shm: shared_memory.SharedMemory, shape: Tuple[int, ...], offset: int = 0) -> np.ndarray:
+    """uint8 frame view over a slot's buffer, by default at its start"""
+    return np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=offset)
+
+
+def _slot_frames(shm: shared_memory.SharedMemory, shapes: List[Tuple[int, ...]]) -> List[np.ndarray]:
+    """Views of frames stored back to back from the start of a slot"""
+    frames, offset = [], 0
+    for shape in shapes:
+        frames.append(_slot_frame(shm, shape, offset))
+        offset += int(np.prod(shape))
+    return frames
+
+
+def _write_frames(shm: shared_memory.SharedMemory, frame: np.ndarray, outputs: List[np.ndarray]) -> List[Tuple[int, ...]]:
+    """Store `outputs` back to back over the slot's input `frame` and return their shapes"""
+    if sum(output.nbytes for output in outputs) > shm.size:
+        raise ValueError("Outputs do not fit the compute slot")
+    # A plan without operations returns its input, which the first output would overwrite
+    outputs = [output.copy() if np.shares_memory(output, frame) else output for output in outputs]
+    shapes = [output.shape for output in outputs]
+    for view, output in zip(_slot_frames(shm, shapes), outputs):
+        view[...] = output
+    return shapes
+
+
+class _SlotDeadline(deadlines.Deadline):
+    """The caller's deadline mirrored into a worker, which also stops once the caller flags the task's slot"""
+
+    def __init__(self, timeout: Optional[float], cancel_flags, slot_id: int):
+        super().__init__(timeout)
+        self._cancel_flags = cancel_flags
+        self._slot_id = slot_id
+
+    def poll(self) -> Optional[str]:
+        flag = self._cancel_flags[self._slot_id]
+        return deadlines.REASONS[flag - 1] if flag else None
+
+
+def _worker_main(slot_names: List[str], cancel_flags, tasks, results, plan: execution.ExecutionPlan) -> None:
+    """Worker process loop: run analysis and renders on frames that live in shared slots"""
+    # Each worker gets its share of the cores before any library spins up threads
+    execution.apply(plan)
+    # Imported here so the API process does not pay for a second FaceMesh graph
+    from face_analysis import FaceAnalyzer
+    from image_processor import ImageProcessor
+
+    slots = [shared_memory.SharedMemory(name=name) for name in slot_names]
+    analyzer = FaceAnalyzer()
+    processor = ImageProcessor(encode_threads=plan.library_threads)
+    morpher = MorphGenerator(processor)
+    parent = os.getppid()
+
+    while True:
+        try:
+            task = tasks.get(timeout=1.0)
+        except queue.Empty:
+            # Exit with the API process even if it died without sending a sentinel
+            if os.getppid() != parent:
+                break
+            continue
+        if task is None:
+            break
+        task_id, kind, slot_id, shape, kwargs, timeout = task
+        frame = None
+
+        # Stage timings are collected here and replayed into the caller's request
+        timings = metrics.RequestTimings()
+        token = metrics.bind_timings(timings)
+        # The caller's remaining time comes along, so the worker stops at the same checkpoints,
+        # and so does a cancel the caller raises while it waits
+        deadline_token = deadlines.bind_deadline(_SlotDeadline(timeout, cancel_flags, slot_id))
+        try:
+            frame = _slot_frame(slots[slot_id], shape)
+            outputs: List[np.ndarray] = []
+            if kind == "analyze":
+                result = analyzer.analyze_image(frame, **kwargs)
+            elif kind == "render":
+                result, outputs = None, [processor.render(frame, **kwargs)]
+            elif kind == "render_many":
+                rendered = processor.render_many(frame, **kwargs)
+                result, outputs = list(rendered), list(rendered.values())
+            else:
+                # An encoded animation is a few megabytes at most and goes back through the queue
+                result = morpher.generate(frame, **kwargs)
+            # The input is no longer needed, so the outputs overwrite it in place
+            out_shapes = _write_frames(slots[slot_id], frame, outputs)
+            results.put((task_id, True, result, out_shapes, timings.stages))
+        except deadlines.Cancelled as e:
+            results.put((task_id, False, e, [], timings.stages))
+        except Exception as e:
+            results.put((task_id, False, f"{type(e).__name__}: {e}", [], timings.stages))
+        finally:
+            deadlines.unbind_deadline(deadline_token)
+            metrics.unbind_timings(token)
+            # Drop the view so the slot can be closed on shutdown
+            frame = None
+
+    for shm in slots:
+        shm.close()
+
+
+class ComputePool:
+    """Worker processes fed through a ring of reusable shared-memory frame slots.
+
+    The API process copies a decoded frame into a free slot; the worker runs
+    FaceAnalyzer, ImageProcessor or MorphGenerator on it in place, and
+    rendered frames are written back into the same slot. Only the slot ID,
+    shapes, operations and small results such as landmarks, measurements and
+    encoded animations cross the process queues. Work whose frames do not fit
+    a slot is processed locally by the fallback objects.
+    """
+
+    def __init__(self, workers: int, slots: int, slot_bytes: int, analyzer, processor,
+                 timeout: float = COMPUTE_TIMEOUT, plan: Optional[execution.ExecutionPlan] = None):
+        self.slot_bytes = slot_bytes
+        self.timeout = timeout
+        self.analyzer = analyzer
+        self.processor = processor
+        self.morpher = MorphGenerator(processor)
+
+        self._slots = [shared_memory.SharedMemory(create=True, size=slot_bytes) for _ in range(max(1, slots))]
+        self._free: "queue.Queue[int]" = queue.Queue()
+        for slot_id in range(len(self._slots)):
+            self._free.put(slot_id)
+
+        # mediapipe graphs are not fork-safe, so workers start from a clean interpreter
+        ctx = mp.get_context("spawn")
+        # One byte per slot: the index in deadlines.REASONS plus one once the waiting caller abandons the task
+        self._cancel_flags = ctx.RawArray("b", len(self._slots))
+        self._tasks = ctx.Queue()
+        self._results = ctx.Queue()
+        self._pending: Dict[int, Future] = {}
+        # Slots of tasks whose caller stopped waiting, freed when the worker's late reply arrives
+        self._retired: Dict[int, int] = {}
+        self._pending_lock = threading.Lock()
+        self._ids = itertools.count()
+        plan = plan or execution.plan_execution(request_workers=workers)
+        self._processes = [
+            ctx.Process(target=_worker_main, args=([shm.name for shm in self._slots], self._cancel_flags, self._tasks, self._results, plan),
+                        name=f"compute-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for process in self._processes:
+            process.start()
+
+        self._collector = threading.Thread(target=self._collect, name="compute-results", daemon=True)
+        self._collector.start()
+        self._closed = False
+        atexit.register(self.close)
+
+    def analyze_image(self, image: np.ndarray, full_shape: Optional[Tuple[int, ...]] = None,
+                      model: Optional[str] = None) -> Tuple[Optional[np.ndarray], Dict]:
+        """FaceAnalyzer.analyze_image in a worker process"""
+        if image.nbytes > self.slot_bytes:
+            POOL_FALLBACKS.inc(task="analyze")
+            return self.analyzer.analyze_image(image, full_shape, model)
+        result, _ = self._run("analyze", image, {"full_shape": full_shape, "model": model})
+        return result
+
+    def render(self, image: np.ndarray, operations: List[Dict[str, Any]], quality: str = "standard",
+               plan_shape: Optional[Tuple[int, ...]] = None) -> np.ndarray:
+        """ImageProcessor.render in a worker process"""
+        if image.nbytes > self.slot_bytes:
+            POOL_FALLBACKS.inc(task="render")
+            return self.processor.render(image, operations, quality, plan_shape)
+        _, (rendered,) = self._run("render", image, {"operations": operations, "quality": quality, "plan_shape": plan_shape})
+        return rendered
+
+    def render_many(self, image: np.ndarray, plans: Dict[str, List[Dict[str, Any]]], quality: str = "standard",
+                    plan_shape: Optional[Tuple[int, ...]] = None) -> Dict[str, np.ndarray]:
+        """ImageProcessor.render_many in a worker process; every result must fit the slot with the others"""
+        if image.nbytes * max(1, len(plans)) > self.slot_bytes:
+            POOL_FALLBACKS.inc(task="render_many")
+            return self.processor.render_many(image, plans, quality, plan_shape)
+        names, rendered = self._run("render_many", image, {"plans": plans, "quality": quality, "plan_shape": plan_shape})
+        return dict(zip(names, rendered))
+
+    def morph(self, image: np.ndarray, operations: List[Dict[str, Any]], fmt: str = "gif", frames: int = 30,
+              fps: int = 15, plan_shape: Optional[Tuple[int, ...]] = None) -> bytes:
+        """MorphGenerator.generate in a worker process"""
+        if image.nbytes > self.slot_bytes:
+            POOL_FALLBACKS.inc(task="morph")
+            return self.morpher.generate(image, operations, fmt, frames, fps, plan_shape)
+        data, _ = self._run("morph", image, {"operations": operations, "fmt": fmt, "frames": frames, "fps": fps,
+                                              "plan_shape": plan_shape})
+        return data
+
+    def _acquire(self) -> int:
+        with stage("slot_wait"):
+            try:
+                return self._free.get(timeout=self.timeout)
+            except queue.Empty:
+                raise TimeoutError("No free compute slot")
+
+    def _run(self, kind: str, image: np.ndarray, kwargs: Dict[str, Any]) -> Tuple[Any, List[np.ndarray]]:
+        """Run a task on `image` in a worker; return its result and copies of the frames it wrote.
+
+        A slot belongs to its task until the worker replies. If the caller
+        stops waiting first, the slot is retired rather than freed, and the
+        collector frees it when the late reply arrives, so the worker never
+        writes into a slot that another request is using.
+        """
+        slot_id: Optional[int] = self._acquire()
+        task_id = next(self._ids)
+        future: Future = Future()
+        try:
+            _slot_frame(self._slots[slot_id], image.shape)[...] = image
+            self._cancel_flags[slot_id] = 0
+            with self._pending_lock:
+                self._pending[task_id] = future
+            self._tasks.put((task_id, kind, slot_id, tuple(image.shape), kwargs, deadlines.remaining()))
+            try:
+                ok, result, out_shapes, stages = self._wait(future, slot_id)
+            except FutureTimeoutError:
+                with self._pending_lock:
+                    if self._pending.pop(task_id, None) is not None:
+                        self._retired[task_id] = slot_id
+                        slot_id = None
+                if slot_id is None:
+                    RETIRED_SLOTS.inc()
+                    raise TimeoutError(f"Compute worker did not reply within {self.timeout:.0f}s")
+                # The reply arrived as the wait ran out
+                ok, result, out_shapes, stages = future.result()
+            # Copy out before the slot is reused; encoding happens after release
+            outputs = [view.copy() for view in _slot_frames(self._slots[slot_id], out_shapes)] if ok else []
+        finally:
+            with self._pending_lock:
+                self._pending.pop(task_id, None)
+            if slot_id is not None:
+                self._free.put(slot_id)
+
+        for name, seconds in stages:
+            metrics.record_stage(name, seconds)
+        if isinstance(result, deadlines.Cancelled):
+            deadlines.expire(result.reason, result.stage)
+        if not ok:
+            raise RuntimeError(f"Compute worker failed: {result}")
+        return result, outputs
+
+    def _wait(self, future: Future, slot_id: int):
+        """The worker's reply, flagging the slot once the request is abandoned so the worker stops too.
+
+        The worker answers a flagged task with Cancelled at its next
+        checkpoint, so the slot is still freed by that reply.
+        """
+        deadline = deadlines.current()
+        give_up = time.monotonic() + self.timeout
+        while True:
+            left = give_up - time.monotonic()
+            try:
+                return future.result(timeout=max(0.0, min(left, deadlines.CANCEL_POLL_SECONDS) if deadline else left))
+            except FutureTimeoutError:
+                if time.monotonic() >= give_up:
+                    raise
+                if not self._cancel_flags[slot_id] and deadlines.abandoned(deadline):
+                    self._cancel_flags[slot_id] = deadlines.REASONS.index(deadline.reason) + 1
+
+    def _collect(self) -> None:
+        while True:
+            try:
+                message = self._results.get()
+            except (EOFError, OSError):
+                return
+            if message is None:
+                return
+            task_id, ok, result, out_shapes, stages = message
+            with self._pending_lock:
+                future = self._pending.pop(task_id, None)
+                retired = self._retired.pop(task_id, None)
+            if future is not None:
+                future.set_result((ok, result, out_shapes, stages))
+            elif retired is not None:
+                RETIRED_SLOTS.dec()
+                self._free.put(retired)
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        for _ in self._processes:
+            self._tasks.put(None)
+        for process in self._processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self._results.put(None)
+        self._collector.join(timeout=5)
+        for q in (self._tasks, self._results):
+            q.close()
+            q.join_thread()
+        for shm in self._slots:
+            shm.close()
+            shm.unlink()
+
+
+def pool_from_env(analyzer, processor,
+                  plan: Optional[execution.ExecutionPlan] = None) -> Optional[ComputePool]:
+    """Start the worker pool configured by COMPUTE_* environment variables, if any"""
+    if COMPUTE_WORKERS <= 0:
+        return None
+    return ComputePool(COMPUTE_WORKERS, COMPUTE_SLOTS, int(COMPUTE_SLOT_MB * 1024 * 1024), analyzer, processor,
+                       plan=plan)
@@ -0,0 +1,257 @@
+import asyncio
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Awaitable, Optional
+
+from starlette.responses import JSONResponse
+
+import metrics
+
+# Server-side limit on a request's work; X-Request-Timeout can only shorten it. 0 means no limit
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "60"))
+# How often a waiting handler looks for an expired or cancelled deadline
+CANCEL_POLL_SECONDS = float(os.getenv("CANCEL_POLL_SECONDS", "0.1"))
+
+# Why work is abandoned: the deadline passed, the client went away, or every caller sharing it did
+REASONS = ("deadline", "disconnect", "abandoned")
+
+# nginx's "client closed request"; nobody reads it, but access logs and metrics do
+CLIENT_CLOSED_REQUEST = 499
+
+CANCELLED_WORK = metrics.REGISTRY.counter(
+    "rhinovate_cancelled_work_total",
+    "Work abandoned by reason (deadline, disconnect, or abandoned by every caller sharing it) and the stage it was about to start",
+    ["reason", "stage"],
+)
+CANCELLED_SECONDS = metrics.REGISTRY.counter(
+    "rhinovate_cancelled_work_seconds_total",
+    "Seconds from the start of a request until its work was abandoned",
+    ["reason"],
+)
+
+
+class Cancelled(Exception):
+    """The request's work was abandoned at a checkpoint"""
+
+    def __init__(self, reason: str, stage: str):
+        # Both arguments go to Exception so the error pickles across worker processes
+        super().__init__(reason, stage)
+        self.reason = reason
+        self.stage = stage
+
+    @property
+    def status_code(self) -> int:
+        return 504 if self.reason == "deadline" else CLIENT_CLOSED_REQUEST
+
+    def __str__(self) -> str:
+        if self.reason == "deadline":
+            return f"Request deadline exceeded before {self.stage}"
+        return f"Client disconnected before {self.stage}"
+
+
+class Deadline:
+    """When a request's work stops being worth doing.
+
+    Work calls check() between stages; once the deadline has passed or
+    cancel() was called (the client went away), the next check raises
+    Cancelled. The object is shared by reference with the pipeline threads
+    that inherit the request's context, so a cancel from the event loop is
+    seen by work already running.
+    """
+
+    def __init__(self, timeout: Optional[float] = None):
+        self.started = time.monotonic()
+        self.expires = self.started + timeout if timeout is not None else None
+        self.reason: Optional[str] = None
+        # The last checkpoint passed, reported when the work is abandoned from outside
+        self.stage = "queued"
+        self._counted = False
+        self._lock = threading.Lock()
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left, or None without a time limit"""
+        return None if self.expires is None else self.expires - time.monotonic()
+
+    def poll(self) -> Optional[str]:
+        """Reason the work was abandoned somewhere this object cannot see, e.g. by the process that sent it.
+
+        Deadlines mirrored into a worker override this; check() calls it.
+        """
+        return None
+
+    def cancel(self, reason: str) -> None:
+        """Abandon the work at its next checkpoint; the first reason given is kept"""
+        if self.reason is None:
+            self.reason = reason
+
+    def check(self, stage: Optional[str] = None) -> None:
+        """Raise Cancelled if the work should stop, else note `stage` as the one starting"""
+        if self.reason is None and self.expires is not None and time.monotonic() >= self.expires:
+            self.cancel("deadline")
+        if self.reason is None:
+            reason = self.poll()
+            if reason is not None:
+                self.cancel(reason)
+        if self.reason is None:
+            if stage is not None:
+                self.stage = stage
+            return
+        stage = stage or self.stage
+        with self._lock:
+            first, self._counted = not self._counted, True
+        if first:
+            CANCELLED_WORK.inc(reason=self.reason, stage=stage)
+            CANCELLED_SECONDS.inc(time.monotonic() - self.started, reason=self.reason)
+        raise Cancelled(self.reason, stage)
+
+
+def from_header(value: Optional[str]) -> Deadline:
+    """The deadline for a request from its X-Request-Timeout (seconds) and the server limit"""
+    timeout = REQUEST_DEADLINE_SECONDS or None
+    if value:
+        try:
+            requested = float(value)
+        except ValueError:
+            raise ValueError(f"Invalid X-Request-Timeout '{value}', expected seconds")
+        if not requested > 0:
+            raise ValueError("X-Request-Timeout must be positive")
+        timeout = min(requested, timeout) if timeout else requested
+    return Deadline(timeout)
+
+
+def abandoned(deadline: Optional[Deadline]) -> bool:
+    """Whether `deadline` has been cancelled or has passed, without raising or counting it"""
+    if deadline is None:
+        return False
+    if deadline.reason is None and deadline.expires is not None and time.monotonic() >= deadline.expires:
+        deadline.cancel("deadline")
+    return deadline.reason is not None
+
+
+_current_deadline: ContextVar[Optional[Deadline]] = ContextVar("request_deadline", default=None)
+
+
+def bind_deadline(deadline: Deadline):
+    """Make `deadline` the one checked by work in this context"""
+    return _current_deadline.set(deadline)
+
+
+def unbind_deadline(token) -> None:
+    _current_deadline.reset(token)
+
+
+def current() -> Optional[Deadline]:
+    return _current_deadline.get()
+
+
+def check(stage: str) -> None:
+    """Checkpoint before `stage`: raise Cancelled if the current request's work should stop"""
+    deadline = _current_deadline.get()
+    if deadline is not None:
+        deadline.check(stage)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left for the current request, for handing its deadline to a worker"""
+    deadline = _current_deadline.get()
+    return None if deadline is None else deadline.remaining()
+
+
+def expire(reason: str, stage: str) -> None:
+    """Abandon the current request because a worker gave up on its work at `stage`"""
+    deadline = _current_deadline.get()
+    if deadline is None:
+        raise Cancelled(reason, stage)
+    deadline.cancel(reason)
+    deadline.check(stage)
+
+
+async def _watch(deadline: Deadline) -> None:
+    """Return once `deadline` is cancelled or expires"""
+    while deadline.reason is None:
+        left = deadline.remaining()
+        if left is not None and left <= 0:
+            deadline.cancel("deadline")
+            return
+        await asyncio.sleep(CANCEL_POLL_SECONDS if left is None else min(CANCEL_POLL_SECONDS, left))
+
+
+async def until_abandoned(work: Awaitable[Any]) -> Any:
+    """Await a request's `work`, abandoning it when the deadline passes or the client disconnects.
+
+    Queued work is withdrawn at once; running work stops at its next
+    checkpoint. Either way this raises Cancelled right away rather than
+    waiting for the threads to notice.
+    """
+    deadline = _current_deadline.get()
+    if deadline is None:
+        return await work
+    task = asyncio.ensure_future(work)
+    watcher = asyncio.ensure_future(_watch(deadline))
+    try:
+        await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+        if not task.done():
+            deadline.check()
+        return task.result()
+    finally:
+        watcher.cancel()
+        if not task.done():
+            task.cancel()
+
+
+class DeadlineMiddleware:
+    """Bind each request's Deadline and cancel it when the client disconnects.
+
+    A disconnect only arrives as a message from `receive`, which nothing
+    reads once the body has been consumed, so a reader task owns `receive`
+    for the whole request. It hands body messages on one at a time, so the
+    body still streams through upload limits, and then waits for the
+    disconnect. X-Request-Timeout (seconds) can shorten the server's limit.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            deadline = from_header(dict(scope["headers"]).get(b"x-request-timeout", b"").decode() or None)
+        except ValueError as e:
+            response = JSONResponse({"detail": str(e)}, status_code=400)
+            await response(scope, receive, send)
+            return
+
+        messages: "asyncio.Queue[dict]" = asyncio.Queue(maxsize=1)
+        disconnected = asyncio.Event()
+
+        async def read():
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    deadline.cancel("disconnect")
+                    disconnected.set()
+                    return
+                await messages.put(message)
+
+        async def next_message():
+            getter = asyncio.ensure_future(messages.get())
+            gone = asyncio.ensure_future(disconnected.wait())
+            await asyncio.wait({getter, gone}, return_when=asyncio.FIRST_COMPLETED)
+            gone.cancel()
+            if getter.done():
+                return getter.result()
+            getter.cancel()
+            return {"type": "http.disconnect"}
+
+        reader = asyncio.ensure_future(read())
+        token = bind_deadline(deadline)
+        try:
+            await self.app(scope, next_message, send)
+        finally:
+            unbind_deadline(token)
+            reader.cancel()
@@ -0,0 +1,131 @@
+import io
+import os
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image
+
+# Longest side the face mesh needs; landmarks are normalized, so measurements
+# are still taken against the full-resolution shape
+ANALYZE_MAX_SIDE = int(os.getenv("ANALYZE_MAX_SIDE", "1280"))
+
+EXIF_ORIENTATION = 0x0112
+
+# DCT-domain downscale factors libjpeg can decode directly
+_REDUCED_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+
+@dataclass
+class ImageHeader:
+    """What an encoded image is, read without decoding its pixels"""
+    format: str        # Pillow format name, e.g. "JPEG", "PNG", "WEBP"
+    width: int         # displayed size, after EXIF orientation
+    height: int
+    orientation: int   # EXIF orientation tag (1 = upright)
+
+    @property
+    def shape(self) -> Tuple[int, int, int]:
+        """Shape of the fully decoded, upright BGR frame"""
+        return (self.height, self.width, 3)
+
+
+class TooManyPixels(ValueError):
+    """Pillow refused to open an image as a decompression bomb"""
+
+
+def read_header(data: bytes) -> Optional[ImageHeader]:
+    """Parse format, size and EXIF orientation, or None if Pillow cannot identify the image.
+
+    Pillow's decompression-bomb guard stays on (Image.MAX_IMAGE_PIXELS); an
+    image past it raises TooManyPixels rather than passing as unreadable.
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            width, height = img.size
+            orientation = _exif(img).get(EXIF_ORIENTATION, 1)
+            # Camera JPEGs with embedded previews identify as MPO
+            image_format = "JPEG" if img.format == "MPO" else (img.format or "")
+    except Image.DecompressionBombError as e:
+        raise TooManyPixels(str(e))
+    except Exception:
+        return None
+    if orientation not in range(1, 9):
+        orientation = 1
+    if orientation >= 5:
+        # Orientations 5-8 transpose the stored pixels
+        width, height = height, width
+    return ImageHeader(image_format, width, height, orientation)
+
+
+def _exif(img: Image.Image) -> Image.Exif:
+    """EXIF tags found while parsing the header"""
+    if img.format in ("JPEG", "MPO"):
+        return img.getexif()
+    # PNG's getexif() decodes the whole image to look for trailing chunks
+    exif = Image.Exif()
+    if img.info.get("exif"):
+        exif.load(img.info["exif"])
+    return exif
+
+
+def decode(data: bytes, max_side: Optional[int] = None,
+           header: Optional[ImageHeader] = None) -> Optional[np.ndarray]:
+    """Decode an upright BGR frame whose longest side is at least `max_side` where possible.
+
+    JPEGs are decoded at 1/2, 1/4 or 1/8 scale in the DCT domain when that
+    still covers `max_side`; None decodes at full resolution. Callers that
+    need an exact size resize the result. EXIF orientation is applied here,
+    once, so later stages always see an upright frame.
+    """
+    if header is None:
+        header = read_header(data)
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    if header is None:
+        # Unknown to Pillow; let OpenCV decode and orient it
+        return cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+
+    flags = cv2.IMREAD_COLOR
+    if max_side is not None and header.format == "JPEG":
+        longest = max(header.width, header.height)
+        for factor, reduced in _REDUCED_FLAGS:
+            if -(-longest // factor) >= max_side:
+                flags = reduced
+                break
+
+    image = cv2.imdecode(buffer, flags | cv2.IMREAD_IGNORE_ORIENTATION)
+    if image is None:
+        return None
+    return apply_orientation(image, header.orientation)
+
+
+def apply_orientation(image: np.ndarray, orientation: int) -> np.ndarray:
+    """Rotate/flip stored pixels so the frame displays upright"""
+    if orientation == 2:
+        return cv2.flip(image, 1)
+    if orientation == 3:
+        return cv2.rotate(image, cv2.ROTATE_180)
+    if orientation == 4:
+        return cv2.flip(image, 0)
+    if orientation == 5:
+        return cv2.transpose(image)
+    if orientation == 6:
+        return cv2.rotate(image, cv2.ROTATE_90_CLOCKWISE)
+    if orientation == 7:
+        return cv2.rotate(cv2.transpose(image), cv2.ROTATE_180)
+    if orientation == 8:
+        return cv2.rotate(image, cv2.ROTATE_90_COUNTERCLOCKWISE)
+    return image
+
+
+def read_file(path: str) -> Optional[bytes]:
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except OSError:
+        return None
@@ -0,0 +1,110 @@
+import os
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+import cv2
+import numpy as np
+
+import metrics
+
+OFF = 0
+BASIC = 1
+FULL = 2
+
+LEVELS = {"off": OFF, "basic": BASIC, "full": FULL}
+
+# A pixel counts as changed when any channel moves by more than this
+CHANGE_THRESHOLD = 10
+
+OPERATION_OUTCOMES = metrics.REGISTRY.counter(
+    "rhinovate_render_operations_total",
+    "Render operations by outcome, recorded when diagnostics are enabled",
+    ["operation", "outcome"],
+)
+
+
+def parse_level(value: Optional[str], default: int = OFF) -> int:
+    """Convert a level name ("off", "basic", "full") to its numeric level"""
+    if value is None or value == "":
+        return default
+    level = LEVELS.get(str(value).lower())
+    if level is None:
+        raise ValueError(f"Unknown diagnostics level '{value}', expected one of {sorted(LEVELS)}")
+    return level
+
+
+DEFAULT_LEVEL = parse_level(os.getenv("DIAGNOSTICS_LEVEL"), OFF)
+
+
+class RenderDiagnostics:
+    """Per-request pixel-change statistics for each render operation.
+
+    BASIC records whether each operation changed the frame and how many pixels
+    moved; FULL adds mean/max absolute difference and the bounding box of the change.
+    """
+
+    def __init__(self, level: int = DEFAULT_LEVEL):
+        self.level = level
+        self.operations: List[Dict[str, Any]] = []
+        self.total: Optional[Dict[str, Any]] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.level > OFF
+
+    def record_operation(self, operation: Dict[str, Any], before: np.ndarray, after: np.ndarray,
+                         known: bool = True) -> None:
+        name = f"{operation.get('region')}_{operation.get('type')}"
+        if not known:
+            entry = {"operation": name, "outcome": "unknown"}
+        elif after is before:
+            entry = {"operation": name, "outcome": "skipped", "changed_pixels": 0}
+        else:
+            entry = {"operation": name, **self._compare(before, after)}
+            entry["outcome"] = "changed" if entry["changed_pixels"] else "unchanged"
+        self.operations.append(entry)
+        OPERATION_OUTCOMES.inc(operation=name, outcome=entry["outcome"])
+
+    def record_total(self, original: np.ndarray, final: np.ndarray) -> None:
+        self.total = self._compare(original, final)
+        self.total["total_pixels"] = int(original.shape[0] * original.shape[1])
+        if self.total["changed_pixels"] < 100:
+            self.total["warning"] = "Very few pixels changed - operations may not be working"
+
+    def _compare(self, before: np.ndarray, after: np.ndarray) -> Dict[str, Any]:
+        # Single uint8 temporary; the channel max keeps counts in pixels, not samples
+        diff = cv2.absdiff(before, after)
+        peak = diff.max(axis=2) if diff.ndim == 3 else diff
+        changed = peak > CHANGE_THRESHOLD
+        stats: Dict[str, Any] = {"changed_pixels": int(np.count_nonzero(changed))}
+        if self.level >= FULL:
+            stats["mean_abs_diff"] = float(diff.mean())
+            stats["max_abs_diff"] = int(peak.max()) if peak.size else 0
+            if stats["changed_pixels"]:
+                x, y, w, h = cv2.boundingRect(changed.astype(np.uint8))
+                stats["changed_bbox"] = [int(x), int(y), int(w), int(h)]
+        return stats
+
+    def to_dict(self) -> Dict[str, Any]:
+        level_name = next(name for name, value in LEVELS.items() if value == self.level)
+        return {"level": level_name, "operations": self.operations, "total": self.total}
+
+
+_current_diagnostics: ContextVar[Optional[RenderDiagnostics]] = ContextVar("render_diagnostics", default=None)
+
+
+def bind_diagnostics(report: RenderDiagnostics):
+    """Make `report` the diagnostics collector for renders in this context"""
+    return _current_diagnostics.set(report)
+
+
+def unbind_diagnostics(token) -> None:
+    _current_diagnostics.reset(token)
+
+
+def current() -> Optional[RenderDiagnostics]:
+    """Return the active collector, or None when diagnostics are off"""
+    report = _current_diagnostics.get()
+    if report is None or not report.enabled:
+        return None
+    return report
@@ -0,0 +1,150 @@
+import asyncio
+import contextvars
+import functools
+import logging
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+import cv2
+
+import metrics
+
+try:
+    import threadpoolctl
+except ImportError:  # listed in requirements.txt; without it BLAS keeps its own thread count here
+    threadpoolctl = None
+
+logger = logging.getLogger(__name__)
+
+# How the cores are split between concurrent requests and the libraries inside each one
+LAYOUTS = ("latency", "balanced", "throughput")
+EXECUTION_LAYOUT = os.getenv("EXECUTION_LAYOUT", "balanced")
+
+BLAS_ENV_VARS = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS")
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def cgroup_cpu_limit() -> Optional[float]:
+    """CPUs allowed by the container's cgroup quota, or None when unlimited"""
+    # cgroup v2: "<quota> <period>" or "max <period>"
+    cpu_max = _read("/sys/fs/cgroup/cpu.max")
+    if cpu_max:
+        quota, _, period = cpu_max.partition(" ")
+        if quota != "max" and period:
+            return int(quota) / int(period)
+        return None
+    # cgroup v1: quota of -1 means unlimited
+    for base in ("/sys/fs/cgroup/cpu", "/sys/fs/cgroup/cpu,cpuacct"):
+        quota, period = _read(f"{base}/cpu.cfs_quota_us"), _read(f"{base}/cpu.cfs_period_us")
+        if quota and period and int(quota) > 0:
+            return int(quota) / int(period)
+    return None
+
+
+def available_cores() -> int:
+    """Cores this process may actually use: CPU affinity capped by any cgroup quota"""
+    override = os.getenv("CPU_CORES")
+    if override:
+        return max(1, int(override))
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:  # not available on macOS
+        cores = os.cpu_count() or 1
+    limit = cgroup_cpu_limit()
+    if limit is not None:
+        cores = min(cores, math.ceil(limit))
+    return max(1, cores)
+
+
+@dataclass(frozen=True)
+class ExecutionPlan:
+    """A split of the available cores that never runs more threads than cores"""
+    cores: int
+    layout: str
+    request_workers: int   # requests processed at once (pipeline threads or compute processes)
+    library_threads: int   # OpenCV/BLAS threads used inside one request
+    fanout_threads: int    # shared pool for per-request fan-out such as variant encodes and morph frames
+
+
+def plan_execution(cores: Optional[int] = None, layout: str = EXECUTION_LAYOUT,
+                   request_workers: Optional[int] = None) -> ExecutionPlan:
+    """Split `cores` between concurrent requests and per-library threads.
+
+    latency: one request at a time with every core inside it.
+    throughput: one request per core, each single-threaded.
+    balanced: half as many requests as cores, two threads each.
+    An explicit `request_workers` (e.g. COMPUTE_WORKERS processes) overrides
+    the layout's count and the cores are divided between those workers.
+    """
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unknown execution layout '{layout}', expected one of {list(LAYOUTS)}")
+    cores = cores or available_cores()
+    if request_workers is None:
+        request_workers = {"latency": 1, "balanced": max(1, cores // 2), "throughput": cores}[layout]
+    request_workers = max(1, request_workers)
+    library_threads = max(1, cores // request_workers)
+    return ExecutionPlan(cores, layout, request_workers, library_threads, cores)
+
+
+def plan_from_env(compute_workers: int = 0) -> ExecutionPlan:
+    """The plan for this deployment; PIPELINE_WORKERS and LIBRARY_THREADS override its parts"""
+    workers = os.getenv("PIPELINE_WORKERS")
+    plan = plan_execution(request_workers=compute_workers or (int(workers) if workers else None))
+    threads = os.getenv("LIBRARY_THREADS")
+    if threads:
+        plan = ExecutionPlan(plan.cores, plan.layout, plan.request_workers, max(1, int(threads)),
+                             plan.fanout_threads)
+    return plan
+
+
+def apply(plan: ExecutionPlan) -> None:
+    """Limit this process's library thread pools to the plan.
+
+    MediaPipe's Python API does not expose its thread count; FaceAnalyzer
+    serializes calls to each graph instead, so at most one mesh per graph runs
+    in a process.
+    """
+    cv2.setNumThreads(plan.library_threads)
+    # BLAS/OpenMP read these only when they load, and numpy is already loaded
+    # here, so they only reach spawned workers; this process needs threadpoolctl
+    for name in BLAS_ENV_VARS:
+        os.environ[name] = str(plan.library_threads)
+    if threadpoolctl is None:
+        logger.warning("threadpoolctl is not installed; BLAS threads in this process are not limited "
+                       "to %d", plan.library_threads)
+        return
+    threadpoolctl.threadpool_limits(plan.library_threads)
+
+
+class PipelineExecutor:
+    """Bounded thread pool for the blocking stages of request handlers.
+
+    Handlers await run(); at most `workers` pipelines execute at once and the
+    rest queue here, so concurrency stays within the execution plan. The
+    caller's context (request timings, diagnostics) is carried into the thread.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pipeline")
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        context = contextvars.copy_context()
+        submitted = time.perf_counter()
+
+        def call():
+            metrics.record_stage("queue_wait", time.perf_counter() - submitted)
+            return fn(*args, **kwargs)
+
+        return await asyncio.get_running_loop().run_in_executor(self.pool, functools.partial(context.run, call))
@@ -1,30 +1,118 @@
 import cv2
 import mediapipe as mp
 import numpy as np
-from typing import Tuple, Dict, Optional
+from typing import Iterable, List, Tuple, Dict, Optional
 import math
+import os
+import threading
+
+import deadlines
+import decoding
+from metrics import stage
+
+# Face mesh graphs by name: whether the attention model refining eyes, lips and irises runs
+MESH_MODELS = {"base": False, "refined": True}
+# The refined graph adds ten iris landmarks (468-477)
+LANDMARK_COUNTS = {"base": 468, "refined": 478}
+
+MEASUREMENTS = ("symmetry_score", "facial_thirds", "nose_to_ipd_ratio", "chin_projection",
+                "jaw_asymmetry", "nose_width", "ipd", "iris_ipd")
+# Measurements that read iris landmarks; only these need the refined graph.
+# The planner's IPD is taken between eye-contour centroids, so it does not.
+IRIS_MEASUREMENTS = frozenset({"iris_ipd"})
+# Graph for requests that do not say which measurements they need. The two
+# graphs are different networks and place the shared landmarks differently
+# enough to change plans, so the default stays on the graph the rules were tuned on.
+FACE_MESH_MODEL = os.getenv("FACE_MESH_MODEL", "refined")
+if FACE_MESH_MODEL != "auto" and FACE_MESH_MODEL not in MESH_MODELS:
+    raise ValueError(f"Unknown FACE_MESH_MODEL '{FACE_MESH_MODEL}', expected one of {[*MESH_MODELS, 'auto']}")
+
+def parse_measurements(value: Optional[str]) -> Optional[List[str]]:
+    """Parse "ipd,facial_thirds" into measurement names; empty means the request did not say"""
+    if not value:
+        return None
+    names = list(dict.fromkeys(name.strip() for name in value.split(",") if name.strip()))
+    unknown = [name for name in names if name not in MEASUREMENTS]
+    if unknown:
+        raise ValueError(f"Unknown measurements {unknown}, expected some of {list(MEASUREMENTS)}")
+    return names
+
+def mesh_model_for(measurements: Optional[Iterable[str]] = None) -> str:
+    """The mesh graph to run for a request that needs `measurements`.
+    
+    A request that names its measurements gets the lightest graph that
+    covers them: the refined one only for iris measurements. Without a list
+    it gets FACE_MESH_MODEL, where "auto" means the lightest graph for the
+    measurements the planner reads.
+    """
+    if measurements is None:
+        return "base" if FACE_MESH_MODEL == "auto" else FACE_MESH_MODEL
+    needed = set(measurements)
+    unknown = needed - set(MEASUREMENTS)
+    if unknown:
+        raise ValueError(f"Unknown measurements {sorted(unknown)}, expected some of {list(MEASUREMENTS)}")
+    return "refined" if needed & IRIS_MEASUREMENTS else "base"
 
 class FaceAnalyzer:
-    def __init__(self):
+    def __init__(self, models: Optional[Iterable[str]] = None):
         self.mp_face_mesh = mp.solutions.face_mesh
         self.mp_drawing = mp.solutions.drawing_utils
-        self.face_mesh = self.mp_face_mesh.FaceMesh(
-            static_image_mode=True,
-            max_num_faces=1,
-            refine_landmarks=True,
-            min_detection_confidence=0.5,
-            min_tracking_confidence=0.5
-        )
+        self.meshes = {}
+        self._load_lock = threading.Lock()
+        # A graph is not re-entrant; concurrent pipelines take turns on each one
+        self._mesh_locks = {name: threading.Lock() for name in MESH_MODELS}
+        # Requests pick their graph, so both are loaded up front unless told otherwise
+        for model in models or MESH_MODELS:
+            self._mesh(model)
+    
+    def _mesh(self, model: str):
+        """The face mesh graph called `model`, loaded the first time it is asked for"""
+        mesh = self.meshes.get(model)
+        if mesh is not None:
+            return mesh
+        if model not in MESH_MODELS:
+            raise ValueError(f"Unknown mesh model '{model}', expected one of {list(MESH_MODELS)}")
+        with self._load_lock:
+            if model not in self.meshes:
+                with stage("mesh_load"):
+                    self.meshes[model] = self.mp_face_mesh.FaceMesh(
+                        static_image_mode=True,
+                        max_num_faces=1,
+                        refine_landmarks=MESH_MODELS[model],
+                        min_detection_confidence=0.5,
+                        min_tracking_confidence=0.5
+                    )
+            return self.meshes[model]
     
     def analyze_face(self, image_path: str) -> Tuple[Optional[np.ndarray], Dict]:
         """Analyze face and return landmarks and measurements"""
-        # Read image
-        image = cv2.imread(image_path)
+        # Read image, decoding only as much resolution as the mesh needs
+        with stage("decode"):
+            data = decoding.read_file(image_path)
+            header = decoding.read_header(data) if data is not None else None
+            image = decoding.decode(data, decoding.ANALYZE_MAX_SIDE, header) if data is not None else None
         if image is None:
             return None, {}
         
-        image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        results = self.face_mesh.process(image_rgb)
+        return self.analyze_image(image, header.shape if header else None)
+    
+    def analyze_image(self, image: np.ndarray, full_shape: Optional[Tuple[int, ...]] = None,
+                      model: Optional[str] = None) -> Tuple[Optional[np.ndarray], Dict]:
+        """Analyze an already decoded BGR frame.
+        
+        When `image` is a reduced decode, `full_shape` is the shape of the
+        full-resolution image and measurements are taken in its pixels.
+        `model` picks the mesh graph; by default FACE_MESH_MODEL (see
+        mesh_model_for).
+        """
+        model = model or mesh_model_for()
+        mesh = self._mesh(model)
+        with stage("mesh"):
+            image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+            with self._mesh_locks[model]:
+                # Calls queue on the graph's lock; one whose request was abandoned meanwhile skips the mesh
+                deadlines.check("mesh")
+                results = mesh.process(image_rgb)
         
         if not results.multi_face_landmarks:
             return None, {}
@@ -34,10 +122,15 @@ class FaceAnalyzer:
         landmarks = np.array([[lm.x, lm.y, lm.z] for lm in face_landmarks.landmark])
         
         # Calculate measurements
-        measurements = self._calculate_measurements(landmarks, image.shape)
+        measurements = self.measure(landmarks, full_shape or image.shape)
         
         return landmarks, measurements
     
+    def measure(self, landmarks: np.ndarray, shape: Tuple[int, ...]) -> Dict:
+        """Measurements from normalized landmarks against a frame of `shape`, without running the mesh"""
+        with stage("measurements"):
+            return self._calculate_measurements(landmarks, shape)
+    
     def _calculate_measurements(self, landmarks: np.ndarray, image_shape: Tuple[int, int, int]) -> Dict:
         """Calculate facial measurements and ratios"""
         height, width = image_shape[:2]
@@ -74,7 +167,7 @@ class FaceAnalyzer:
         # Calculate jaw asymmetry
         jaw_asymmetry = self._calculate_jaw_asymmetry(landmarks_px)
         
-        return {
+        measurements = {
             "symmetry_score": symmetry_score,
             "facial_thirds": facial_thirds,
             "nose_to_ipd_ratio": nose_to_ipd_ratio,
@@ -83,6 +176,10 @@ class FaceAnalyzer:
             "nose_width": nose_width,
             "ipd": ipd
         }
+        # Only the refined graph places the irises
+        if len(landmarks_px) >= LANDMARK_COUNTS["refined"]:
+            measurements["iris_ipd"] = self._get_iris_distance(landmarks_px)
+        return measurements
     
     def _calculate_symmetry(self, landmarks: np.ndarray) -> float:
         """Calculate facial symmetry score (0-1)"""
@@ -141,6 +238,10 @@ class FaceAnalyzer:
         right_eye_center = np.mean(landmarks[[362, 382, 381, 380, 374, 373, 390, 249, 263, 466, 388, 387, 386, 385, 384, 398]], axis=0)
         return np.linalg.norm(right_eye_center - left_eye_center)
     
+    def _get_iris_distance(self, landmarks: np.ndarray) -> float:
+        """Distance between the iris centers (refined landmarks 468 and 473)"""
+        return np.linalg.norm(landmarks[473] - landmarks[468])
+    
     def _calculate_chin_projection(self, landmarks: np.ndarray) -> float:
         """Calculate chin projection relative to face"""
         chin = landmarks[152]
@@ -0,0 +1,73 @@
+import re
+from typing import Optional, Tuple
+
+from fastapi.responses import Response
+
+# Content-addressed URLs never change meaning, so caches may keep them for a year
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def etag_for(key: str) -> str:
+    """Strong ETag of a content-hashed store key"""
+    return f'"{key}"'
+
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match list names `etag` (weak comparison, as RFC 9110 requires there)"""
+    if not header:
+        return False
+    tags = [tag.strip() for tag in header.split(",")]
+    return "*" in tags or any(tag.removeprefix("W/") == etag for tag in tags)
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Inclusive byte range of a single-range "bytes=" header, or None to send everything.
+
+    Multiple ranges and unknown units are ignored, which RFC 9110 allows; a
+    range starting past the end, a zero-length suffix, or any range of an
+    empty body raises ValueError (416).
+    """
+    if not header:
+        return None
+    match = _RANGE.match(header.strip())
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        # Suffix range: the final `last` bytes
+        if int(last) == 0 or size == 0:
+            raise ValueError("Range not satisfiable")
+        return max(0, size - int(last)), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size:
+        raise ValueError("Range not satisfiable")
+    if end < start:
+        return None
+    return start, end
+
+
+def immutable_response(data: bytes, content_type: str, key: str, if_none_match: Optional[str] = None,
+                       range_header: Optional[str] = None, if_range: Optional[str] = None) -> Response:
+    """Serve a content-addressed blob: 304 on a matching ETag, 206 for a byte range, else 200"""
+    etag = etag_for(key)
+    headers = {"ETag": etag, "Cache-Control": IMMUTABLE_CACHE_CONTROL, "Accept-Ranges": "bytes"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    # If-Range needs a strong match; otherwise the client gets the whole body
+    if if_range is None or if_range.strip() == etag:
+        try:
+            byte_range = parse_range(range_header, len(data))
+        except ValueError:
+            headers["Content-Range"] = f"bytes */{len(data)}"
+            return Response(status_code=416, headers=headers)
+        if byte_range is not None:
+            start, end = byte_range
+            headers["Content-Range"] = f"bytes {start}-{end}/{len(data)}"
+            return Response(content=data[start:end + 1], status_code=206, media_type=content_type, headers=headers)
+    return Response(content=data, media_type=content_type, headers=headers)
@@ -1,102 +1,288 @@
 import cv2
+import json
 import numpy as np
-from typing import List, Dict, Any, Optional
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import List, Dict, Any, Optional, Sequence, Tuple, Union
 import os
-from pathlib import Path
-import tempfile
+
+import deadlines
+import diagnostics
+import execution
+from metrics import stage
+
+# Working-set estimate per output pixel of a render strip: float64 coordinate
+# maps, float32 remap tables, the warped strip and the float32 blend temporaries
+STRIP_BYTES_PER_PIXEL = 96
+
+# Output encodings: file extension, content type and the quality flag
+OUTPUT_FORMATS = {
+    "jpeg": (".jpg", "image/jpeg", cv2.IMWRITE_JPEG_QUALITY),
+    "webp": (".webp", "image/webp", cv2.IMWRITE_WEBP_QUALITY),
+}
+FULL_QUALITY = 95
+REDUCED_QUALITY = 85
+
+
+def parse_variants(spec: str) -> Dict[str, Optional[int]]:
+    """Parse "thumbnail:200,preview:600,full" into {name: longest side}; no size means full resolution"""
+    variants = {}
+    for item in spec.split(","):
+        name, _, size = item.strip().partition(":")
+        if name:
+            variants[name] = int(size) if size else None
+    return variants
+
+
+@dataclass
+class WarpSpec:
+    """Geometry of a warp-and-blend operation, independent of pixel data"""
+    matrix: np.ndarray  # 3x3 forward transform (source -> destination)
+    mask: Tuple         # ("ellipse", center, axes) | ("poly", points) | ("rect", pt1, pt2)
+    blur: int           # Gaussian kernel size used to feather the mask
+    strength: float = 1.0
+
+
+@dataclass
+class MirrorSpec:
+    """Blend of a vertical band of the face with its own mirror image"""
+    mask: Tuple
+    blur: int
+    left: int
+    right: int
+    strength: float
+
+
+OperationSpec = Union[WarpSpec, MirrorSpec]
+
+
+@dataclass(frozen=True)
+class QualityTier:
+    """How faithfully a plan is rendered; the plan itself never depends on the tier"""
+    max_side: Optional[int]  # working resolution cap on the longest side (None = full)
+    blur_scale: float        # multiplier on mask feathering kernels
+    interpolation: int       # cv2 sampling used by warps
+
+
+QUALITY_TIERS = {
+    "draft": QualityTier(1280, 0.5, cv2.INTER_NEAREST),
+    "standard": QualityTier(None, 1.0, cv2.INTER_LINEAR),
+    "high": QualityTier(None, 1.0, cv2.INTER_CUBIC),
+}
+
+
+def parse_quality(value: Optional[str]) -> str:
+    """Validate a quality tier name; empty means standard"""
+    if not value:
+        return "standard"
+    if value not in QUALITY_TIERS:
+        raise ValueError(f"Unknown quality '{value}', expected one of {list(QUALITY_TIERS)}")
+    return value
+
 
 class ImageProcessor:
-    def __init__(self):
-        self.upload_dir = Path("uploads")
-        self.upload_dir.mkdir(exist_ok=True)
-    
-    def apply_operations(self, image_path: str, operations: List[Dict[str, Any]]) -> Optional[str]:
-        """Apply cosmetic operations to the image"""
-        if not operations:
-            print(f"[DEBUG] No operations to apply")
-            return None
+    def __init__(self, memory_budget_mb: Optional[float] = None, encode_threads: Optional[int] = None):
+        # With a budget, operations only touch their mask's bounding box and
+        # process it in horizontal strips sized to fit; 0 renders full frames
+        if memory_budget_mb is None:
+            memory_budget_mb = float(os.getenv("RENDER_MEMORY_BUDGET_MB", "256"))
+        self.memory_budget_bytes = int(memory_budget_mb * 1024 * 1024) if memory_budget_mb > 0 else None
+        
+        # cv2.imencode releases the GIL, so output variants encode in parallel
+        # threads; the pool is shared by all requests, so one thread per core
+        if encode_threads is None:
+            encode_threads = int(os.getenv("ENCODE_THREADS", "0")) or execution.available_cores()
+        self.encode_threads = encode_threads
+        self.encode_pool = ThreadPoolExecutor(max_workers=encode_threads, thread_name_prefix="encode")
+    
+    def render(self, image: np.ndarray, operations: List[Dict[str, Any]], quality: str = "standard",
+               plan_shape: Optional[Tuple[int, ...]] = None) -> np.ndarray:
+        """Apply cosmetic operations to a decoded BGR frame and return the result.
         
-        print(f"[DEBUG] Applying {len(operations)} operations: {operations}")
+        Operations are planned on `plan_shape` (the full-resolution source, by
+        default the frame's own shape) and scaled to the working frame, so every
+        quality tier and output size renders the same plan.
+        """
+        tier = QUALITY_TIERS[parse_quality(quality)]
+        plan_shape = plan_shape or image.shape
+        frame = self.downscale(image, tier.max_side)
         
-        # Load image
-        image = cv2.imread(image_path)
-        if image is None:
-            print(f"[DEBUG] Failed to load image from {image_path}")
-            return None
+        # Operations never modify their input, so only keep the original around
+        # when diagnostics need it for comparison
+        report = diagnostics.current()
+        processed_image = frame
         
-        print(f"[DEBUG] Loaded image: {image.shape}")
+        # Apply each operation
+        for operation in operations:
+            step = f"render_{operation.get('region')}_{operation.get('type')}"
+            deadlines.check(step)
+            with stage(step):
+                processed_image = self._apply_single_operation(processed_image, operation, tier, plan_shape)
         
-        # Create a copy for processing
-        processed_image = image.copy()
+        if report is not None:
+            report.record_total(frame, processed_image)
         
-        # Apply each operation
-        for i, operation in enumerate(operations):
-            print(f"[DEBUG] Applying operation {i+1}/{len(operations)}: {operation.get('region')} - {operation.get('type')}")
-            original_sum = processed_image.sum()
-            processed_image = self._apply_single_operation(processed_image, operation)
-            new_sum = processed_image.sum()
-            changed = abs(original_sum - new_sum) > 100  # Threshold to detect changes
-            print(f"[DEBUG] Operation {i+1} result: Changed={changed}, Original sum={original_sum}, New sum={new_sum}")
-        
-        # Verify image actually changed
-        diff = cv2.absdiff(image, processed_image)
-        change_amount = np.sum(diff > 10)  # Count pixels that changed significantly
-        print(f"[DEBUG] Total pixels changed: {change_amount} out of {image.size}")
-        
-        if change_amount < 100:  # Very few pixels changed
-            print(f"[WARNING] Very few pixels changed - operations may not be working!")
-        
-        # Save processed image
-        output_path = self._save_processed_image(processed_image, image_path)
-        print(f"[DEBUG] Saved processed image to: {output_path}")
-        return output_path
-    
-    def _apply_single_operation(self, image: np.ndarray, operation: Dict[str, Any]) -> np.ndarray:
+        return processed_image
+    
+    def render_many(self, image: np.ndarray, plans: Dict[str, List[Dict[str, Any]]], quality: str = "standard",
+                    plan_shape: Optional[Tuple[int, ...]] = None) -> Dict[str, np.ndarray]:
+        """Render several plans of the same frame in one pass.
+        
+        The frame is downscaled once, each distinct feathered mask is drawn
+        once, and a run of leading operations that several plans have in common
+        is rendered once and continued from by each of them. Every result is
+        pixel-identical to render() of that plan alone.
+        """
+        tier = QUALITY_TIERS[parse_quality(quality)]
+        plan_shape = plan_shape or image.shape
+        frame = self.downscale(image, tier.max_side)
+        
+        # Prefix -> number of plans still to continue from it; only prefixes
+        # shared by another plan are kept, and only until their last user
+        prefixes = {name: self._prefix_keys(operations) for name, operations in plans.items()}
+        users = Counter(key for keys in prefixes.values() for key in keys)
+        shared: Dict[Tuple[str, ...], np.ndarray] = {}
+        masks: Dict[Tuple, np.ndarray] = {}
+        
+        results = {}
+        for name, operations in plans.items():
+            keys = prefixes[name]
+            start = next((i + 1 for i in reversed(range(len(keys))) if keys[i] in shared), 0)
+            processed_image = shared[keys[start - 1]] if start else frame
+            for i in range(start, len(operations)):
+                operation = operations[i]
+                step = f"render_{operation.get('region')}_{operation.get('type')}"
+                deadlines.check(step)
+                with stage(step):
+                    processed_image = self._apply_single_operation(processed_image, operation, tier, plan_shape, masks)
+                if users[keys[i]] > 1:
+                    shared[keys[i]] = processed_image
+            for key in keys:
+                users[key] -= 1
+                if users[key] == 0:
+                    shared.pop(key, None)
+            results[name] = processed_image
+        return results
+    
+    def _prefix_keys(self, operations: List[Dict[str, Any]]) -> List[Tuple[str, ...]]:
+        """Hashable identity of each leading run of a plan's operations"""
+        keys, prefix = [], ()
+        for operation in operations:
+            prefix = prefix + (json.dumps(operation, sort_keys=True, default=str),)
+            keys.append(prefix)
+        return keys
+    
+    def encode(self, image: np.ndarray, fmt: str = "jpeg", quality: int = FULL_QUALITY) -> bytes:
+        """Encode a frame, by default as a high quality JPEG"""
+        deadlines.check("encode")
+        with stage("encode"):
+            return self._encode(image, fmt, quality)
+    
+    def encode_variants(self, image: np.ndarray, variants: Dict[str, Optional[int]],
+                        formats: Sequence[str]) -> Dict[Tuple[str, str], bytes]:
+        """Downscale a frame to each variant and encode every variant/format pair concurrently.
+        
+        `variants` maps names to their longest side (None keeps the frame's size).
+        """
+        deadlines.check("encode")
+        frames = {name: self.downscale(image, max_side) for name, max_side in variants.items()}
+        with stage("encode"):
+            futures = {}
+            for name, frame in frames.items():
+                quality = FULL_QUALITY if variants[name] is None else REDUCED_QUALITY
+                for fmt in formats:
+                    futures[(name, fmt)] = self.encode_pool.submit(self._encode, frame, fmt, quality)
+            return {key: future.result() for key, future in futures.items()}
+    
+    def downscale(self, image: np.ndarray, max_side: Optional[int]) -> np.ndarray:
+        """Shrink a frame so its longest side is at most `max_side`"""
+        height, width = image.shape[:2]
+        if max_side is None or max(height, width) <= max_side:
+            return image
+        scale = max_side / max(height, width)
+        with stage("downscale"):
+            return cv2.resize(image, (max(1, round(width * scale)), max(1, round(height * scale))),
+                              interpolation=cv2.INTER_AREA)
+    
+    def plan(self, operations: List[Dict[str, Any]], shape: Tuple[int, ...],
+             plan_shape: Optional[Tuple[int, ...]] = None, blur_scale: float = 1.0) -> List[OperationSpec]:
+        """Specs for the known operations, planned on `plan_shape` and mapped onto a frame of `shape`"""
+        plan_shape = plan_shape or shape
+        specs = []
+        for operation in operations:
+            planner = self._operation_planner(operation)
+            spec = planner(plan_shape, operation) if planner is not None else None
+            if spec is not None:
+                specs.append(self._scale_spec(spec, plan_shape, shape, blur_scale))
+        return specs
+    
+    def render_spec(self, image: np.ndarray, spec: OperationSpec,
+                    interpolation: int = cv2.INTER_LINEAR) -> np.ndarray:
+        """Render one spec from plan() onto a frame of the shape it was planned for"""
+        return self._render(image, spec, interpolation)
+    
+    def feathered_mask(self, spec: OperationSpec, shape: Tuple[int, ...]) -> np.ndarray:
+        """Full-frame uint8 mask of a spec after feathering, as the renderers blend with it"""
+        return self._feathered_region(spec, 0, 0, shape[1], shape[0])
+    
+    def _encode(self, image: np.ndarray, fmt: str, quality: int) -> bytes:
+        ext, _, quality_flag = OUTPUT_FORMATS[fmt]
+        ok, encoded = cv2.imencode(ext, image, [quality_flag, quality])
+        if not ok:
+            raise ValueError(f"Could not encode image as {fmt}")
+        return encoded.tobytes()
+    
+    def _apply_single_operation(self, image: np.ndarray, operation: Dict[str, Any],
+                                tier: QualityTier = QUALITY_TIERS["standard"],
+                                plan_shape: Optional[Tuple[int, ...]] = None,
+                                masks: Optional[Dict[Tuple, np.ndarray]] = None) -> np.ndarray:
         """Apply a single cosmetic operation to the image"""
+        planner = self._operation_planner(operation)
+        
+        result = image
+        if planner is not None:
+            spec = planner(plan_shape or image.shape, operation)
+            if spec is not None:
+                spec = self._scale_spec(spec, plan_shape or image.shape, image.shape, tier.blur_scale)
+                result = self._render(image, spec, tier.interpolation, masks)
+        
+        report = diagnostics.current()
+        if report is not None:
+            report.record_operation(operation, image, result, known=planner is not None)
+        
+        return result
+    
+    def _operation_planner(self, operation: Dict[str, Any]):
+        """Return the geometry planner for an operation, or None if unknown"""
         region = operation.get("region", "")
         op_type = operation.get("type", "")
         
-        print(f"[DEBUG] _apply_single_operation: region={region}, type={op_type}")
-        
-        result = image
         if region == "nose" and op_type == "shrink_width":
-            result = self._shrink_nose_width(image, operation)
+            return self._shrink_nose_width
         elif region == "nose" and op_type == "refine_tip":
-            result = self._refine_nose_tip(image, operation)
+            return self._refine_nose_tip
         elif region == "nose" and op_type == "refine_bridge":
-            result = self._refine_nose_bridge(image, operation)
+            return self._refine_nose_bridge
         elif region == "jaw" and op_type == "balance":
-            result = self._balance_jaw(image, operation)
+            return self._balance_jaw
         elif region == "face" and op_type == "symmetry":
-            result = self._improve_symmetry(image, operation)
+            return self._improve_symmetry
         elif region == "chin" and op_type == "enhance":
-            result = self._enhance_chin(image, operation)
+            return self._enhance_chin
         elif region == "face" and "third" in op_type:
-            result = self._adjust_facial_third(image, operation)
-        else:
-            print(f"[WARNING] Unknown operation: region={region}, type={op_type}")
-        
-        # Verify result changed
-        if np.array_equal(result, image):
-            print(f"[WARNING] Operation {region}-{op_type} returned unchanged image!")
-        else:
-            diff = np.sum(np.abs(result.astype(float) - image.astype(float)))
-            print(f"[DEBUG] Operation {region}-{op_type} changed image by {diff:.0f} pixels")
-        
-        return result
+            return self._adjust_facial_third
+        return None
     
-    def _shrink_nose_width(self, image: np.ndarray, operation: Dict[str, Any]) -> np.ndarray:
+    def _shrink_nose_width(self, shape: Tuple[int, ...], operation: Dict[str, Any]) -> Optional[WarpSpec]:
         """Comprehensive nose width reduction - main rhinoplasty operation"""
         factor = operation.get("factor", 0.9)
         
-        print(f"[DEBUG] _shrink_nose_width: factor={factor}")
-        
         # Ensure factor is reasonable - allow up to 30% reduction
         if factor >= 1.0 or factor < 0.70:
-            print(f"[WARNING] Nose shrink factor {factor} out of range, skipping")
-            return image
+            return None
         
-        height, width = image.shape[:2]
+        height, width = shape[:2]
         nose_center_x = width // 2
         nose_center_y = int(height * 0.35)
         nose_width = int(width * 0.16)  # Wider capture area for better results
@@ -105,7 +291,6 @@ class ImageProcessor:
         # More pronounced taper for elegant nose shape
         # Bridge (top) is wider, tip (bottom) is narrower naturally
         bridge_width = nose_width
-        mid_width = int(nose_width * 0.90)  # Middle section
         tip_width = int(nose_width * 0.80)  # Tip is narrower
         
         # Create more sophisticated warping points - 4 point perspective
@@ -119,14 +304,11 @@ class ImageProcessor:
         # Apply reduction factor more aggressively for impressive results
         reduction_multiplier = 1.0 - (1.0 - factor) * 1.2  # 20% more reduction for impact
         new_bridge_width = int(bridge_width * reduction_multiplier)
-        new_mid_width = int(mid_width * reduction_multiplier)
         new_tip_width = int(tip_width * reduction_multiplier)
         
         width_diff = bridge_width - new_bridge_width
-        print(f"[DEBUG] Nose width change: {width_diff} pixels (bridge: {bridge_width} -> {new_bridge_width})")
         if width_diff < 2:
-            print(f"[WARNING] Width diff too small ({width_diff}), skipping")
-            return image
+            return None
         
         # Create destination points - significantly narrower for impressive change
         dst_points = np.float32([
@@ -136,39 +318,21 @@ class ImageProcessor:
             [nose_center_x - new_tip_width//2, nose_center_y + nose_height//2]
         ])
         
-        # Create refined mask - more precise nose shape
-        mask = np.zeros(image.shape[:2], dtype=np.uint8)
+        # Elliptical mask that follows nose shape, smooth but not too blurry
         avg_width = (new_bridge_width + new_tip_width) // 2
+        mask = ("ellipse", (nose_center_x, nose_center_y), (avg_width//2 + 10, nose_height//2 + 12))
         
-        # Elliptical mask that follows nose shape
-        cv2.ellipse(mask, 
-                   (nose_center_x, nose_center_y),
-                   (avg_width//2 + 10, nose_height//2 + 12),
-                   0, 0, 360, 255, -1)
-        
-        # Smooth but not too blurry - preserve sharpness
-        mask = cv2.GaussianBlur(mask, (19, 19), 0)
-        mask = mask.astype(np.float32) / 255.0
-        mask = np.stack([mask] * 3, axis=2)
-        
-        # Apply transform with high-quality interpolation
         matrix = cv2.getPerspectiveTransform(src_points, dst_points)
-        warped = cv2.warpPerspective(image, matrix, (width, height), 
-                                    flags=cv2.INTER_LINEAR,
-                                    borderMode=cv2.BORDER_REPLICATE)
-        
-        # Blend for natural but noticeable result
-        result = image * (1 - mask) + warped * mask
-        return result.astype(np.uint8)
+        return WarpSpec(matrix, mask, 19)
     
-    def _refine_nose_tip(self, image: np.ndarray, operation: Dict[str, Any]) -> np.ndarray:
+    def _refine_nose_tip(self, shape: Tuple[int, ...], operation: Dict[str, Any]) -> Optional[WarpSpec]:
         """Refine nose tip - make it more defined and elegant"""
         factor = operation.get("factor", 0.85)
         
         if factor >= 1.0 or factor < 0.80:
-            return image
+            return None
         
-        height, width = image.shape[:2]
+        height, width = shape[:2]
         nose_center_x = width // 2
         nose_tip_y = int(height * 0.45)  # Tip is lower on face
         tip_width = int(width * 0.08)   # Narrow tip area
@@ -185,7 +349,7 @@ class ImageProcessor:
         # Narrow the tip more
         new_tip_width = int(tip_width * factor)
         if new_tip_width >= tip_width:
-            return image
+            return None
         
         dst_points = np.float32([
             [nose_center_x - new_tip_width//2, nose_tip_y - tip_height//2],
@@ -195,31 +359,19 @@ class ImageProcessor:
         ])
         
         # Precise tip mask
-        mask = np.zeros(image.shape[:2], dtype=np.uint8)
-        cv2.ellipse(mask, 
-                   (nose_center_x, nose_tip_y),
-                   (new_tip_width//2 + 5, tip_height//2 + 5),
-                   0, 0, 360, 255, -1)
-        mask = cv2.GaussianBlur(mask, (13, 13), 0)
-        mask = mask.astype(np.float32) / 255.0
-        mask = np.stack([mask] * 3, axis=2)
+        mask = ("ellipse", (nose_center_x, nose_tip_y), (new_tip_width//2 + 5, tip_height//2 + 5))
         
         matrix = cv2.getPerspectiveTransform(src_points, dst_points)
-        warped = cv2.warpPerspective(image, matrix, (width, height),
-                                    flags=cv2.INTER_LINEAR,
-                                    borderMode=cv2.BORDER_REPLICATE)
-        
-        result = image * (1 - mask) + warped * mask
-        return result.astype(np.uint8)
+        return WarpSpec(matrix, mask, 13)
     
-    def _refine_nose_bridge(self, image: np.ndarray, operation: Dict[str, Any]) -> np.ndarray:
+    def _refine_nose_bridge(self, shape: Tuple[int, ...], operation: Dict[str, Any]) -> Optional[WarpSpec]:
         """Refine nose bridge - make it narrower and more elegant"""
         factor = operation.get("factor", 0.90)
         
         if factor >= 1.0 or factor < 0.85:
-            return image
+            return None
         
-        height, width = image.shape[:2]
+        height, width = shape[:2]
         nose_center_x = width // 2
         bridge_y = int(height * 0.28)  # Bridge is higher
         bridge_width = int(width * 0.10)  # Narrow bridge region
@@ -236,7 +388,7 @@ class ImageProcessor:
         # Narrow the bridge
         new_bridge_width = int(bridge_width * factor)
         if new_bridge_width >= bridge_width:
-            return image
+            return None
         
         dst_points = np.float32([
             [nose_center_x - new_bridge_width//2, bridge_y - bridge_height//2],
@@ -246,38 +398,26 @@ class ImageProcessor:
         ])
         
         # Precise bridge mask
-        mask = np.zeros(image.shape[:2], dtype=np.uint8)
-        cv2.ellipse(mask,
-                   (nose_center_x, bridge_y),
-                   (new_bridge_width//2 + 4, bridge_height//2 + 4),
-                   0, 0, 360, 255, -1)
-        mask = cv2.GaussianBlur(mask, (11, 11), 0)
-        mask = mask.astype(np.float32) / 255.0
-        mask = np.stack([mask] * 3, axis=2)
+        mask = ("ellipse", (nose_center_x, bridge_y), (new_bridge_width//2 + 4, bridge_height//2 + 4))
         
         matrix = cv2.getPerspectiveTransform(src_points, dst_points)
-        warped = cv2.warpPerspective(image, matrix, (width, height),
-                                    flags=cv2.INTER_LINEAR,
-                                    borderMode=cv2.BORDER_REPLICATE)
-        
-        result = image * (1 - mask) + warped * mask
-        return result.astype(np.uint8)
+        return WarpSpec(matrix, mask, 11)
     
-    def _balance_jaw(self, image: np.ndarray, operation: Dict[str, Any]) -> np.ndarray:
+    def _balance_jaw(self, shape: Tuple[int, ...], operation: Dict[str, Any]) -> Optional[WarpSpec]:
         """Balance jaw asymmetry using localized warping"""
         mm_correction = operation.get("mm", 0)
         
         if mm_correction == 0 or mm_correction > 2.0:
-            return image
+            return None
         
-        height, width = image.shape[:2]
+        height, width = shape[:2]
         
         # Convert mm to pixels (rough estimate: 1mm ≈ 1% of face width)
         face_width_estimate = width * 0.6
         pixel_correction = int(mm_correction * face_width_estimate / 100)
         
         if abs(pixel_correction) < 2:
-            return image
+            return None
         
         # Define jaw region (lower sides of face)
         jaw_y = int(height * 0.7)
@@ -292,7 +432,7 @@ class ImageProcessor:
             jaw_left = jaw_center_x
             jaw_right = min(jaw_center_x + jaw_side_width, width)
         else:
-            # Left side needs correction - shift toward center  
+            # Left side needs correction - shift toward center
             jaw_left = max(0, jaw_center_x - jaw_side_width)
             jaw_right = jaw_center_x
         
@@ -321,30 +461,20 @@ class ImageProcessor:
                 [jaw_left - shift, jaw_y + jaw_height]
             ])
         
-        # Create mask for jaw region
-        mask = np.zeros((height, width), dtype=np.uint8)
-        cv2.fillPoly(mask, [src_points.astype(int)], 255)
-        mask = cv2.GaussianBlur(mask, (21, 21), 0)
-        mask_3d = np.stack([mask] * 3, axis=2).astype(np.float32) / 255.0
+        # Mask for jaw region - blend only the jaw
+        mask = ("poly", src_points.astype(int))
         
-        # Apply perspective transform
         matrix = cv2.getPerspectiveTransform(src_points, dst_points)
-        warped = cv2.warpPerspective(image, matrix, (width, height),
-                                    flags=cv2.INTER_LINEAR,
-                                    borderMode=cv2.BORDER_REPLICATE)
-        
-        # Blend only the jaw region
-        result = image * (1 - mask_3d) + warped * mask_3d
-        return result.astype(np.uint8)
+        return WarpSpec(matrix, mask, 21)
     
-    def _improve_symmetry(self, image: np.ndarray, operation: Dict[str, Any]) -> np.ndarray:
+    def _improve_symmetry(self, shape: Tuple[int, ...], operation: Dict[str, Any]) -> Optional[MirrorSpec]:
         """Improve facial symmetry using localized warping"""
         amount = operation.get("amount", 0)
         
         if amount == 0 or amount > 0.15:
-            return image
+            return None
         
-        height, width = image.shape[:2]
+        height, width = shape[:2]
         
         # Only modify the central face region to avoid edge blurring
         face_center_x = width // 2
@@ -352,51 +482,29 @@ class ImageProcessor:
         face_region_width = int(width * 0.6)
         face_region_height = int(height * 0.7)
         
-        # Create a mask for the face region
-        mask = np.zeros((height, width), dtype=np.uint8)
-        cv2.ellipse(mask, 
-                   (face_center_x, face_center_y),
-                   (face_region_width//2, face_region_height//2),
-                   0, 0, 360, 255, -1)
-        mask = cv2.GaussianBlur(mask, (25, 25), 0)
+        # Mask for the face region
+        mask = ("ellipse", (face_center_x, face_center_y), (face_region_width//2, face_region_height//2))
         
-        # Apply very subtle symmetry correction using local affine transform
+        # Apply very subtle symmetry correction
         # Split only the inner face region
         inner_left = int(face_center_x - face_region_width * 0.25)
         inner_right = int(face_center_x + face_region_width * 0.25)
         
         if inner_left > 0 and inner_right < width:
-            # Create mirrored version of center region
-            center_region = image[:, inner_left:inner_right].copy()
-            mirrored = cv2.flip(center_region, 1)
-            
             # More visible blend for noticeable symmetry improvement
             blend_strength = min(amount * 0.4, 0.2)  # Increased from 0.2/0.1 to 0.4/0.2
-            blended = cv2.addWeighted(center_region, 1 - blend_strength, 
-                                     mirrored, blend_strength, 0)
-            
-            # Apply only to center region with mask
-            result = image.copy()
-            center_mask = mask[:, inner_left:inner_right]
-            center_mask_3d = np.stack([center_mask] * 3, axis=2).astype(np.float32) / 255.0
-            
-            result[:, inner_left:inner_right] = (
-                result[:, inner_left:inner_right] * (1 - center_mask_3d) + 
-                blended * center_mask_3d
-            ).astype(np.uint8)
-            
-            return result
+            return MirrorSpec(mask, 25, inner_left, inner_right, blend_strength)
         
-        return image
+        return None
     
-    def _enhance_chin(self, image: np.ndarray, operation: Dict[str, Any]) -> np.ndarray:
+    def _enhance_chin(self, shape: Tuple[int, ...], operation: Dict[str, Any]) -> Optional[WarpSpec]:
         """Enhance chin projection using localized forward warping"""
         amount = operation.get("amount", 0)
         
         if amount == 0 or amount > 0.2:
-            return image
+            return None
         
-        height, width = image.shape[:2]
+        height, width = shape[:2]
         
         # Define chin region (lower portion of face)
         chin_start_y = int(height * 0.75)
@@ -405,7 +513,6 @@ class ImageProcessor:
         chin_width = int(width * 0.4)
         
         # Create transformation to push chin forward slightly
-        # Use local affine transformation for better quality
         src_points = np.float32([
             [chin_center_x - chin_width//2, chin_start_y],
             [chin_center_x + chin_width//2, chin_start_y],
@@ -416,8 +523,8 @@ class ImageProcessor:
         # Push forward by stretching downward - make more visible
         stretch_y = int(chin_height * amount * 0.5)  # Increased from 0.3 to 0.5 for more visibility
         if stretch_y < 1:
-            return image
-            
+            return None
+        
         dst_points = np.float32([
             [chin_center_x - chin_width//2, chin_start_y],
             [chin_center_x + chin_width//2, chin_start_y],
@@ -425,23 +532,13 @@ class ImageProcessor:
             [chin_center_x - chin_width//2, chin_start_y + chin_height + stretch_y]
         ])
         
-        # Create mask for chin region
-        mask = np.zeros((height, width), dtype=np.uint8)
-        cv2.fillPoly(mask, [dst_points.astype(int)], 255)
-        mask = cv2.GaussianBlur(mask, (15, 15), 0)
-        mask_3d = np.stack([mask] * 3, axis=2).astype(np.float32) / 255.0
+        # Mask for chin region - blend only the chin
+        mask = ("poly", dst_points.astype(int))
         
-        # Apply perspective transform
         matrix = cv2.getPerspectiveTransform(src_points, dst_points)
-        warped = cv2.warpPerspective(image, matrix, (width, height),
-                                    flags=cv2.INTER_LINEAR,
-                                    borderMode=cv2.BORDER_REPLICATE)
-        
-        # Blend only the chin region
-        result = image * (1 - mask_3d) + warped * mask_3d
-        return result.astype(np.uint8)
+        return WarpSpec(matrix, mask, 15)
     
-    def _adjust_facial_third(self, image: np.ndarray, operation: Dict[str, Any]) -> np.ndarray:
+    def _adjust_facial_third(self, shape: Tuple[int, ...], operation: Dict[str, Any]) -> Optional[WarpSpec]:
         """Adjust facial third proportions using localized vertical warping"""
         op_type = operation.get("type", "")
         current = operation.get("current", 0)
@@ -450,48 +547,42 @@ class ImageProcessor:
         # Calculate how much to adjust
         deviation = target - current
         if abs(deviation) < 0.01:  # Less than 1% change, skip
-            return image
-        
-        height, width = image.shape[:2]
-        face_height = height  # Approximate
+            return None
         
         # Determine which third to adjust
         if "upper" in op_type:
             # Upper third: Hairline to brow
             # Botox can lift brows, but we simulate subtle vertical adjustment
-            return self._adjust_upper_third(image, deviation, face_height)
+            return self._adjust_upper_third(shape, deviation)
         elif "middle" in op_type:
             # Middle third: Brow to base of nose
             # Very limited adjustment (mostly surgical)
-            return self._adjust_middle_third(image, deviation, face_height)
+            return self._adjust_middle_third(shape, deviation)
         elif "lower" in op_type:
             # Lower third: Base of nose to chin
             # Can use fillers for chin augmentation (already handled by chin enhancement)
             # But can also adjust lip-to-chin distance
-            return self._adjust_lower_third(image, deviation, face_height)
+            return self._adjust_lower_third(shape, deviation)
         
-        return image
+        return None
     
-    def _adjust_upper_third(self, image: np.ndarray, deviation: float, face_height: int) -> np.ndarray:
+    def _adjust_upper_third(self, shape: Tuple[int, ...], deviation: float) -> Optional[WarpSpec]:
         """
         Adjust upper third - VERY LIMITED with Botox
         Botox can only lift brows 1-3mm (minimal effect)
         For significant changes, requires surgical brow lift
         """
-        height, width = image.shape[:2]
-        upper_start = 0
-        upper_end = int(height * 0.33)
+        height, width = shape[:2]
         
         # Botox can only achieve 1-3mm brow lift = ~1-2% of face height
         max_botox_effect = 0.02  # Maximum 2% change achievable with Botox
         
         if abs(deviation) > max_botox_effect:
             # Beyond Botox capability - would require surgery
-            # Return original or very minimal effect
-            return image
+            return None
         
         if abs(deviation) < 0.01:  # Too subtle even for Botox
-            return image
+            return None
         
         # Very subtle compression to simulate minimal brow lift
         # Botox brow lift: relaxes muscles, lifts brows 1-3mm
@@ -499,38 +590,28 @@ class ImageProcessor:
         lift_amount = int(abs(deviation) * height * 0.3)  # Conservative, realistic amount
         
         if lift_amount < 1:
-            return image
+            return None
         
-        # Create subtle upward shift of brow region only
-        mask = np.zeros((height, width), dtype=np.uint8)
+        # Subtle upward shift of brow region only
         brow_region_height = int(height * 0.08)  # Small brow region
-        cv2.rectangle(mask, (0, brow_lift_y - brow_region_height//2), 
-                     (width, brow_lift_y + brow_region_height//2), 255, -1)
-        mask = cv2.GaussianBlur(mask, (15, 15), 0)
-        mask_3d = np.stack([mask] * 3, axis=2).astype(np.float32) / 255.0
-        
-        # Subtle upward translation
-        M = np.float32([[1, 0, 0], [0, 1, -lift_amount]])
-        warped = cv2.warpAffine(image, M, (width, height),
-                               flags=cv2.INTER_LINEAR,
-                               borderMode=cv2.BORDER_REPLICATE)
+        mask = ("rect", (0, brow_lift_y - brow_region_height//2), (width, brow_lift_y + brow_region_height//2))
         
-        # Blend very subtly
-        result = image * (1 - mask_3d * 0.4) + warped * mask_3d * 0.4
-        return result.astype(np.uint8)
+        # Subtle upward translation, blended very subtly
+        matrix = np.float64([[1, 0, 0], [0, 1, -lift_amount], [0, 0, 1]])
+        return WarpSpec(matrix, mask, 15, strength=0.4)
     
-    def _adjust_middle_third(self, image: np.ndarray, deviation: float, face_height: int) -> np.ndarray:
+    def _adjust_middle_third(self, shape: Tuple[int, ...], deviation: float) -> Optional[WarpSpec]:
         """
         Adjust middle third - BEST CANDIDATE for non-surgical enhancement
         Cheek/midface fillers are very effective for this region
         NOT achievable with Botox alone - requires fillers
         """
-        height, width = image.shape[:2]
+        height, width = shape[:2]
         middle_start = int(height * 0.33)  # Brow level
         middle_end = int(height * 0.66)    # Nose base
         
         if abs(deviation) < 0.02:
-            return image
+            return None
         
         # Middle third enhancement = cheek augmentation with fillers
         # This adds volume/forward projection to midface
@@ -558,45 +639,32 @@ class ImageProcessor:
                 [center_x - cheek_width//2 - projection//4, middle_end]
             ])
             
-            # Create mask for cheek/midface region
-            mask = np.zeros((height, width), dtype=np.uint8)
-            cv2.ellipse(mask, 
-                       (center_x, cheek_center_y),
-                       (cheek_width//2 + 10, (middle_end - middle_start)//2 + 5),
-                       0, 0, 360, 255, -1)
-            mask = cv2.GaussianBlur(mask, (23, 23), 0)
-            mask_3d = np.stack([mask] * 3, axis=2).astype(np.float32) / 255.0
+            # Mask for cheek/midface region
+            mask = ("ellipse", (center_x, cheek_center_y),
+                    (cheek_width//2 + 10, (middle_end - middle_start)//2 + 5))
             
-            # Apply transformation
             matrix = cv2.getPerspectiveTransform(src_points, dst_points)
-            warped = cv2.warpPerspective(image, matrix, (width, height),
-                                        flags=cv2.INTER_LINEAR,
-                                        borderMode=cv2.BORDER_REPLICATE)
-            
-            result = image * (1 - mask_3d) + warped * mask_3d
-            return result.astype(np.uint8)
+            return WarpSpec(matrix, mask, 23)
         
-        return image  # Reducing middle third typically requires surgery
+        return None  # Reducing middle third typically requires surgery
     
-    def _adjust_lower_third(self, image: np.ndarray, deviation: float, face_height: int) -> np.ndarray:
+    def _adjust_lower_third(self, shape: Tuple[int, ...], deviation: float) -> Optional[WarpSpec]:
         """Adjust lower third (nose base to chin) - can use fillers"""
-        height, width = image.shape[:2]
+        height, width = shape[:2]
         
         lower_start = int(height * 0.66)
         lower_end = height
         lower_height = lower_end - lower_start
         
         if abs(deviation) < 0.02:
-            return image
+            return None
         
         # More significant adjustment possible (fillers can add volume)
         stretch_factor = 1.0 + (deviation * 0.6)  # 60% of deviation
         new_height = int(lower_height * stretch_factor)
         
         if abs(new_height - lower_height) < 3:
-            return image
-        
-        center_x = width // 2
+            return None
         
         src_points = np.float32([
             [0, lower_start],
@@ -614,30 +682,219 @@ class ImageProcessor:
             [0, new_end]
         ])
         
-        # Create mask for lower face
-        mask = np.zeros((height, width), dtype=np.uint8)
-        cv2.fillPoly(mask, [dst_points.astype(int)], 255)
-        mask = cv2.GaussianBlur(mask, (23, 23), 0)
-        mask_3d = np.stack([mask] * 3, axis=2).astype(np.float32) / 255.0
+        # Mask for lower face
+        mask = ("poly", dst_points.astype(int))
         
         matrix = cv2.getPerspectiveTransform(src_points, dst_points)
-        warped = cv2.warpPerspective(image, matrix, (width, height),
-                                    flags=cv2.INTER_LINEAR,
-                                    borderMode=cv2.BORDER_REPLICATE)
+        return WarpSpec(matrix, mask, 23)
+    
+    def _scale_spec(self, spec: OperationSpec, plan_shape: Tuple[int, ...], shape: Tuple[int, ...],
+                    blur_scale: float) -> OperationSpec:
+        """Map a spec planned on `plan_shape` onto a frame of `shape`"""
+        sx = shape[1] / plan_shape[1]
+        sy = shape[0] / plan_shape[0]
+        if sx == 1.0 and sy == 1.0 and blur_scale == 1.0:
+            return spec
+        
+        # Feathering shrinks with the frame; kernels must stay odd
+        blur = max(3, int(spec.blur * blur_scale * (sx + sy) / 2) | 1)
+        mask = self._scale_mask(spec.mask, sx, sy)
+        if isinstance(spec, MirrorSpec):
+            return MirrorSpec(mask, blur, int(round(spec.left * sx)), int(round(spec.right * sx)), spec.strength)
+        
+        scale = np.diag([sx, sy, 1.0])
+        matrix = scale @ np.asarray(spec.matrix, dtype=np.float64) @ np.linalg.inv(scale)
+        return WarpSpec(matrix, mask, blur, spec.strength)
+    
+    def _scale_mask(self, shape: Tuple, sx: float, sy: float) -> Tuple:
+        kind = shape[0]
+        if kind == "ellipse":
+            (cx, cy), (ax, ay) = shape[1], shape[2]
+            return ("ellipse", (round(cx * sx), round(cy * sy)), (round(ax * sx), round(ay * sy)))
+        if kind == "poly":
+            return ("poly", np.rint(np.asarray(shape[1]) * [sx, sy]).astype(int))
+        (ax, ay), (bx, by) = shape[1], shape[2]
+        return ("rect", (round(ax * sx), round(ay * sy)), (round(bx * sx), round(by * sy)))
+    
+    def _render(self, image: np.ndarray, spec: OperationSpec, interpolation: int = cv2.INTER_LINEAR,
+                masks: Optional[Dict[Tuple, np.ndarray]] = None) -> np.ndarray:
+        """Render one planned operation, tiled when a memory budget is set.
+        
+        `masks` caches feathered masks across calls on frames of the same shape.
+        """
+        if isinstance(spec, MirrorSpec):
+            if self.memory_budget_bytes is None:
+                return self._render_mirror_full(image, spec, masks)
+            return self._render_mirror_tiled(image, spec, masks)
+        if self.memory_budget_bytes is None:
+            return self._render_warp_full(image, spec, interpolation, masks)
+        return self._render_warp_tiled(image, spec, interpolation, masks)
+    
+    def _render_warp_full(self, image: np.ndarray, spec: WarpSpec, interpolation: int,
+                          masks: Optional[Dict[Tuple, np.ndarray]] = None) -> np.ndarray:
+        """Warp and blend on full-frame masks and temporaries"""
+        height, width = image.shape[:2]
+        
+        mask = self._feathered_region(spec, 0, 0, width, height, masks)
+        mask_3d = np.stack([mask] * 3, axis=2).astype(np.float32) / 255.0
+        
+        warped = self._warp_region(image, spec.matrix, 0, 0, width, height, interpolation)
+        return self._blend(image, warped, mask_3d, spec.strength)
+    
+    def _render_warp_tiled(self, image: np.ndarray, spec: WarpSpec, interpolation: int,
+                           masks: Optional[Dict[Tuple, np.ndarray]] = None) -> np.ndarray:
+        """Warp and blend only the mask's bounding box, one strip at a time.
+        
+        Outside the feathered mask the blend reproduces the input exactly, and
+        the warp samples the untouched input frame, so the result matches
+        _render_warp_full pixel for pixel.
+        """
+        height, width = image.shape[:2]
+        x0, y0, x1, y1 = self._mask_bounds(spec.mask, spec.blur, width, height)
+        if x0 >= x1 or y0 >= y1:
+            return image
+        
+        mask = self._feathered_region(spec, x0, y0, x1, y1, masks)
+        
+        result = image.copy()
+        rows = self._strip_rows(x1 - x0)
+        for top in range(y0, y1, rows):
+            bottom = min(top + rows, y1)
+            warped = self._warp_region(image, spec.matrix, x0, top, x1, bottom, interpolation)
+            strip_mask = (mask[top - y0:bottom - y0].astype(np.float32) / 255.0)[:, :, np.newaxis]
+            result[top:bottom, x0:x1] = self._blend(image[top:bottom, x0:x1], warped, strip_mask, spec.strength)
+        return result
+    
+    def _render_mirror_full(self, image: np.ndarray, spec: MirrorSpec,
+                            masks: Optional[Dict[Tuple, np.ndarray]] = None) -> np.ndarray:
+        """Blend the central band with its mirror image on full-frame masks"""
+        height, width = image.shape[:2]
+        
+        mask = self._feathered_region(spec, 0, 0, width, height, masks)
         
-        result = image * (1 - mask_3d) + warped * mask_3d
+        result = image.copy()
+        center_mask = mask[:, spec.left:spec.right]
+        center_mask_3d = np.stack([center_mask] * 3, axis=2).astype(np.float32) / 255.0
+        blended = self._mirror_blend(image[:, spec.left:spec.right], spec.strength)
+        
+        result[:, spec.left:spec.right] = (
+            result[:, spec.left:spec.right] * (1 - center_mask_3d) +
+            blended * center_mask_3d
+        ).astype(np.uint8)
+        return result
+    
+    def _render_mirror_tiled(self, image: np.ndarray, spec: MirrorSpec,
+                             masks: Optional[Dict[Tuple, np.ndarray]] = None) -> np.ndarray:
+        """Mirror-blend only the rows the mask covers, one strip at a time"""
+        height, width = image.shape[:2]
+        x0, y0, x1, y1 = self._mask_bounds(spec.mask, spec.blur, width, height)
+        x0, x1 = min(x0, spec.left), max(x1, spec.right)
+        if y0 >= y1:
+            return image
+        
+        mask = self._feathered_region(spec, x0, y0, x1, y1, masks)
+        center_mask = mask[:, spec.left - x0:spec.right - x0]
+        
+        result = image.copy()
+        rows = self._strip_rows(spec.right - spec.left)
+        for top in range(y0, y1, rows):
+            bottom = min(top + rows, y1)
+            region = image[top:bottom, spec.left:spec.right]
+            blended = self._mirror_blend(region, spec.strength)
+            strip_mask = (center_mask[top - y0:bottom - y0].astype(np.float32) / 255.0)[:, :, np.newaxis]
+            result[top:bottom, spec.left:spec.right] = (
+                region * (1 - strip_mask) + blended * strip_mask
+            ).astype(np.uint8)
+        return result
+    
+    def _mirror_blend(self, region: np.ndarray, strength: float) -> np.ndarray:
+        """Mix a band with its horizontal mirror, row by row"""
+        mirrored = region[:, ::-1]
+        # Explicit float32 arithmetic keeps each pixel independent of how the
+        # band is split into strips
+        blended = region * np.float32(1 - strength) + mirrored * np.float32(strength)
+        return np.rint(blended).astype(np.uint8)
+    
+    def _blend(self, image: np.ndarray, warped: np.ndarray, mask: np.ndarray, strength: float) -> np.ndarray:
+        """Feathered blend of the warped pixels over the original"""
+        if strength == 1.0:
+            result = image * (1 - mask) + warped * mask
+        else:
+            result = image * (1 - mask * strength) + warped * mask * strength
         return result.astype(np.uint8)
     
-    def _save_processed_image(self, image: np.ndarray, original_path: str) -> str:
-        """Save the processed image and return the path"""
-        original_name = Path(original_path).stem
-        output_filename = f"after_{original_name}.jpg"
-        output_path = self.upload_dir / output_filename
+    def _warp_region(self, image: np.ndarray, matrix: np.ndarray, x0: int, y0: int, x1: int, y1: int,
+                     interpolation: int = cv2.INTER_LINEAR) -> np.ndarray:
+        """Warp the destination rectangle [x0, x1) x [y0, y1) of the full frame.
         
-        # Save with high quality
-        cv2.imwrite(str(output_path), image, [cv2.IMWRITE_JPEG_QUALITY, 95])
+        Sampling coordinates are computed from absolute pixel positions, so any
+        split of the frame into regions yields exactly the same pixels.
+        """
+        inverse = np.linalg.inv(np.asarray(matrix, dtype=np.float64))
+        xs = np.arange(x0, x1, dtype=np.float64)[np.newaxis, :]
+        ys = np.arange(y0, y1, dtype=np.float64)[:, np.newaxis]
+        
+        w = inverse[2, 0] * xs + inverse[2, 1] * ys + inverse[2, 2]
+        map_x = ((inverse[0, 0] * xs + inverse[0, 1] * ys + inverse[0, 2]) / w).astype(np.float32)
+        map_y = ((inverse[1, 0] * xs + inverse[1, 1] * ys + inverse[1, 2]) / w).astype(np.float32)
+        
+        return cv2.remap(image, map_x, map_y, interpolation, borderMode=cv2.BORDER_REPLICATE)
+    
+    def _feathered_region(self, spec: OperationSpec, x0: int, y0: int, x1: int, y1: int,
+                          masks: Optional[Dict[Tuple, np.ndarray]] = None) -> np.ndarray:
+        """Feathered uint8 mask of the rectangle [x0, x1) x [y0, y1), drawn once per `masks` cache"""
+        key = None
+        if masks is not None:
+            key = (self._mask_key(spec.mask), spec.blur, x0, y0, x1, y1)
+            if key in masks:
+                return masks[key]
+        mask = np.zeros((y1 - y0, x1 - x0), dtype=np.uint8)
+        self._draw_mask(mask, spec.mask, x0, y0)
+        mask = cv2.GaussianBlur(mask, (spec.blur, spec.blur), 0)
+        if key is not None:
+            masks[key] = mask
+        return mask
+    
+    def _mask_key(self, shape: Tuple) -> Tuple:
+        if shape[0] == "poly":
+            return ("poly", tuple(np.asarray(shape[1]).ravel().tolist()))
+        return tuple(shape)
+    
+    def _draw_mask(self, mask: np.ndarray, shape: Tuple, x0: int, y0: int) -> None:
+        """Draw a filled mask shape onto a canvas whose origin is (x0, y0)"""
+        kind = shape[0]
+        if kind == "ellipse":
+            (cx, cy), axes = shape[1], shape[2]
+            cv2.ellipse(mask, (int(cx - x0), int(cy - y0)), (int(axes[0]), int(axes[1])), 0, 0, 360, 255, -1)
+        elif kind == "poly":
+            points = (np.asarray(shape[1]) - [x0, y0]).astype(np.int32)
+            cv2.fillPoly(mask, [points], 255)
+        elif kind == "rect":
+            (ax, ay), (bx, by) = shape[1], shape[2]
+            cv2.rectangle(mask, (int(ax - x0), int(ay - y0)), (int(bx - x0), int(by - y0)), 255, -1)
+    
+    def _mask_bounds(self, shape: Tuple, blur: int, width: int, height: int) -> Tuple[int, int, int, int]:
+        """Bounding box (x0, y0, x1, y1) of a mask shape after feathering"""
+        kind = shape[0]
+        if kind == "ellipse":
+            (cx, cy), (ax, ay) = shape[1], shape[2]
+            x0, y0, x1, y1 = cx - ax, cy - ay, cx + ax + 1, cy + ay + 1
+        elif kind == "poly":
+            points = np.asarray(shape[1])
+            x0, y0 = points.min(axis=0)
+            x1, y1 = points.max(axis=0) + 1
+        else:
+            (ax, ay), (bx, by) = shape[1], shape[2]
+            x0, y0, x1, y1 = min(ax, bx), min(ay, by), max(ax, bx) + 1, max(ay, by) + 1
         
-        return str(output_path)
+        # Margin for the blur kernel plus a pixel of rasterization slack
+        pad = blur // 2 + 2
+        return (int(max(0, x0 - pad)), int(max(0, y0 - pad)),
+                int(min(width, x1 + pad)), int(min(height, y1 + pad)))
+    
+    def _strip_rows(self, strip_width: int) -> int:
+        """Rows per strip so one strip's temporaries fit the memory budget"""
+        return max(1, self.memory_budget_bytes // (max(1, strip_width) * STRIP_BYTES_PER_PIXEL))
     
     def create_face_mask(self, image: np.ndarray) -> np.ndarray:
         """Create a face mask for more precise editing"""
@@ -0,0 +1,199 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional
+
+import metrics
+
+CONTENT_TYPES = {
+    "jpg": "image/jpeg",
+    "png": "image/png",
+    "webp": "image/webp",
+    "gif": "image/gif",
+    "bmp": "image/bmp",
+    "tiff": "image/tiff",
+    "mp4": "video/mp4",
+}
+EXTENSIONS = {content_type: ext for ext, content_type in CONTENT_TYPES.items()}
+EXTENSIONS["image/jpg"] = "jpg"
+
+STORE_EVICTIONS = metrics.REGISTRY.counter(
+    "rhinovate_image_store_evictions_total",
+    "Objects removed from the image store",
+    ["tier", "reason"],
+)
+
+
+@dataclass
+class StoredImage:
+    data: bytes
+    content_type: str
+    created: float
+    key: str = ""
+
+
+class ImageStore:
+    """Content-addressed image blobs in a bounded memory tier with optional disk spill.
+    
+    Objects expire after `ttl_seconds`. When the memory tier is full the least
+    recently used objects move to the disk tier (if configured) or are dropped;
+    the disk tier is kept under its quota by a background sweeper.
+    """
+    
+    def __init__(self, memory_limit_bytes: int, ttl_seconds: float,
+                 spill_dir: Optional[str] = None, disk_quota_bytes: int = 0,
+                 sweep_interval: float = 60.0):
+        self.memory_limit_bytes = memory_limit_bytes
+        self.ttl_seconds = ttl_seconds
+        self.disk_quota_bytes = disk_quota_bytes
+        self.spill_dir = Path(spill_dir) if spill_dir else None
+        
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, StoredImage]" = OrderedDict()
+        self._memory_bytes = 0
+        # key -> (size, content_type, created); insertion order is spill order
+        self._disk: "OrderedDict[str, tuple]" = OrderedDict()
+        self._disk_bytes = 0
+        
+        if self.spill_dir is not None:
+            self.spill_dir.mkdir(parents=True, exist_ok=True)
+            # Spilled objects do not survive a restart - their index is in memory
+            for stale in self.spill_dir.glob("*.blob"):
+                stale.unlink(missing_ok=True)
+        
+        self._stop = threading.Event()
+        self._sweeper = threading.Thread(target=self._sweep_loop, args=(sweep_interval,),
+                                         name="image-store-sweeper", daemon=True)
+        self._sweeper.start()
+    
+    @staticmethod
+    def make_key(data: bytes, content_type: str) -> str:
+        """Unique ID for a blob: content hash plus a file extension"""
+        ext = EXTENSIONS.get(content_type, "bin")
+        return f"{hashlib.sha256(data).hexdigest()[:32]}.{ext}"
+    
+    def put(self, data: bytes, content_type: str) -> str:
+        """Store a blob and return its key; identical content shares one entry"""
+        key = self.make_key(data, content_type)
+        now = time.time()
+        spilled = []
+        with self._lock:
+            existing = self._memory.pop(key, None)
+            if existing is not None:
+                self._memory_bytes -= len(existing.data)
+            self._memory[key] = StoredImage(data, content_type, now, key)
+            self._memory_bytes += len(data)
+            
+            while self._memory_bytes > self.memory_limit_bytes and len(self._memory) > 1:
+                old_key, old = self._memory.popitem(last=False)
+                self._memory_bytes -= len(old.data)
+                spilled.append((old_key, old))
+        
+        for old_key, old in spilled:
+            self._spill(old_key, old)
+        return key
+    
+    def get(self, key: str) -> Optional[StoredImage]:
+        """Return a blob, or None if unknown or expired"""
+        now = time.time()
+        with self._lock:
+            item = self._memory.get(key)
+            if item is not None:
+                if now - item.created > self.ttl_seconds:
+                    self._memory.pop(key)
+                    self._memory_bytes -= len(item.data)
+                    STORE_EVICTIONS.inc(tier="memory", reason="expired")
+                    return None
+                self._memory.move_to_end(key)
+                return item
+            entry = self._disk.get(key)
+        
+        if entry is None:
+            return None
+        size, content_type, created = entry
+        if now - created > self.ttl_seconds:
+            self._drop_disk(key, "expired")
+            return None
+        try:
+            data = (self.spill_dir / f"{key}.blob").read_bytes()
+        except OSError:
+            self._drop_disk(key, "missing")
+            return None
+        return StoredImage(data, content_type, created, key)
+    
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "memory_objects": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "disk_objects": len(self._disk),
+                "disk_bytes": self._disk_bytes,
+            }
+    
+    def close(self) -> None:
+        self._stop.set()
+    
+    def _spill(self, key: str, item: StoredImage) -> None:
+        if self.spill_dir is None or self.disk_quota_bytes <= 0:
+            STORE_EVICTIONS.inc(tier="memory", reason="capacity")
+            return
+        try:
+            (self.spill_dir / f"{key}.blob").write_bytes(item.data)
+        except OSError:
+            STORE_EVICTIONS.inc(tier="memory", reason="spill_failed")
+            return
+        with self._lock:
+            previous = self._disk.pop(key, None)
+            if previous is not None:
+                self._disk_bytes -= previous[0]
+            self._disk[key] = (len(item.data), item.content_type, item.created)
+            self._disk_bytes += len(item.data)
+        STORE_EVICTIONS.inc(tier="memory", reason="spilled")
+    
+    def _drop_disk(self, key: str, reason: str) -> None:
+        with self._lock:
+            entry = self._disk.pop(key, None)
+            if entry is None:
+                return
+            self._disk_bytes -= entry[0]
+        (self.spill_dir / f"{key}.blob").unlink(missing_ok=True)
+        STORE_EVICTIONS.inc(tier="disk", reason=reason)
+    
+    def sweep(self) -> None:
+        """Drop expired objects from both tiers and enforce the disk quota"""
+        cutoff = time.time() - self.ttl_seconds
+        with self._lock:
+            expired = [key for key, item in self._memory.items() if item.created < cutoff]
+            for key in expired:
+                self._memory_bytes -= len(self._memory.pop(key).data)
+            expired_disk = [key for key, entry in self._disk.items() if entry[2] < cutoff]
+        for _ in expired:
+            STORE_EVICTIONS.inc(tier="memory", reason="expired")
+        for key in expired_disk:
+            self._drop_disk(key, "expired")
+        
+        while True:
+            with self._lock:
+                if self._disk_bytes <= self.disk_quota_bytes or not self._disk:
+                    break
+                oldest = next(iter(self._disk))
+            self._drop_disk(oldest, "quota")
+    
+    def _sweep_loop(self, interval: float) -> None:
+        while not self._stop.wait(interval):
+            self.sweep()
+
+
+def store_from_env() -> ImageStore:
+    """Build the image store from IMAGE_STORE_* environment variables"""
+    return ImageStore(
+        memory_limit_bytes=int(float(os.getenv("IMAGE_STORE_MEMORY_MB", "256")) * 1024 * 1024),
+        ttl_seconds=float(os.getenv("IMAGE_STORE_TTL_SECONDS", "3600")),
+        spill_dir=os.getenv("IMAGE_STORE_SPILL_DIR") or None,
+        disk_quota_bytes=int(float(os.getenv("IMAGE_STORE_DISK_QUOTA_MB", "1024")) * 1024 * 1024),
+        sweep_interval=float(os.getenv("IMAGE_STORE_SWEEP_SECONDS", "60")),
+    )
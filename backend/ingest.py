@@ -0,0 +1,116 @@
+import os
+from typing import Iterable, Optional
+
+from fastapi import HTTPException
+from starlette.responses import JSONResponse
+
+import decoding
+import metrics
+
+MAX_UPLOAD_BYTES = int(float(os.getenv("MAX_UPLOAD_MB", "20")) * 1024 * 1024)
+MAX_IMAGE_PIXELS = int(float(os.getenv("MAX_IMAGE_MEGAPIXELS", "50")) * 1_000_000)
+# Room for multipart boundaries and part headers around the file itself
+MULTIPART_OVERHEAD = 64 * 1024
+
+UPLOAD_REJECTIONS = metrics.REGISTRY.counter(
+    "rhinovate_upload_rejections_total",
+    "Uploads rejected before decoding",
+    ["reason"],
+)
+
+
+class UploadRejected(ValueError):
+    """An upload that must not reach the decoder, with the HTTP status to answer with"""
+
+    def __init__(self, status_code: int, detail: str, reason: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.reason = reason
+        UPLOAD_REJECTIONS.inc(reason=reason)
+
+
+def sniff_format(head: bytes) -> Optional[str]:
+    """Identify a supported image format from its magic bytes"""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "JPEG"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "PNG"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "WEBP"
+    return None
+
+
+def validate(data: bytes) -> decoding.ImageHeader:
+    """Check an upload's size, format and pixel dimensions without decoding it"""
+    if len(data) > MAX_UPLOAD_BYTES:
+        raise UploadRejected(413, f"File is larger than {MAX_UPLOAD_BYTES // (1024 * 1024)} MB", "too_large")
+    if sniff_format(data[:16]) is None:
+        raise UploadRejected(415, "Unsupported image format, expected JPEG, PNG or WebP", "unsupported_format")
+
+    try:
+        header = decoding.read_header(data)
+    except decoding.TooManyPixels:
+        raise UploadRejected(
+            413, f"Image has more than {MAX_IMAGE_PIXELS / 1e6:.0f} megapixels", "too_many_pixels"
+        )
+    if header is None:
+        raise UploadRejected(400, "Could not read image header", "bad_header")
+    if header.width <= 0 or header.height <= 0:
+        raise UploadRejected(400, "Image has no pixels", "bad_header")
+    if header.width * header.height > MAX_IMAGE_PIXELS:
+        raise UploadRejected(
+            413,
+            f"Image is {header.width}x{header.height}; at most {MAX_IMAGE_PIXELS / 1e6:.0f} megapixels are accepted",
+            "too_many_pixels",
+        )
+    return header
+
+
+class UploadLimitMiddleware:
+    """Reject request bodies over a byte limit on upload routes while they stream in.
+
+    A declared Content-Length over the limit is answered with 413 before any of
+    the body is read; otherwise bytes are counted as they arrive and the request
+    fails with 413 as soon as the limit is crossed.
+    """
+
+    def __init__(self, app, paths: Iterable[str], max_bytes: int = MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD):
+        self.app = app
+        self.paths = set(paths)
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None:
+            try:
+                too_large = int(content_length) > self.max_bytes
+            except ValueError:
+                response = JSONResponse({"detail": "Invalid Content-Length"}, status_code=400)
+                await response(scope, receive, send)
+                return
+            if too_large:
+                UPLOAD_REJECTIONS.inc(reason="too_large")
+                response = JSONResponse({"detail": self._detail()}, status_code=413)
+                await response(scope, receive, send)
+                return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    UPLOAD_REJECTIONS.inc(reason="too_large")
+                    raise HTTPException(status_code=413, detail=self._detail())
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+    def _detail(self) -> str:
+        return f"Upload is larger than {MAX_UPLOAD_BYTES // (1024 * 1024)} MB"
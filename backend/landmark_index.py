@@ -0,0 +1,135 @@
+import itertools
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+import cv2
+import numpy as np
+
+import metrics
+from metrics import stage
+
+LANDMARK_INDEX_SIZE = int(os.getenv("LANDMARK_INDEX_SIZE", "1024"))
+# Hamming distance between 64-bit dHashes still considered the same photo
+LANDMARK_INDEX_MAX_DISTANCE = int(os.getenv("LANDMARK_INDEX_MAX_DISTANCE", "6"))
+# Largest mean difference of any 4x4 block of the normalized verification
+# thumbnails; recompression and resizing stay well below it, edits do not
+LANDMARK_INDEX_MAX_DIFFERENCE = float(os.getenv("LANDMARK_INDEX_MAX_DIFFERENCE", "0.1"))
+
+THUMBNAIL_SIDE = 128
+BLOCK = 4
+ASPECT_TOLERANCE = 0.01
+
+INDEX_LOOKUPS = metrics.REGISTRY.counter(
+    "rhinovate_landmark_index_lookups_total",
+    "Near-duplicate lookups before the face mesh: hit, miss, or rejected by verification",
+    ["result"],
+)
+
+
+@dataclass
+class Fingerprint:
+    """Perceptual identity of a decoded frame"""
+    dhash: int          # 64-bit difference hash of a 9x8 grayscale thumbnail
+    aspect: float       # width / height
+    thumbnail: np.ndarray  # uint8 grayscale, longest side THUMBNAIL_SIDE, for verification
+
+
+@dataclass
+class _Entry:
+    fingerprint: Fingerprint
+    landmarks: np.ndarray
+
+
+def fingerprint(image: np.ndarray) -> Fingerprint:
+    """dHash plus verification thumbnail of a BGR frame"""
+    height, width = image.shape[:2]
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    tiny = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (tiny[:, 1:] > tiny[:, :-1]).ravel()
+    dhash = int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+    scale = THUMBNAIL_SIDE / max(height, width)
+    size = (max(BLOCK, round(width * scale)), max(BLOCK, round(height * scale)))
+    thumbnail = cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+    return Fingerprint(dhash, width / height, thumbnail)
+
+
+def _normalized(thumbnail: np.ndarray) -> np.ndarray:
+    values = thumbnail.astype(np.float32)
+    return (values - values.mean()) / (values.std() + 1e-6)
+
+
+def block_difference(a: np.ndarray, b: np.ndarray) -> float:
+    """Worst mean absolute difference over BLOCK x BLOCK tiles of two normalized thumbnails.
+
+    A global similarity score cannot tell a recompressed copy from an edited
+    one, since the edits are local; the worst tile can.
+    """
+    if a.shape != b.shape:
+        b = cv2.resize(b, (a.shape[1], a.shape[0]), interpolation=cv2.INTER_AREA)
+    diff = np.abs(_normalized(a) - _normalized(b))
+    rows, cols = diff.shape[0] // BLOCK * BLOCK, diff.shape[1] // BLOCK * BLOCK
+    tiles = diff[:rows, :cols].reshape(rows // BLOCK, BLOCK, cols // BLOCK, BLOCK)
+    return float(tiles.mean(axis=(1, 3)).max())
+
+
+class LandmarkIndex:
+    """Face landmarks of recently analyzed photos, found again by perceptual hash.
+
+    Landmarks are stored normalized to [0, 1], so a match at a different
+    resolution only needs its measurements recomputed on the new shape.
+    Candidates within `max_distance` dHash bits and the same aspect ratio are
+    verified on their thumbnails before their landmarks are reused.
+    """
+
+    def __init__(self, capacity: int = LANDMARK_INDEX_SIZE, max_distance: int = LANDMARK_INDEX_MAX_DISTANCE,
+                 max_difference: float = LANDMARK_INDEX_MAX_DIFFERENCE):
+        self.capacity = capacity
+        self.max_distance = max_distance
+        self.max_difference = max_difference
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._keys = itertools.count()
+
+    def lookup(self, fp: Fingerprint) -> Optional[np.ndarray]:
+        """Landmarks of a verified near-duplicate of `fp`, or None"""
+        with stage("dedup"):
+            with self._lock:
+                candidates = [
+                    (bin(entry.fingerprint.dhash ^ fp.dhash).count("1"), key, entry)
+                    for key, entry in self._entries.items()
+                    if abs(entry.fingerprint.aspect / fp.aspect - 1) <= ASPECT_TOLERANCE
+                ]
+            candidates = sorted((c for c in candidates if c[0] <= self.max_distance), key=lambda c: c[0])
+            if not candidates:
+                INDEX_LOOKUPS.inc(result="miss")
+                return None
+
+            for _, key, entry in candidates:
+                if block_difference(entry.fingerprint.thumbnail, fp.thumbnail) <= self.max_difference:
+                    with self._lock:
+                        if key in self._entries:
+                            self._entries.move_to_end(key)
+                    INDEX_LOOKUPS.inc(result="hit")
+                    return entry.landmarks.copy()
+            INDEX_LOOKUPS.inc(result="rejected")
+            return None
+
+    def add(self, fp: Fingerprint, landmarks: np.ndarray) -> None:
+        with self._lock:
+            self._entries[next(self._keys)] = _Entry(fp, landmarks.copy())
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def index_from_env() -> Optional[LandmarkIndex]:
+    """The index configured by LANDMARK_INDEX_* environment variables; size 0 disables it"""
+    if LANDMARK_INDEX_SIZE <= 0:
+        return None
+    return LandmarkIndex()
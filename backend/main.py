@@ -1,17 +1,34 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, Header, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import JSONResponse, PlainTextResponse, RedirectResponse, Response
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, Optional, Tuple
+import asyncio
 import uvicorn
 import os
-import tempfile
-import shutil
-from pathlib import Path
+import time
 
-from face_analysis import FaceAnalyzer
-from beauty_rules import BeautyRulesEngine
-from image_processor import ImageProcessor
+import analytics
+from face_analysis import LANDMARK_COUNTS, FaceAnalyzer, mesh_model_for, parse_measurements
+from beauty_rules import BeautyRulesEngine, parse_intensities
+import bundles
+import coalescing
+import deadlines
+from compute_pool import COMPUTE_WORKERS, pool_from_env
+import decoding
+import execution
+import http_caching
+import scheduling
+from image_processor import OUTPUT_FORMATS, REDUCED_QUALITY, ImageProcessor, parse_quality
+from image_store import store_from_env
+import landmark_index
+from render_cache import RenderCache
+import render_service
+import diagnostics
+import ingest
+import metrics
+import profiling
+from metrics import stage
 
 app = FastAPI(title="Rhinovate AI", version="1.0.0")
 
@@ -23,17 +40,94 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Refuse oversized uploads while they stream in, before the form is parsed
+app.add_middleware(ingest.UploadLimitMiddleware, paths=["/analyze"])
+
+# Abandon a request's work once its deadline passes or its client disconnects
+app.add_middleware(deadlines.DeadlineMiddleware)
+
+@app.middleware("http")
+async def record_request_timings(request: Request, call_next):
+    """Collect per-stage timings for the request and expose them via Server-Timing"""
+    timings = metrics.RequestTimings()
+    token = metrics.bind_timings(timings)
+    profile = profiling.start_request(request.url.path)
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        profiling.finish_request(profile)
+        metrics.unbind_timings(token)
+    elapsed = time.perf_counter() - start
+    
+    if timings.stages:
+        response.headers["Server-Timing"] = timings.server_timing_header() + f", total;dur={elapsed * 1000:.1f}"
+    if metrics.METRICS_ENABLED:
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        if route != "/metrics":
+            timings.observe()
+            metrics.REQUEST_SECONDS.observe(elapsed, route=route, status=response.status_code)
+    return response
+
+@app.exception_handler(deadlines.Cancelled)
+async def abandoned_request(request: Request, exc: deadlines.Cancelled):
+    return JSONResponse(status_code=exc.status_code, content={"detail": str(exc)})
+
+# Split the available cores between concurrent requests and the libraries inside each one
+execution_plan = execution.plan_from_env(COMPUTE_WORKERS)
+execution.apply(execution_plan)
+pipeline = execution.PipelineExecutor(execution_plan.request_workers)
+# Interactive requests and every client get their share of the pipeline workers
+scheduler = scheduling.FairScheduler(pipeline)
+
 # Initialize components
 face_analyzer = FaceAnalyzer()
 beauty_engine = BeautyRulesEngine()
-image_processor = ImageProcessor()
+image_processor = ImageProcessor(encode_threads=execution_plan.fanout_threads)
+
+# Optional worker processes that analyze and render frames in shared memory
+compute_pool = pool_from_env(face_analyzer, image_processor, execution_plan)
+# Or separate render worker services on this and other hosts, which take precedence
+render_workers = render_service.client_from_env(face_analyzer, image_processor)
+compute = render_workers or compute_pool
+analyzer = compute or face_analyzer
+
+@app.on_event("shutdown")
+def stop_compute_pool():
+    if compute_pool is not None:
+        compute_pool.close()
+    if render_workers is not None:
+        render_workers.close()
+
+# Every analysis is queued for product analytics and written in batches off the request path
+analytics_sink = analytics.sink_from_env()
+
+@app.on_event("shutdown")
+def flush_analytics():
+    if analytics_sink is not None:
+        analytics_sink.close()
+
+# Landmarks of recent photos, reused when the same photo comes back recompressed or resized
+landmark_cache = landmark_index.index_from_env()
 
-# Create uploads directory
-UPLOAD_DIR = Path("uploads")
-UPLOAD_DIR.mkdir(exist_ok=True)
+# Identical uploads with identical options that arrive while one is being analyzed share its result
+analyze_flights = coalescing.SingleFlight("/analyze")
 
-# Mount static files
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+# /render and /morph redirects are cached briefly; the /images URLs they point at forever
+RENDER_REDIRECT_MAX_AGE = int(os.getenv("RENDER_REDIRECT_MAX_AGE", "300"))
+
+# Before/after images live in a bounded, expiring store instead of on disk
+image_store = store_from_env()
+render_cache = RenderCache(image_store, image_processor, renderer=compute)
+
+class IntensityVariant(BaseModel):
+    intensity: str
+    facial_harmony_score: int
+    recommendations: List[str]
+    operations: List[dict]
+    after_url: Optional[str] = None
+    preview_url: Optional[str] = None
+    render_id: Optional[str] = None
 
 class AnalyzeResponse(BaseModel):
     symmetry_score: float
@@ -43,74 +137,309 @@ class AnalyzeResponse(BaseModel):
     operations: List[dict]
     before_url: Optional[str] = None
     after_url: Optional[str] = None
+    preview_url: Optional[str] = None
+    render_id: Optional[str] = None
+    variants: Optional[List[IntensityVariant]] = None
+    diagnostics: Optional[dict] = None
 
 class HealthResponse(BaseModel):
     status: str
     message: str
 
+def request_origin(request: Request) -> Tuple[str, str]:
+    """Client key and request class for the scheduler; X-Client-ID and X-Request-Class count only from trusted peers"""
+    peer = request.client.host if request.client else "unknown"
+    return scheduler.origin(peer, request.headers.get("x-client-id"), request.headers.get("x-request-class"))
+
 @app.get("/health", response_model=HealthResponse)
 async def health_check():
     return HealthResponse(status="healthy", message="Rhinovate AI is running")
 
-@app.post("/analyze", response_model=AnalyzeResponse)
-async def analyze_face(file: UploadFile = File(...)):
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    if not metrics.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/admin/profiles")
+async def profile_summary(x_admin_token: Optional[str] = Header(None)):
+    """Per-stage memory statistics, worst stages and sampled CPU profiles"""
+    admin_token = os.getenv("ADMIN_TOKEN")
+    if not admin_token:
+        # Profiles name stages and allocation sites; without a token the endpoint does not exist
+        raise HTTPException(status_code=404, detail="Not Found")
+    if x_admin_token != admin_token:
+        raise HTTPException(status_code=403, detail="Admin token required")
+    return profiling.AGGREGATOR.summary()
+
+@app.get("/images/{key}")
+async def get_image(key: str, if_none_match: Optional[str] = Header(None), range_header: Optional[str] = Header(None, alias="Range"),
+                    if_range: Optional[str] = Header(None)):
+    """Serve a stored image, render or animation by its content-hashed key.
+    
+    The key is the content, so responses are immutable: browsers and CDNs may
+    cache them for good, revalidate with If-None-Match, and fetch byte ranges.
+    """
+    item = image_store.get(key)
+    if item is None:
+        raise HTTPException(status_code=404, detail="Image not found or expired")
+    return http_caching.immutable_response(item.data, item.content_type, key, if_none_match, range_header, if_range)
+
+def redirect_to_stored(item, headers=None):
+    """Send the client to the content-hashed URL of a render so caches key on its bytes"""
+    headers = {"Cache-Control": f"public, max-age={RENDER_REDIRECT_MAX_AGE}", **(headers or {})}
+    return RedirectResponse(f"/images/{item.key}", status_code=302, headers=headers)
+
+@app.get("/render/{render_id}")
+async def get_render(request: Request, render_id: str, variant: str = Query("full"), format: Optional[str] = Query(None),
+                     quality: str = Query("standard"), accept: Optional[str] = Header(None)):
+    """After image for an analysis, rendered on first request.
+    
+    `variant` is a configured name (thumbnail, preview, full) or a pixel count;
+    the encoding comes from `format` or else the Accept header. `quality` is
+    draft, standard or high. Redirects to the render's immutable /images URL.
+    """
     try:
-        # Validate file type
-        if not file.content_type.startswith("image/"):
-            raise HTTPException(status_code=400, detail="File must be an image")
-        
-        # Save uploaded file
-        file_path = UPLOAD_DIR / f"temp_{file.filename}"
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
+        fmt = render_cache.choose_format(format, accept)
+        work = scheduler.run(*request_origin(request), render_cache.get, render_id, variant, fmt, quality)
+        item = await deadlines.until_abandoned(work)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if item is None:
+        raise HTTPException(status_code=404, detail="Render not found or expired")
+    return redirect_to_stored(item, {} if format else {"Vary": "Accept"})
+
+@app.get("/morph/{render_id}")
+async def get_morph(request: Request, render_id: str, format: str = Query("gif"), variant: str = Query("preview"),
+                    frames: int = Query(30), fps: int = Query(15)):
+    """Before->after animation (gif, webp or mp4) for an analysis, generated on first request.
+    
+    Redirects to the animation's immutable /images URL, which supports byte ranges for video players.
+    """
+    try:
+        work = scheduler.run(*request_origin(request), render_cache.morph, render_id, variant, format, frames, fps)
+        item = await deadlines.until_abandoned(work)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if item is None:
+        raise HTTPException(status_code=404, detail="Render not found or expired")
+    return redirect_to_stored(item)
+
+def find_landmarks(image, full_shape, model: str):
+    """Landmarks and measurements from the `model` mesh, reusing a verified near-duplicate's landmarks instead"""
+    if landmark_cache is None:
+        return analyzer.analyze_image(image, full_shape, model)
+    with stage("fingerprint"):
+        fingerprint = landmark_index.fingerprint(image)
+    landmarks = landmark_cache.lookup(fingerprint)
+    # Landmarks from the base mesh lack the iris points a refined request reads
+    if landmarks is not None and len(landmarks) >= LANDMARK_COUNTS[model]:
+        return landmarks, face_analyzer.measure(landmarks, full_shape)
+    landmarks, measurements = analyzer.analyze_image(image, full_shape, model)
+    if landmarks is not None:
+        landmark_cache.add(fingerprint, landmarks)
+    return landmarks, measurements
+
+def run_analysis(data: bytes, header: decoding.ImageHeader, content_type: str,
+                 report: diagnostics.RenderDiagnostics, quality: str, delivery: str, bundle_variant: str,
+                 bundle_side: Optional[int], bundle_format: str, include_before: bool, levels: List[str], mesh_model: str):
+    """The blocking part of /analyze, from decoding the vetted upload to the response"""
+    # The face mesh only needs a reduced decode
+    with stage("decode"):
+        image = decoding.decode(data, decoding.ANALYZE_MAX_SIDE, header)
+    if image is None:
+        raise HTTPException(status_code=400, detail="Could not decode image")
+    full_shape = header.shape
+    
+    with profiling.sampled_cpu_profile("analyze"):
         # 1. Analyze face and get measurements
-        landmarks, measurements = face_analyzer.analyze_face(str(file_path))
+        deadlines.check("analyze_face")
+        with profiling.section("analyze_face"):
+            landmarks, measurements = find_landmarks(image, full_shape, mesh_model)
         
         if landmarks is None:
             raise HTTPException(status_code=400, detail="No face detected in image")
         
         # 2. Apply beauty rules to get recommendations
-        operations = beauty_engine.plan_changes(measurements)
-        recommendations = beauty_engine.get_readable_recommendations(operations)
-        
-        # 3. Calculate facial harmony score (0-100) - comprehensive scoring
-        facial_harmony_score = beauty_engine.calculate_harmony_score(measurements, operations)
-        
-        # 4. Generate edited image
-        after_path = None
-        if operations:
-            after_path = image_processor.apply_operations(str(file_path), operations)
-            if after_path:
-                after_url = f"/uploads/{Path(after_path).name}"
-            else:
-                after_url = None
+        deadlines.check("plan")
+        with stage("plan"):
+            operations = beauty_engine.plan_changes(measurements)
+            recommendations = beauty_engine.get_readable_recommendations(operations)
+            
+            # 3. Calculate facial harmony score (0-100) - comprehensive scoring
+            facial_harmony_score = beauty_engine.calculate_harmony_score(measurements, operations)
+            
+            plans = beauty_engine.plan_variants(measurements, levels) if levels else {}
+    
+    # 4. Keep the original upload bytes for the before URL
+    deadlines.check("store")
+    with stage("store"):
+        before_key = image_store.put(data, content_type)
+    before_url = f"/images/{before_key}"
+    
+    # 5. The edited image is rendered on demand by /render as the variant the client asks for
+    render_id = after_url = preview_url = None
+    if operations:
+        render_id = render_cache.register(before_key, operations)
+        after_url = f"/render/{render_id}?variant=full&quality={quality}"
+        preview_url = f"/render/{render_id}?variant=preview&quality={quality}"
+        if report.enabled:
+            # Diagnostics describe a full-resolution render, so run one now
+            with profiling.section("render"):
+                with stage("decode"):
+                    image = decoding.decode(data, header=header)
+                image_processor.render(image, operations, quality, plan_shape=full_shape)
+    
+    # Intensity levels render together at the size the client will show first
+    variants = None
+    if plans:
+        variant_ids = render_cache.render_group(
+            before_key, plans, bundle_variant if delivery != "json" else "preview",
+            bundle_format if delivery != "json" else "jpeg", quality)
+        variants = []
+        for level, level_operations in plans.items():
+            level_id = variant_ids.get(level)
+            variants.append(IntensityVariant(
+                intensity=level,
+                facial_harmony_score=beauty_engine.calculate_harmony_score(measurements, level_operations),
+                recommendations=beauty_engine.get_readable_recommendations(level_operations),
+                operations=level_operations,
+                after_url=f"/render/{level_id}?variant=full&quality={quality}" if level_id else None,
+                preview_url=f"/render/{level_id}?variant=preview&quality={quality}" if level_id else None,
+                render_id=level_id,
+            ))
+    
+    result = AnalyzeResponse(
+        symmetry_score=measurements["symmetry_score"],
+        facial_harmony_score=facial_harmony_score,
+        measurements=measurements,
+        recommendations=recommendations,
+        operations=operations,
+        before_url=before_url,
+        after_url=after_url,
+        preview_url=preview_url,
+        render_id=render_id,
+        variants=variants,
+        diagnostics=report.to_dict() if report.enabled else None
+    )
+    if analytics_sink is not None:
+        timings = metrics.current_timings()
+        analytics_sink.record(
+            source_key=before_key, quality=quality, intensities=levels,
+            symmetry_score=measurements["symmetry_score"], facial_harmony_score=facial_harmony_score,
+            measurements=measurements, operations=operations,
+            variants={item.intensity: item.facial_harmony_score for item in variants or []},
+            timings=list(timings.stages) if timings is not None else None,
+        )
+    if delivery == "json":
+        return result
+    
+    # 6. Bundle the analysis with the images so the client needs no further requests
+    deadlines.check("bundle")
+    parts = [("analysis", "application/json", bundles.dumps_json(result.model_dump(mode="json")))]
+    renders = [("after", render_id)] + [(f"after_{item.intensity}", item.render_id) for item in variants or []]
+    for name, part_id in renders:
+        if not part_id:
+            continue
+        after = render_cache.get(part_id, bundle_variant, bundle_format, quality)
+        if after is None:
+            # The upload was evicted since it was registered; keys are content hashes, so storing it again restores it
+            image_store.put(data, content_type)
+            after = render_cache.get(part_id, bundle_variant, bundle_format, quality)
+        if after is None:
+            # The render handle itself was evicted; answer with the analysis alone rather than fail
+            return result
+        parts.append((name, after.content_type, after.data))
+    if include_before:
+        if bundle_side is None:
+            parts.append(("before", content_type, data))
         else:
-            after_url = None
-        
-        # 5. Generate before URL
-        before_url = f"/uploads/{file_path.name}"
+            with stage("decode"):
+                before = image_processor.downscale(decoding.decode(data, bundle_side, header), bundle_side)
+            encoded = image_processor.encode(before, bundle_format, REDUCED_QUALITY)
+            parts.append(("before", OUTPUT_FORMATS[bundle_format][1], encoded))
+    with stage("bundle"):
+        body, bundle_type = bundles.encode_bundle(delivery, parts)
+    return Response(content=body, media_type=bundle_type)
+
+@app.post("/analyze", response_model=AnalyzeResponse)
+async def analyze_face(request: Request, file: UploadFile = File(...), diagnostics_level: Optional[str] = Query(None, alias="diagnostics"),
+                       quality: Optional[str] = Query(None), delivery: str = Query("json"),
+                       bundle_variant: str = Query("preview"), bundle_format: str = Query("jpeg"),
+                       include_before: bool = Query(False), intensities: Optional[str] = Query(None),
+                       measurements: Optional[str] = Query(None)):
+    """Analyze a face photo.
+    
+    `delivery=multipart|binary` returns the analysis JSON together with the
+    after image (and optionally the before image) in a single response.
+    `intensities=conservative,moderate,aggressive` (or `all`) also plans and
+    renders those intensity levels side by side from the same analysis.
+    `measurements=ipd,facial_thirds` names the measurements the client needs,
+    so the face mesh can run on the lightest graph that covers them.
+    Bulk clients should send `X-Request-Class: batch`.
+    """
+    try:
+        level = diagnostics.parse_level(diagnostics_level, diagnostics.DEFAULT_LEVEL)
+        quality = parse_quality(quality)
+        delivery = bundles.parse_delivery(delivery)
+        bundle_side = None
+        if delivery != "json":
+            bundle_side = render_cache.parse_variant(bundle_variant)
+            bundle_format = render_cache.choose_format(bundle_format, None)
+        levels = parse_intensities(intensities)
+        mesh_model = mesh_model_for(parse_measurements(measurements))
+        origin = request_origin(request)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    report = diagnostics.RenderDiagnostics(level)
+    diagnostics_token = diagnostics.bind_diagnostics(report)
+    
+    try:
+        # Validate file type
+        if not file.content_type.startswith("image/"):
+            raise HTTPException(status_code=400, detail="File must be an image")
         
-        # Clean up temp file
-        if after_path and after_path != str(file_path):
-            os.rename(str(file_path), str(UPLOAD_DIR / f"before_{file.filename}"))
-            before_url = f"/uploads/before_{file.filename}"
+        # Read and vet the upload here, so a rejected file never hashes, queues or takes a worker;
+        # decoding, analysis and rendering run on the pipeline pool
+        with stage("upload_read"):
+            data = await file.read()
+        with stage("validate"):
+            header = ingest.validate(data)
+        args = (data, header, file.content_type, report, quality, delivery, bundle_variant, bundle_side, bundle_format,
+                include_before, levels, mesh_model)
+        if report.enabled or not coalescing.COALESCE_REQUESTS:
+            # A diagnostics report describes the request's own run
+            return await deadlines.until_abandoned(scheduler.run(*origin, run_analysis, *args))
         
-        return AnalyzeResponse(
-            symmetry_score=measurements["symmetry_score"],
-            facial_harmony_score=facial_harmony_score,
-            measurements=measurements,
-            recommendations=recommendations,
-            operations=operations,
-            before_url=before_url,
-            after_url=after_url
-        )
+        async def shared_analysis():
+            # The run serves every duplicate, so it keeps the server's deadline rather than the first
+            # caller's and is abandoned only once all of them have gone
+            deadline = deadlines.Deadline(deadlines.REQUEST_DEADLINE_SECONDS or None)
+            deadlines.bind_deadline(deadline)
+            try:
+                return await scheduler.run(*origin, run_analysis, *args)
+            except asyncio.CancelledError:
+                deadline.cancel("abandoned")
+                raise
         
+        with stage("content_hash"):
+            key = coalescing.request_key(data, file.content_type, quality, delivery, bundle_variant, bundle_side,
+                                         bundle_format, include_before, levels, mesh_model)
+        deadlines.check("shared_analysis")
+        result = await deadlines.until_abandoned(analyze_flights.run(key, shared_analysis))
+        if isinstance(result, Response):
+            # Each caller gets its own response object; middleware adds per-request headers
+            return Response(content=result.body, media_type=result.media_type)
+        return result
+    
+    except (HTTPException, deadlines.Cancelled):
+        raise
+    except ingest.UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
-        # Clean up on error
-        if 'file_path' in locals() and file_path.exists():
-            file_path.unlink()
         raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
+    finally:
+        diagnostics.unbind_diagnostics(diagnostics_token)
 
 if __name__ == "__main__":
     port = int(os.getenv("PORT", 8000))
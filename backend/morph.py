@@ -0,0 +1,237 @@
+import io
+import math
+import os
+import tempfile
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+from PIL import GifImagePlugin, Image
+
+import deadlines
+from image_processor import ImageProcessor, MirrorSpec, WarpSpec
+from metrics import stage
+
+# Animation encodings and their content types
+MORPH_FORMATS = {
+    "gif": "image/gif",
+    "webp": "image/webp",
+    "mp4": "video/mp4",
+}
+MORPH_MAX_SIDE = int(os.getenv("MORPH_MAX_SIDE", "720"))
+MORPH_MAX_FRAMES = int(os.getenv("MORPH_MAX_FRAMES", "120"))
+DEFAULT_FRAMES = 30
+DEFAULT_FPS = 15
+
+# Displacements below this many pixels are treated as untouched
+_MIN_DISPLACEMENT = 1e-3
+
+
+@dataclass
+class Deformation:
+    """The combined effect of a plan on one frame, ready to interpolate.
+
+    `dx`/`dy` hold the full displacement of the sampling grid inside `roi`
+    (x0, y0, x1, y1); frame t samples at grid + t * displacement. Mirror
+    blends are not geometric, so their result is kept as `mirrored` and
+    cross-faded in with the same t.
+    """
+    frame: np.ndarray
+    roi: Optional[Tuple[int, int, int, int]]
+    dx: Optional[np.ndarray]
+    dy: Optional[np.ndarray]
+    mirrored: Optional[np.ndarray]
+
+
+class MorphGenerator:
+    """Before->after animations from a single deformation of the before frame.
+
+    The planned warps are composed into one displacement field once; each
+    frame is then a single remap with the field scaled by an eased t. Frames
+    are resampled on the processor's shared encode pool (cv2.remap releases
+    the GIL) and handed to the encoder in order, with at most a small window
+    of them in flight.
+    """
+
+    def __init__(self, processor: ImageProcessor):
+        self.processor = processor
+        self.pool = processor.encode_pool
+        self.window = 2 * processor.encode_threads
+
+    def generate(self, image: np.ndarray, operations: List[Dict[str, Any]], fmt: str = "gif",
+                 frames: int = DEFAULT_FRAMES, fps: int = DEFAULT_FPS,
+                 plan_shape: Optional[Tuple[int, ...]] = None) -> bytes:
+        """Encode a `frames`-long morph of `image` into the plan's result as `fmt`"""
+        if fmt not in MORPH_FORMATS:
+            raise ValueError(f"Unknown morph format '{fmt}', expected one of {list(MORPH_FORMATS)}")
+        if not 2 <= frames <= MORPH_MAX_FRAMES:
+            raise ValueError(f"Morph frames must be between 2 and {MORPH_MAX_FRAMES}")
+        if not 1 <= fps <= 60:
+            raise ValueError("Morph fps must be between 1 and 60")
+
+        if fmt == "mp4":
+            # Most H.264/MPEG-4 decoders reject odd frame sizes
+            height, width = image.shape[:2]
+            image = image[:height - height % 2, :width - width % 2]
+        with stage("morph_plan"):
+            deformation = self.deform(image, operations, plan_shape)
+        with stage("morph_frames"):
+            if fmt == "mp4":
+                return self._encode_mp4(self._frames(deformation, frames), image.shape, fps)
+            finish = _to_pillow
+            if fmt == "gif":
+                # One palette for the whole animation: frames quantize in the
+                # pool threads and unchanged pixels stay identical between frames
+                palette = self._palette(deformation)
+                finish = lambda frame: _to_pillow(frame).quantize(palette=palette, dither=Image.Dither.NONE)
+            if fmt == "gif":
+                return self._encode_gif(self._frames(deformation, frames, finish), fps)
+            return self._encode_pillow(self._frames(deformation, frames, finish), fmt, fps)
+
+    def deform(self, image: np.ndarray, operations: List[Dict[str, Any]],
+               plan_shape: Optional[Tuple[int, ...]] = None) -> Deformation:
+        """Compose the plan's warps into one displacement field over `image`.
+
+        Operations render in order, so output pixel p samples op 1 at
+        s_1(s_2(...s_n(p))), where s_i(p) = p + m_i(p) * strength_i * (A_i p - p)
+        for op i's inverse matrix A_i and feathered mask m_i. At full mask
+        weight this is the op's own warp; in the feathered edge the
+        displacement tapers off rather than cross-fading two images, which
+        is what makes the in-between frames move instead of dissolve.
+        """
+        height, width = image.shape[:2]
+        specs = self.processor.plan(operations, image.shape, plan_shape)
+        warps = [spec for spec in specs if isinstance(spec, WarpSpec)]
+
+        mirrored = None
+        for spec in specs:
+            if isinstance(spec, MirrorSpec):
+                mirrored = self.processor.render_spec(image if mirrored is None else mirrored, spec)
+
+        if not warps:
+            return Deformation(image, None, None, None, mirrored)
+
+        grid_x, grid_y = np.meshgrid(np.arange(width, dtype=np.float32), np.arange(height, dtype=np.float32))
+        map_x, map_y = grid_x.copy(), grid_y.copy()
+        for spec in reversed(warps):
+            inverse = np.linalg.inv(np.asarray(spec.matrix, dtype=np.float64)).astype(np.float32)
+            mask = self.processor.feathered_mask(spec, image.shape).astype(np.float32) * (spec.strength / 255.0)
+            # The mask is evaluated where the later ops already moved the sample
+            weight = cv2.remap(mask, map_x, map_y, cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT)
+            w = inverse[2, 0] * map_x + inverse[2, 1] * map_y + inverse[2, 2]
+            target_x = (inverse[0, 0] * map_x + inverse[0, 1] * map_y + inverse[0, 2]) / w
+            target_y = (inverse[1, 0] * map_x + inverse[1, 1] * map_y + inverse[1, 2]) / w
+            map_x += weight * (target_x - map_x)
+            map_y += weight * (target_y - map_y)
+
+        dx, dy = map_x - grid_x, map_y - grid_y
+        rows, cols = np.nonzero((np.abs(dx) > _MIN_DISPLACEMENT) | (np.abs(dy) > _MIN_DISPLACEMENT))
+        if rows.size == 0:
+            return Deformation(image, None, None, None, mirrored)
+        x0, y0, x1, y1 = int(cols.min()), int(rows.min()), int(cols.max()) + 1, int(rows.max()) + 1
+        return Deformation(image, (x0, y0, x1, y1), dx[y0:y1, x0:x1].copy(), dy[y0:y1, x0:x1].copy(), mirrored)
+
+    def frame(self, deformation: Deformation, t: float) -> np.ndarray:
+        """The morph at t in [0, 1]: 0 is the before frame, 1 the full plan"""
+        source = deformation.frame
+        if deformation.mirrored is not None:
+            source = cv2.addWeighted(source, 1.0 - t, deformation.mirrored, t, 0)
+        if deformation.roi is None:
+            return source if source is not deformation.frame else source.copy()
+
+        x0, y0, x1, y1 = deformation.roi
+        map_x = np.arange(x0, x1, dtype=np.float32)[np.newaxis, :] + np.float32(t) * deformation.dx
+        map_y = np.arange(y0, y1, dtype=np.float32)[:, np.newaxis] + np.float32(t) * deformation.dy
+        region = cv2.remap(source, map_x, map_y, cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+        result = source.copy() if source is deformation.frame else source
+        result[y0:y1, x0:x1] = region
+        return result
+
+    def _frames(self, deformation: Deformation, count: int,
+                finish: Optional[Callable[[np.ndarray], Any]] = None) -> Iterator[Any]:
+        """Frames in order, resampled (and passed through `finish`) ahead by the pool,
+        but never more than a window at a time"""
+        def produce(t: float):
+            frame = self.frame(deformation, t)
+            return finish(frame) if finish is not None else frame
+
+        pending = deque()
+        try:
+            for i in range(count):
+                deadlines.check("morph_frames")
+                # Ease in and out so the change starts and settles gently
+                t = 0.5 - 0.5 * math.cos(math.pi * i / (count - 1))
+                pending.append(self.pool.submit(produce, t))
+                if len(pending) >= self.window:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            # Frames not started yet are dropped when the animation is abandoned
+            for future in pending:
+                future.cancel()
+
+    def _palette(self, deformation: Deformation) -> Image.Image:
+        """256-colour palette covering both ends of the morph"""
+        ends = np.vstack([deformation.frame, self.frame(deformation, 1.0)])
+        return _to_pillow(ends).quantize(256, method=Image.Quantize.FASTOCTREE)
+    
+    def _encode_mp4(self, sequence: Iterator[np.ndarray], shape: Tuple[int, ...], fps: int) -> bytes:
+        """MPEG-4 via OpenCV, which can only write to a file"""
+        with tempfile.TemporaryDirectory(prefix="morph") as tmp:
+            path = os.path.join(tmp, "morph.mp4")
+            writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (shape[1], shape[0]))
+            if not writer.isOpened():
+                raise ValueError("Could not open an MP4 writer")
+            try:
+                for frame in sequence:
+                    writer.write(frame)
+            finally:
+                writer.release()
+            with open(path, "rb") as f:
+                return f.read()
+
+    def _encode_pillow(self, sequence: Iterator[Image.Image], fmt: str, fps: int) -> bytes:
+        """Animated WebP via Pillow, whose frames go straight into libwebp's animation encoder"""
+        first = next(sequence)
+        output = io.BytesIO()
+        first.save(output, format=fmt.upper(), save_all=True, append_images=sequence,
+                   duration=round(1000 / fps), loop=0, quality=80, method=2)
+        return output.getvalue()
+
+    def _encode_gif(self, sequence: Iterator[Image.Image], fps: int) -> bytes:
+        """Animated GIF written as the frames arrive.
+
+        Pillow's own GIF writer holds every frame until the end, so frames
+        are written here with its per-frame helpers instead. They share one
+        global palette, and each one after the first is cropped to the box
+        that changed since the previous frame, which is the only frame kept.
+        """
+        duration = round(1000 / fps)
+        output = io.BytesIO()
+        previous = None
+        for frame in sequence:
+            if previous is None:
+                header, _ = GifImagePlugin.getheader(frame, info={"loop": 0, "duration": duration})
+                output.write(b"".join(header))
+                box = (0, 0) + frame.size
+            else:
+                changed = np.nonzero(np.asarray(frame) != np.asarray(previous))
+                if changed[0].size:
+                    box = (int(changed[1].min()), int(changed[0].min()),
+                           int(changed[1].max()) + 1, int(changed[0].max()) + 1)
+                else:
+                    # GIF has no empty frame; one unchanged pixel keeps the timing
+                    box = (0, 0, 1, 1)
+            # Each frame is drawn over the last, so a cropped frame only needs the change
+            for chunk in GifImagePlugin.getdata(frame.crop(box), offset=box[:2], duration=duration, disposal=1):
+                output.write(chunk)
+            previous = frame
+        output.write(b";")
+        return output.getvalue()
+
+
+def _to_pillow(frame: np.ndarray) -> Image.Image:
+    return Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
@@ -0,0 +1,201 @@
+import cProfile
+import heapq
+import os
+import random
+import resource
+import threading
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# Memory accounting costs a tracemalloc hook on every allocation, so it is opt-in
+MEMORY_PROFILING = os.getenv("PROFILE_MEMORY", "0") == "1"
+CPU_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", "profiles"))
+WORST_STAGES_KEPT = 25
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+# tracemalloc keeps one peak for the whole process and a section resets it on entry,
+# so sections of different requests take turns instead of clearing each other's peaks
+_SECTIONS = threading.Lock()
+
+
+def current_rss() -> int:
+    """Resident set size of this process in bytes (0 where unavailable)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return 0
+
+
+def peak_rss() -> int:
+    """High-water resident set size of this process in bytes"""
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class RequestProfile:
+    """Memory records for the stages of one request"""
+    
+    def __init__(self, route: str = ""):
+        self.request_id = uuid.uuid4().hex[:12]
+        self.route = route
+        self.records: List[Dict[str, Any]] = []
+        self.token = None
+        # Open sections, innermost last:
+        # [allocated at start, highest peak seen by children, RSS at start, peak RSS at start]
+        self._stack: List[List[int]] = []
+    
+    def enter(self) -> None:
+        if not self._stack:
+            _SECTIONS.acquire()
+        if self._stack:
+            # Preserve the enclosing section's peak before a nested section resets it
+            parent = self._stack[-1]
+            parent[1] = max(parent[1], tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+        self._stack.append([tracemalloc.get_traced_memory()[0], 0, current_rss(), peak_rss()])
+    
+    def exit(self, name: str) -> None:
+        allocated, peak = tracemalloc.get_traced_memory()
+        start_allocated, child_peak, start_rss, start_peak_rss = self._stack.pop()
+        peak = max(peak, child_peak)
+        if self._stack:
+            self._stack[-1][1] = max(self._stack[-1][1], peak)
+        self.records.append({
+            "stage": name,
+            "peak_alloc_bytes": max(0, peak - start_allocated),
+            "net_alloc_bytes": allocated - start_allocated,
+            "rss_delta_bytes": current_rss() - start_rss,
+            "peak_rss_growth_bytes": peak_rss() - start_peak_rss,
+        })
+        if not self._stack:
+            _SECTIONS.release()
+
+
+class ProfileAggregator:
+    """Process-wide per-stage memory statistics and the worst stage samples"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages: Dict[str, Dict[str, float]] = {}
+        self._worst: List[tuple] = []
+        self._requests = 0
+    
+    def add(self, profile: RequestProfile) -> None:
+        with self._lock:
+            self._requests += 1
+            for record in profile.records:
+                stats = self._stages.setdefault(record["stage"], {
+                    "count": 0, "peak_alloc_bytes_total": 0,
+                    "peak_alloc_bytes_max": 0, "rss_delta_bytes_max": 0,
+                })
+                stats["count"] += 1
+                stats["peak_alloc_bytes_total"] += record["peak_alloc_bytes"]
+                stats["peak_alloc_bytes_max"] = max(stats["peak_alloc_bytes_max"], record["peak_alloc_bytes"])
+                stats["rss_delta_bytes_max"] = max(stats["rss_delta_bytes_max"], record["rss_delta_bytes"])
+                
+                sample = dict(record, request_id=profile.request_id, route=profile.route, at=time.time())
+                entry = (record["peak_alloc_bytes"], profile.request_id, record["stage"], sample)
+                if len(self._worst) < WORST_STAGES_KEPT:
+                    heapq.heappush(self._worst, entry)
+                elif entry[0] > self._worst[0][0]:
+                    heapq.heapreplace(self._worst, entry)
+    
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            stages = {}
+            for name, stats in self._stages.items():
+                stages[name] = {
+                    "count": stats["count"],
+                    "peak_alloc_bytes_mean": stats["peak_alloc_bytes_total"] / stats["count"],
+                    "peak_alloc_bytes_max": stats["peak_alloc_bytes_max"],
+                    "rss_delta_bytes_max": stats["rss_delta_bytes_max"],
+                }
+            worst = [entry[3] for entry in sorted(self._worst, key=lambda e: e[0], reverse=True)]
+            requests = self._requests
+        
+        return {
+            "memory_profiling": MEMORY_PROFILING,
+            "cpu_sample_rate": CPU_SAMPLE_RATE,
+            "requests_profiled": requests,
+            "process_rss_bytes": current_rss(),
+            "process_peak_rss_bytes": peak_rss(),
+            "stages": dict(sorted(stages.items(), key=lambda item: item[1]["peak_alloc_bytes_max"], reverse=True)),
+            "worst_stages": worst,
+            "cpu_profiles": list_cpu_profiles(),
+        }
+
+
+AGGREGATOR = ProfileAggregator()
+
+_current_profile: ContextVar[Optional[RequestProfile]] = ContextVar("request_profile", default=None)
+
+
+def start_request(route: str = "") -> Optional[RequestProfile]:
+    """Begin memory accounting for a request, or return None when disabled"""
+    if not MEMORY_PROFILING:
+        return None
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    profile = RequestProfile(route)
+    profile.token = _current_profile.set(profile)
+    return profile
+
+
+def finish_request(profile: Optional[RequestProfile]) -> None:
+    if profile is None:
+        return
+    _current_profile.reset(profile.token)
+    if profile.records:
+        AGGREGATOR.add(profile)
+
+
+@contextmanager
+def section(name: str):
+    """Record peak traced allocation and RSS change of a block for the current request.
+    
+    Only one request at a time is inside a profiled section; the others wait.
+    Work outside sections keeps running and its allocations are traced too,
+    so under load the figures are an upper bound on the request's own.
+    """
+    profile = _current_profile.get()
+    if profile is None:
+        yield
+        return
+    profile.enter()
+    try:
+        yield
+    finally:
+        profile.exit(name)
+
+
+@contextmanager
+def sampled_cpu_profile(name: str):
+    """Run a block under cProfile for a PROFILE_SAMPLE_RATE fraction of calls"""
+    if CPU_SAMPLE_RATE <= 0 or random.random() >= CPU_SAMPLE_RATE:
+        yield
+        return
+    
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(str(PROFILE_DIR / f"{time.strftime('%Y%m%d-%H%M%S')}_{name}_{uuid.uuid4().hex[:8]}.prof"))
+
+
+def list_cpu_profiles(limit: int = 50) -> List[Dict[str, Any]]:
+    """Most recent dumped CPU profiles"""
+    if not PROFILE_DIR.exists():
+        return []
+    files = sorted(PROFILE_DIR.glob("*.prof"), key=lambda p: p.stat().st_mtime, reverse=True)
+    return [{"file": str(p), "bytes": p.stat().st_size} for p in files[:limit]]
@@ -0,0 +1,264 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import decoding
+import metrics
+from image_processor import OUTPUT_FORMATS, QUALITY_TIERS, ImageProcessor, parse_quality, parse_variants
+from image_store import ImageStore, StoredImage
+from metrics import stage
+from morph import MORPH_FORMATS, MORPH_MAX_SIDE, MorphGenerator
+
+PREVIEW_MAX_SIDE = int(os.getenv("RENDER_PREVIEW_MAX_SIDE", "600"))
+MAX_RENDER_JOBS = int(os.getenv("RENDER_CACHE_MAX_JOBS", "1024"))
+# Named output sizes produced together, and the encodings of each
+VARIANTS = parse_variants(os.getenv("OUTPUT_VARIANTS", f"thumbnail:200,preview:{PREVIEW_MAX_SIDE},full"))
+FORMATS = [fmt.strip() for fmt in os.getenv("OUTPUT_FORMATS", "jpeg,webp").split(",") if fmt.strip()]
+
+RENDER_REQUESTS = metrics.REGISTRY.counter(
+    "rhinovate_render_requests_total",
+    "After-image requests by variant, quality tier and whether they were served from the memo",
+    ["variant", "quality", "result"],
+)
+MORPH_REQUESTS = metrics.REGISTRY.counter(
+    "rhinovate_morph_requests_total",
+    "Before/after animation requests by format and whether they were served from the memo",
+    ["format", "result"],
+)
+
+
+@dataclass
+class RenderJob:
+    """A planned edit of a stored image, rendered lazily per output size"""
+    source_key: str
+    operations: List[Dict[str, Any]]
+    created: float
+    # (quality, variant, format) -> store key; animations use ("morph", "<side>x<frames>@<fps>", format)
+    outputs: Dict[Tuple[str, str, str], str] = field(default_factory=dict)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+class RenderCache:
+    """Registry of render jobs whose outputs are produced on first request and memoized"""
+    
+    def __init__(self, store: ImageStore, processor: ImageProcessor,
+                 variants: Optional[Dict[str, Optional[int]]] = None,
+                 formats: Optional[List[str]] = None, max_jobs: int = MAX_RENDER_JOBS,
+                 renderer=None):
+        self.store = store
+        self.processor = processor
+        # A ComputePool or RemoteCompute renders, renders groups and morphs in place of the local objects
+        self.renderer = renderer or processor
+        self._generate_morph = renderer.morph if renderer is not None else MorphGenerator(processor).generate
+        self.variants = variants if variants is not None else VARIANTS
+        self.formats = formats if formats is not None else FORMATS
+        unknown = [fmt for fmt in self.formats if fmt not in OUTPUT_FORMATS]
+        if unknown or not self.formats:
+            raise ValueError(f"Unsupported output formats {unknown}, expected some of {list(OUTPUT_FORMATS)}")
+        self.max_jobs = max_jobs
+        self._lock = threading.Lock()
+        self._jobs: "OrderedDict[str, RenderJob]" = OrderedDict()
+    
+    @staticmethod
+    def make_id(source_key: str, operations: List[Dict[str, Any]]) -> str:
+        """Deterministic ID: the same image with the same plan shares renders"""
+        payload = source_key + json.dumps(operations, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()[:32]
+    
+    def register(self, source_key: str, operations: List[Dict[str, Any]]) -> str:
+        render_id = self.make_id(source_key, operations)
+        with self._lock:
+            if render_id in self._jobs:
+                self._jobs.move_to_end(render_id)
+            else:
+                self._jobs[render_id] = RenderJob(source_key, operations, time.time())
+                while len(self._jobs) > self.max_jobs:
+                    self._jobs.popitem(last=False)
+        return render_id
+    
+    def _job(self, render_id: str) -> Optional[RenderJob]:
+        with self._lock:
+            job = self._jobs.get(render_id)
+            if job is None:
+                return None
+            if time.time() - job.created > self.store.ttl_seconds:
+                # The source image has expired from the store as well
+                del self._jobs[render_id]
+                return None
+            self._jobs.move_to_end(render_id)
+            return job
+    
+    def parse_variant(self, variant: str) -> Optional[int]:
+        """Longest output side for a variant name or pixel count; None means full resolution"""
+        if variant in self.variants:
+            return self.variants[variant]
+        try:
+            max_side = int(variant)
+        except ValueError:
+            raise ValueError(f"Unknown variant '{variant}', expected one of {list(self.variants)} or a pixel count")
+        if max_side <= 0:
+            raise ValueError("Variant size must be a positive pixel count")
+        return max_side
+    
+    def choose_format(self, requested: Optional[str], accept: Optional[str]) -> str:
+        """Pick the output format from an explicit request or the Accept header"""
+        if requested:
+            if requested not in self.formats:
+                raise ValueError(f"Unknown format '{requested}', expected one of {self.formats}")
+            return requested
+        for fmt in self.formats:
+            if fmt != "jpeg" and accept and OUTPUT_FORMATS[fmt][1] in accept:
+                return fmt
+        return "jpeg" if "jpeg" in self.formats else self.formats[0]
+    
+    def get(self, render_id: str, variant: str = "full", fmt: str = "jpeg",
+            quality: str = "standard") -> Optional[StoredImage]:
+        """Return the after image as `variant` in `fmt` at a quality tier, rendering it on first request.
+        
+        A render at one size also produces every smaller configured variant in
+        every configured format. Returns None when the job or its source image
+        is unknown or expired.
+        """
+        max_side = self.parse_variant(variant)
+        quality = parse_quality(quality)
+        variant_label = variant if variant in self.variants else "custom"
+        job = self._job(render_id)
+        if job is None:
+            return None
+        
+        with job.lock:
+            label = variant if variant in self.variants else str(max_side)
+            key = job.outputs.get((quality, label, fmt))
+            if key is not None:
+                item = self.store.get(key)
+                if item is not None:
+                    RENDER_REQUESTS.inc(variant=variant_label, quality=quality, result="hit")
+                    return item
+            
+            source = self.store.get(job.source_key)
+            if source is None:
+                return None
+            # Decode no more resolution than this variant and tier render at
+            caps = [side for side in (max_side, QUALITY_TIERS[quality].max_side) if side is not None]
+            with stage("decode"):
+                header = decoding.read_header(source.data)
+                image = decoding.decode(source.data, min(caps) if caps else None, header)
+            if image is None:
+                return None
+            
+            # Plans are always made on the full-resolution shape
+            plan_shape = header.shape if header else image.shape
+            frame = self.processor.downscale(image, max_side)
+            rendered = self.renderer.render(frame, job.operations, quality, plan_shape=plan_shape)
+            encoded = self._store_outputs(job, rendered, label, max_side, plan_shape, fmt, quality)
+            RENDER_REQUESTS.inc(variant=variant_label, quality=quality, result="rendered")
+            return StoredImage(encoded[(label, fmt)], OUTPUT_FORMATS[fmt][1], time.time(),
+                               job.outputs[(quality, label, fmt)])
+    
+    def render_group(self, source_key: str, plans: Dict[str, List[Dict[str, Any]]], variant: str = "preview",
+                     fmt: str = "jpeg", quality: str = "standard") -> Dict[str, str]:
+        """Register a job per plan of one source and render them all together as `variant`.
+        
+        The source is decoded once and render_many shares the frame, masks
+        and common leading operations between the plans. Returns
+        render IDs by plan name (plans without operations are left out);
+        requests for `variant` are then memo hits, other sizes render lazily.
+        """
+        max_side = self.parse_variant(variant)
+        quality = parse_quality(quality)
+        label = variant if variant in self.variants else str(max_side)
+        ids = {name: self.register(source_key, operations) for name, operations in plans.items() if operations}
+        # Identical plans share a render ID and are rendered once
+        jobs = {render_id: self._job(render_id) for render_id in dict.fromkeys(ids.values())}
+        pending = {render_id: job for render_id, job in jobs.items()
+                   if job is not None and (quality, label, fmt) not in job.outputs}
+        if not pending:
+            return ids
+        
+        source = self.store.get(source_key)
+        if source is None:
+            return ids
+        caps = [side for side in (max_side, QUALITY_TIERS[quality].max_side) if side is not None]
+        with stage("decode"):
+            header = decoding.read_header(source.data)
+            image = decoding.decode(source.data, min(caps) if caps else None, header)
+        if image is None:
+            return ids
+        
+        plan_shape = header.shape if header else image.shape
+        frame = self.processor.downscale(image, max_side)
+        rendered = self.renderer.render_many(
+            frame, {render_id: job.operations for render_id, job in pending.items()}, quality, plan_shape=plan_shape)
+        for render_id, job in pending.items():
+            with job.lock:
+                self._store_outputs(job, rendered[render_id], label, max_side, plan_shape, fmt, quality)
+            RENDER_REQUESTS.inc(variant=variant if variant in self.variants else "custom",
+                                quality=quality, result="rendered")
+        return ids
+    
+    def _store_outputs(self, job: RenderJob, rendered, label: str, max_side: Optional[int],
+                       plan_shape: Tuple[int, ...], fmt: str, quality: str) -> Dict[Tuple[str, str], bytes]:
+        """Encode a render as its own variant plus every smaller one that fits, and memoize them all"""
+        source_longest = max(plan_shape[:2])
+        longest = max(rendered.shape[:2])
+        targets = {label: max_side}
+        for name, side in self.variants.items():
+            if side is None:
+                fits = max_side is None or source_longest <= max_side
+            else:
+                # A source no larger than a variant already fits it without rescaling
+                fits = side <= longest or source_longest <= side
+            if fits:
+                targets[name] = side
+        formats = list(dict.fromkeys([fmt] + self.formats))
+        encoded = self.processor.encode_variants(rendered, targets, formats)
+        
+        with stage("store"):
+            for (name, out_fmt), data in encoded.items():
+                job.outputs[(quality, name, out_fmt)] = self.store.put(data, OUTPUT_FORMATS[out_fmt][1])
+        return encoded
+    
+    def morph(self, render_id: str, variant: str = "preview", fmt: str = "gif",
+              frames: int = 30, fps: int = 15) -> Optional[StoredImage]:
+        """Return a before->after animation of the job, generating it on first request.
+        
+        Animations are capped at MORPH_MAX_SIDE on the longest side. Returns
+        None when the job or its source image is unknown or expired.
+        """
+        if fmt not in MORPH_FORMATS:
+            raise ValueError(f"Unknown morph format '{fmt}', expected one of {list(MORPH_FORMATS)}")
+        max_side = min(self.parse_variant(variant) or MORPH_MAX_SIDE, MORPH_MAX_SIDE)
+        job = self._job(render_id)
+        if job is None:
+            return None
+        
+        with job.lock:
+            memo = ("morph", f"{max_side}x{frames}@{fps}", fmt)
+            key = job.outputs.get(memo)
+            if key is not None:
+                item = self.store.get(key)
+                if item is not None:
+                    MORPH_REQUESTS.inc(format=fmt, result="hit")
+                    return item
+            
+            source = self.store.get(job.source_key)
+            if source is None:
+                return None
+            with stage("decode"):
+                header = decoding.read_header(source.data)
+                image = decoding.decode(source.data, max_side, header)
+            if image is None:
+                return None
+            
+            frame = self.processor.downscale(image, max_side)
+            data = self._generate_morph(frame, job.operations, fmt, frames, fps,
+                                        plan_shape=header.shape if header else image.shape)
+            with stage("store"):
+                job.outputs[memo] = self.store.put(data, MORPH_FORMATS[fmt])
+            MORPH_REQUESTS.inc(format=fmt, result="rendered")
+            return StoredImage(data, MORPH_FORMATS[fmt], time.time(), job.outputs[memo])
@@ -0,0 +1,320 @@
+from typing import Any, Dict, List
+
+import cv2
+import numpy as np
+
+
+class ReferenceRenderer:
+    """The original per-operation renderer, kept as ground truth.
+
+    This is the image processor as it was before operations were split into
+    planners and renderers: each operation computes its own geometry, draws
+    a full-frame mask, warps the whole frame and blends in float. It imports
+    nothing from ImageProcessor, so the planners, ROI restriction, strips,
+    mask caching, shared prefixes, quality tiers and any later speedups are
+    all checked against it pixel for pixel. Keep it slow and obvious; do not
+    optimize it or share code with the production path.
+    """
+
+    def render(self, image: np.ndarray, operations: List[Dict[str, Any]]) -> np.ndarray:
+        """Apply a plan to a BGR frame at its own resolution"""
+        result = image
+        for operation in operations:
+            result = self.render_operation(result, operation)
+        return result
+
+    def render_operation(self, image: np.ndarray, operation: Dict[str, Any]) -> np.ndarray:
+        region = operation.get("region", "")
+        op_type = operation.get("type", "")
+        if region == "nose" and op_type == "shrink_width":
+            return self._shrink_nose_width(image, operation)
+        if region == "nose" and op_type == "refine_tip":
+            return self._refine_nose_tip(image, operation)
+        if region == "nose" and op_type == "refine_bridge":
+            return self._refine_nose_bridge(image, operation)
+        if region == "jaw" and op_type == "balance":
+            return self._balance_jaw(image, operation)
+        if region == "face" and op_type == "symmetry":
+            return self._improve_symmetry(image, operation)
+        if region == "chin" and op_type == "enhance":
+            return self._enhance_chin(image, operation)
+        if region == "face" and "third" in op_type:
+            return self._adjust_facial_third(image, operation)
+        return image
+
+    @staticmethod
+    def _blend(image: np.ndarray, warped: np.ndarray, mask: np.ndarray, blur: int, strength: float = 1.0):
+        mask = cv2.GaussianBlur(mask, (blur, blur), 0)
+        mask_3d = np.stack([mask] * 3, axis=2).astype(np.float32) / 255.0 * strength
+        return (image * (1 - mask_3d) + warped * mask_3d).astype(np.uint8)
+
+    @staticmethod
+    def _warp(image: np.ndarray, src_points: np.ndarray, dst_points: np.ndarray) -> np.ndarray:
+        height, width = image.shape[:2]
+        matrix = cv2.getPerspectiveTransform(src_points, dst_points)
+        return cv2.warpPerspective(image, matrix, (width, height), flags=cv2.INTER_LINEAR,
+                                   borderMode=cv2.BORDER_REPLICATE)
+
+    def _shrink_nose_width(self, image: np.ndarray, operation: Dict[str, Any]) -> np.ndarray:
+        factor = operation.get("factor", 0.9)
+        if factor >= 1.0 or factor < 0.70:
+            return image
+
+        height, width = image.shape[:2]
+        cx, cy = width // 2, int(height * 0.35)
+        bridge_width = int(width * 0.16)
+        nose_height = int(height * 0.20)
+        tip_width = int(bridge_width * 0.80)
+        src_points = np.float32([
+            [cx - bridge_width//2, cy - nose_height//2],
+            [cx + bridge_width//2, cy - nose_height//2],
+            [cx + tip_width//2, cy + nose_height//2],
+            [cx - tip_width//2, cy + nose_height//2],
+        ])
+
+        reduction_multiplier = 1.0 - (1.0 - factor) * 1.2
+        new_bridge_width = int(bridge_width * reduction_multiplier)
+        new_tip_width = int(tip_width * reduction_multiplier)
+        if bridge_width - new_bridge_width < 2:
+            return image
+        dst_points = np.float32([
+            [cx - new_bridge_width//2, cy - nose_height//2],
+            [cx + new_bridge_width//2, cy - nose_height//2],
+            [cx + new_tip_width//2, cy + nose_height//2],
+            [cx - new_tip_width//2, cy + nose_height//2],
+        ])
+
+        mask = np.zeros(image.shape[:2], dtype=np.uint8)
+        avg_width = (new_bridge_width + new_tip_width) // 2
+        cv2.ellipse(mask, (cx, cy), (avg_width//2 + 10, nose_height//2 + 12), 0, 0, 360, 255, -1)
+        return self._blend(image, self._warp(image, src_points, dst_points), mask, 19)
+
+    def _refine_nose_tip(self, image: np.ndarray, operation: Dict[str, Any]) -> np.ndarray:
+        factor = operation.get("factor", 0.85)
+        if factor >= 1.0 or factor < 0.80:
+            return image
+
+        height, width = image.shape[:2]
+        cx, cy = width // 2, int(height * 0.45)
+        tip_width = int(width * 0.08)
+        tip_height = int(height * 0.10)
+        new_tip_width = int(tip_width * factor)
+        if new_tip_width >= tip_width:
+            return image
+        src_points = np.float32([
+            [cx - tip_width//2, cy - tip_height//2],
+            [cx + tip_width//2, cy - tip_height//2],
+            [cx + tip_width//2, cy + tip_height//2],
+            [cx - tip_width//2, cy + tip_height//2],
+        ])
+        dst_points = np.float32([
+            [cx - new_tip_width//2, cy - tip_height//2],
+            [cx + new_tip_width//2, cy - tip_height//2],
+            [cx + new_tip_width//2, cy + tip_height//2],
+            [cx - new_tip_width//2, cy + tip_height//2],
+        ])
+
+        mask = np.zeros(image.shape[:2], dtype=np.uint8)
+        cv2.ellipse(mask, (cx, cy), (new_tip_width//2 + 5, tip_height//2 + 5), 0, 0, 360, 255, -1)
+        return self._blend(image, self._warp(image, src_points, dst_points), mask, 13)
+
+    def _refine_nose_bridge(self, image: np.ndarray, operation: Dict[str, Any]) -> np.ndarray:
+        factor = operation.get("factor", 0.90)
+        if factor >= 1.0 or factor < 0.85:
+            return image
+
+        height, width = image.shape[:2]
+        cx, cy = width // 2, int(height * 0.28)
+        bridge_width = int(width * 0.10)
+        bridge_height = int(height * 0.12)
+        new_bridge_width = int(bridge_width * factor)
+        if new_bridge_width >= bridge_width:
+            return image
+        src_points = np.float32([
+            [cx - bridge_width//2, cy - bridge_height//2],
+            [cx + bridge_width//2, cy - bridge_height//2],
+            [cx + bridge_width//2, cy + bridge_height//2],
+            [cx - bridge_width//2, cy + bridge_height//2],
+        ])
+        dst_points = np.float32([
+            [cx - new_bridge_width//2, cy - bridge_height//2],
+            [cx + new_bridge_width//2, cy - bridge_height//2],
+            [cx + new_bridge_width//2, cy + bridge_height//2],
+            [cx - new_bridge_width//2, cy + bridge_height//2],
+        ])
+
+        mask = np.zeros(image.shape[:2], dtype=np.uint8)
+        cv2.ellipse(mask, (cx, cy), (new_bridge_width//2 + 4, bridge_height//2 + 4), 0, 0, 360, 255, -1)
+        return self._blend(image, self._warp(image, src_points, dst_points), mask, 11)
+
+    def _balance_jaw(self, image: np.ndarray, operation: Dict[str, Any]) -> np.ndarray:
+        mm_correction = operation.get("mm", 0)
+        if mm_correction == 0 or mm_correction > 2.0:
+            return image
+
+        height, width = image.shape[:2]
+        face_width_estimate = width * 0.6
+        pixel_correction = int(mm_correction * face_width_estimate / 100)
+        if abs(pixel_correction) < 2:
+            return image
+
+        jaw_y = int(height * 0.7)
+        jaw_height = int(height * 0.2)
+        jaw_center_x = width // 2
+        jaw_side_width = int(width * 0.2)
+        if pixel_correction > 0:
+            jaw_left, jaw_right = jaw_center_x, min(jaw_center_x + jaw_side_width, width)
+        else:
+            jaw_left, jaw_right = max(0, jaw_center_x - jaw_side_width), jaw_center_x
+        src_points = np.float32([
+            [jaw_left, jaw_y],
+            [jaw_right, jaw_y],
+            [jaw_right, jaw_y + jaw_height],
+            [jaw_left, jaw_y + jaw_height],
+        ])
+
+        shift = abs(pixel_correction) * 0.7
+        inward = shift if pixel_correction > 0 else -shift
+        dst_points = np.float32([
+            [jaw_left + inward, jaw_y],
+            [jaw_right - inward, jaw_y],
+            [jaw_right - inward, jaw_y + jaw_height],
+            [jaw_left + inward, jaw_y + jaw_height],
+        ])
+
+        mask = np.zeros((height, width), dtype=np.uint8)
+        cv2.fillPoly(mask, [src_points.astype(int)], 255)
+        return self._blend(image, self._warp(image, src_points, dst_points), mask, 21)
+
+    def _improve_symmetry(self, image: np.ndarray, operation: Dict[str, Any]) -> np.ndarray:
+        amount = operation.get("amount", 0)
+        if amount == 0 or amount > 0.15:
+            return image
+
+        height, width = image.shape[:2]
+        cx, cy = width // 2, height // 2
+        region_width = int(width * 0.6)
+        region_height = int(height * 0.7)
+        inner_left = int(cx - region_width * 0.25)
+        inner_right = int(cx + region_width * 0.25)
+        if not (inner_left > 0 and inner_right < width):
+            return image
+
+        mask = np.zeros((height, width), dtype=np.uint8)
+        cv2.ellipse(mask, (cx, cy), (region_width//2, region_height//2), 0, 0, 360, 255, -1)
+        mask = cv2.GaussianBlur(mask, (25, 25), 0)
+
+        center_region = image[:, inner_left:inner_right].copy()
+        blend_strength = min(amount * 0.4, 0.2)
+        blended = cv2.addWeighted(center_region, 1 - blend_strength, cv2.flip(center_region, 1), blend_strength, 0)
+        center_mask = np.stack([mask[:, inner_left:inner_right]] * 3, axis=2).astype(np.float32) / 255.0
+        result = image.copy()
+        result[:, inner_left:inner_right] = (center_region * (1 - center_mask) + blended * center_mask).astype(np.uint8)
+        return result
+
+    def _enhance_chin(self, image: np.ndarray, operation: Dict[str, Any]) -> np.ndarray:
+        amount = operation.get("amount", 0)
+        if amount == 0 or amount > 0.2:
+            return image
+
+        height, width = image.shape[:2]
+        chin_y = int(height * 0.75)
+        chin_height = int(height * 0.15)
+        cx = width // 2
+        chin_width = int(width * 0.4)
+        stretch_y = int(chin_height * amount * 0.5)
+        if stretch_y < 1:
+            return image
+        src_points = np.float32([
+            [cx - chin_width//2, chin_y],
+            [cx + chin_width//2, chin_y],
+            [cx + chin_width//2, chin_y + chin_height],
+            [cx - chin_width//2, chin_y + chin_height],
+        ])
+        dst_points = np.float32([
+            [cx - chin_width//2, chin_y],
+            [cx + chin_width//2, chin_y],
+            [cx + chin_width//2, chin_y + chin_height + stretch_y],
+            [cx - chin_width//2, chin_y + chin_height + stretch_y],
+        ])
+
+        mask = np.zeros((height, width), dtype=np.uint8)
+        cv2.fillPoly(mask, [dst_points.astype(int)], 255)
+        return self._blend(image, self._warp(image, src_points, dst_points), mask, 15)
+
+    def _adjust_facial_third(self, image: np.ndarray, operation: Dict[str, Any]) -> np.ndarray:
+        op_type = operation.get("type", "")
+        deviation = operation.get("target", 0) - operation.get("current", 0)
+        if abs(deviation) < 0.01:
+            return image
+        if "upper" in op_type:
+            return self._adjust_upper_third(image, deviation)
+        if "middle" in op_type:
+            return self._adjust_middle_third(image, deviation)
+        if "lower" in op_type:
+            return self._adjust_lower_third(image, deviation)
+        return image
+
+    def _adjust_upper_third(self, image: np.ndarray, deviation: float) -> np.ndarray:
+        # A Botox brow lift moves the brows 1-3 mm at most; anything larger is surgery and is not drawn
+        if abs(deviation) > 0.02 or abs(deviation) < 0.01:
+            return image
+
+        height, width = image.shape[:2]
+        brow_y = int(height * 0.25)
+        lift_amount = int(abs(deviation) * height * 0.3)
+        if lift_amount < 1:
+            return image
+
+        mask = np.zeros((height, width), dtype=np.uint8)
+        brow_height = int(height * 0.08)
+        cv2.rectangle(mask, (0, brow_y - brow_height//2), (width, brow_y + brow_height//2), 255, -1)
+        warped = cv2.warpAffine(image, np.float32([[1, 0, 0], [0, 1, -lift_amount]]), (width, height),
+                                flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+        return self._blend(image, warped, mask, 15, strength=0.4)
+
+    def _adjust_middle_third(self, image: np.ndarray, deviation: float) -> np.ndarray:
+        # Only adding midface volume (fillers) is drawn; reducing it is surgical
+        if deviation < 0.02:
+            return image
+
+        height, width = image.shape[:2]
+        top, bottom = int(height * 0.33), int(height * 0.66)
+        cx = width // 2
+        cheek_width = int(width * 0.35)
+        projection = int(deviation * width * 0.15)
+        src_points = np.float32([
+            [cx - cheek_width//2, top],
+            [cx + cheek_width//2, top],
+            [cx + cheek_width//2, bottom],
+            [cx - cheek_width//2, bottom],
+        ])
+        dst_points = np.float32([
+            [cx - cheek_width//2 - projection//3, top],
+            [cx + cheek_width//2 + projection//3, top],
+            [cx + cheek_width//2 + projection//4, bottom],
+            [cx - cheek_width//2 - projection//4, bottom],
+        ])
+
+        mask = np.zeros((height, width), dtype=np.uint8)
+        cv2.ellipse(mask, (cx, (top + bottom) // 2), (cheek_width//2 + 10, (bottom - top)//2 + 5),
+                    0, 0, 360, 255, -1)
+        return self._blend(image, self._warp(image, src_points, dst_points), mask, 23)
+
+    def _adjust_lower_third(self, image: np.ndarray, deviation: float) -> np.ndarray:
+        if abs(deviation) < 0.02:
+            return image
+
+        height, width = image.shape[:2]
+        top = int(height * 0.66)
+        lower_height = height - top
+        new_height = int(lower_height * (1.0 + deviation * 0.6))
+        if abs(new_height - lower_height) < 3:
+            return image
+        new_bottom = min(top + new_height, height)
+        src_points = np.float32([[0, top], [width, top], [width, height], [0, height]])
+        dst_points = np.float32([[0, top], [width, top], [width, new_bottom], [0, new_bottom]])
+
+        mask = np.zeros((height, width), dtype=np.uint8)
+        cv2.fillPoly(mask, [dst_points.astype(int)], 255)
+        return self._blend(image, self._warp(image, src_points, dst_points), mask, 23)
@@ -0,0 +1,688 @@
+import argparse
+import atexit
+import hashlib
+import hmac
+import itertools
+import json
+import os
+import secrets
+import selectors
+import signal
+import socket
+import socketserver
+import struct
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+import deadlines
+import execution
+import ingest
+import metrics
+from metrics import stage
+from morph import MorphGenerator
+
+# Comma-separated worker addresses (tcp://host:port or unix:///path); unset keeps compute in the API process
+RENDER_WORKERS = os.getenv("RENDER_WORKERS", "")
+RENDER_WORKER_TIMEOUT = float(os.getenv("RENDER_WORKER_TIMEOUT_SECONDS", "120"))
+RENDER_WORKER_RETRIES = int(os.getenv("RENDER_WORKER_RETRIES", "2"))
+RENDER_WORKER_HEALTH_SECONDS = float(os.getenv("RENDER_WORKER_HEALTH_SECONDS", "5"))
+# With every worker down, analyze and render in the API process instead of failing
+RENDER_WORKER_LOCAL_FALLBACK = os.getenv("RENDER_WORKER_LOCAL_FALLBACK", "1") == "1"
+# Shared by the app and its workers; a connection must prove it knows it before any call is read
+RENDER_WORKER_SECRET = os.getenv("RENDER_WORKER_SECRET", "")
+# How long a new connection has to complete the handshake
+HANDSHAKE_TIMEOUT = 10.0
+
+MAGIC = b"RHRW"
+VERSION = 1
+# magic, version, metadata length, payload length
+_HEADER = struct.Struct(">4sBII")
+# Operations, measurements and stage timings are a few kilobytes
+MAX_METADATA_BYTES = 1024 * 1024
+# The largest frame that crosses is a full decode of the largest accepted upload
+MAX_PAYLOAD_BYTES = ingest.MAX_IMAGE_PIXELS * 3
+MAX_HANDSHAKE_BYTES = 1024
+
+RPC_REQUESTS = metrics.REGISTRY.counter(
+    "rhinovate_render_worker_requests_total",
+    "Calls to remote render workers by worker, operation and result (ok, error, cancelled, timeout, retried)",
+    ["worker", "op", "result"],
+)
+RPC_FALLBACKS = metrics.REGISTRY.counter(
+    "rhinovate_render_worker_fallbacks_total",
+    "Calls processed in the API process because no render worker was reachable",
+    ["op"],
+)
+AUTH_FAILURES = metrics.REGISTRY.counter(
+    "rhinovate_render_worker_auth_failures_total",
+    "Connections a render worker closed because they did not prove the shared secret",
+)
+WORKER_UP = metrics.REGISTRY.gauge(
+    "rhinovate_render_worker_up",
+    "1 while a render worker passes health checks, 0 while it is out of rotation",
+    ["worker"],
+)
+
+
+class ProtocolError(ConnectionError):
+    """The peer sent something that is not a frame of this protocol"""
+
+
+class RemoteError(RuntimeError):
+    """The worker ran the call and it raised"""
+
+
+class AuthenticationError(ConnectionError):
+    """The two ends of a connection do not share RENDER_WORKER_SECRET"""
+
+
+class _StaleConnection(ConnectionError):
+    """A connection failed before any reply arrived, as a pooled one does after the worker closed it"""
+
+
+def parse_address(address: str) -> Tuple[int, Any]:
+    """(socket family, address) of "tcp://host:port", "host:port" or "unix:///path" """
+    if address.startswith("unix://"):
+        return socket.AF_UNIX, address[len("unix://"):]
+    host, _, port = address.removeprefix("tcp://").rpartition(":")
+    if not host or not port.isdigit():
+        raise ValueError(f"Invalid render worker address '{address}', expected tcp://host:port or unix:///path")
+    return socket.AF_INET, (host, int(port))
+
+
+def _plain(value: Any) -> Any:
+    # Measurements and operations hold numpy scalars; tuples become lists anyway
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def send_message(sock: socket.socket, meta: Dict[str, Any], array: Optional[np.ndarray] = None) -> None:
+    """Write one frame: fixed header, JSON metadata, then the raw bytes of `array` if any.
+
+    Layout (big-endian): b"RHRW", u8 version, u32 metadata length, u32 payload
+    length, metadata, payload. The array's shape and dtype travel in the
+    metadata under "array", so frames cross without pickling or copying.
+    """
+    if array is not None:
+        array = np.ascontiguousarray(array)
+        meta = {**meta, "array": {"shape": list(array.shape), "dtype": array.dtype.str}}
+    body = json.dumps(meta, default=_plain, separators=(",", ":")).encode()
+    payload = memoryview(array).cast("B") if array is not None else b""
+    sock.sendall(_HEADER.pack(MAGIC, VERSION, len(body), len(payload)) + body)
+    if len(payload):
+        sock.sendall(payload)
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytearray:
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:])
+        if count == 0:
+            raise ConnectionError("Connection closed mid-frame")
+        received += count
+    return buffer
+
+
+def recv_message(sock: socket.socket, max_metadata: int = MAX_METADATA_BYTES,
+                 max_payload: int = MAX_PAYLOAD_BYTES) -> Optional[Tuple[Dict[str, Any], Optional[np.ndarray]]]:
+    """Read one frame; None when the peer closed the connection between frames"""
+    first = sock.recv(_HEADER.size, socket.MSG_WAITALL)
+    if not first:
+        return None
+    header = first if len(first) == _HEADER.size else first + _recv_exact(sock, _HEADER.size - len(first))
+    magic, version, meta_size, payload_size = _HEADER.unpack(header)
+    if magic != MAGIC or version != VERSION:
+        raise ProtocolError(f"Not a render worker frame (magic {magic!r}, version {version})")
+    if meta_size > max_metadata or payload_size > max_payload:
+        raise ProtocolError(f"Frame too large ({meta_size} + {payload_size} bytes)")
+    meta = json.loads(_recv_exact(sock, meta_size))
+    array = None
+    if "array" in meta:
+        spec = meta.pop("array")
+        array = np.frombuffer(_recv_exact(sock, payload_size), dtype=np.dtype(spec["dtype"])).reshape(spec["shape"])
+    elif payload_size:
+        _recv_exact(sock, payload_size)
+    return meta, array
+
+
+def _readable(sock: socket.socket, timeout: float) -> bool:
+    with selectors.DefaultSelector() as selector:
+        selector.register(sock, selectors.EVENT_READ)
+        return bool(selector.select(timeout))
+
+
+def _shape(value) -> Optional[Tuple[int, ...]]:
+    return tuple(value) if value is not None else None
+
+
+def _proof(secret: str, nonce: str) -> str:
+    return hmac.new(secret.encode(), nonce.encode(), hashlib.sha256).hexdigest()
+
+
+def _read_handshake(sock: socket.socket) -> Dict[str, Any]:
+    message = recv_message(sock, MAX_HANDSHAKE_BYTES, 0)
+    if message is None:
+        raise ConnectionError("Connection closed during the handshake")
+    return message[0]
+
+
+def accept_handshake(sock: socket.socket, secret: str) -> bool:
+    """Server side: challenge a new connection to prove it holds `secret`"""
+    nonce = secrets.token_hex(16)
+    send_message(sock, {"nonce": nonce})
+    proof = _read_handshake(sock).get("proof")
+    if not isinstance(proof, str) or not hmac.compare_digest(proof, _proof(secret, nonce)):
+        AUTH_FAILURES.inc()
+        send_message(sock, {"ok": False, "error": "Authentication failed"})
+        return False
+    send_message(sock, {"ok": True})
+    return True
+
+
+def offer_handshake(sock: socket.socket, secret: str) -> None:
+    """Client side: answer the worker's challenge, raising AuthenticationError if it is refused"""
+    nonce = _read_handshake(sock).get("nonce")
+    if not isinstance(nonce, str):
+        raise ProtocolError("Render worker did not send a handshake challenge")
+    send_message(sock, {"proof": _proof(secret, nonce)})
+    if not _read_handshake(sock).get("ok"):
+        raise AuthenticationError("Render worker refused the shared secret")
+
+
+class _ConnectionDeadline(deadlines.Deadline):
+    """The caller's deadline mirrored into a worker, which also stops once the caller abandons the call.
+
+    A client that gives up sends a cancel frame and closes the connection;
+    nothing else arrives while a call runs, so a checkpoint that finds the
+    connection readable reads the reason from it, or "disconnect" if it closed.
+    """
+
+    def __init__(self, timeout: Optional[float], sock: socket.socket):
+        super().__init__(timeout)
+        self._sock = sock
+        self._poll_lock = threading.Lock()
+
+    def poll(self) -> Optional[str]:
+        with self._poll_lock:
+            if self.reason is not None or not _readable(self._sock, 0):
+                return self.reason
+            try:
+                message = recv_message(self._sock, MAX_HANDSHAKE_BYTES, 0)
+            except (ConnectionError, OSError, ValueError):
+                return "disconnect"
+            reason = message[0].get("reason") if message is not None and message[0].get("op") == "cancel" else None
+            return reason if reason in deadlines.REASONS else "disconnect"
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    """Serve calls on one connection until the client closes it"""
+
+    def setup(self) -> None:
+        with self.server.lock:
+            self.server.connections.add(self.request)
+
+    def finish(self) -> None:
+        with self.server.lock:
+            self.server.connections.discard(self.request)
+
+    def handle(self) -> None:
+        service: RenderService = self.server.service
+        if service.tcp:
+            self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        # Nothing but the small handshake frames is read until the peer proves the secret
+        self.request.settimeout(HANDSHAKE_TIMEOUT)
+        try:
+            if not accept_handshake(self.request, service.secret):
+                return
+        except (ConnectionError, OSError, ValueError):
+            return
+        self.request.settimeout(None)
+        while True:
+            try:
+                message = recv_message(self.request)
+            except (ConnectionError, OSError, ValueError):
+                return
+            if message is None:
+                return
+            meta, array = message
+            try:
+                reply, out = service.call(meta, array, self.request)
+            except deadlines.Cancelled as e:
+                reply, out = {"ok": False, "cancelled": {"reason": e.reason, "stage": e.stage}}, None
+            except Exception as e:
+                reply, out = {"ok": False, "error": f"{type(e).__name__}: {e}"}, None
+            try:
+                send_message(self.request, reply, out)
+            except OSError:
+                return
+
+
+class _TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class RenderService:
+    """A standalone compute worker: FaceAnalyzer, ImageProcessor and MorphGenerator behind a socket.
+
+    Each connection is served by its own thread, one call at a time; at most
+    `concurrency` calls compute at once and the rest wait, so a worker never
+    oversubscribes the cores its execution plan gave to the libraries. Every
+    reply carries the stage timings recorded while computing, which the client
+    replays into the caller's request as the compute pool does.
+
+    Every connection must first answer an HMAC challenge with `secret`;
+    without a secret the service refuses to start.
+    """
+
+    def __init__(self, address: str, analyzer=None, processor=None, concurrency: int = 1,
+                 secret: str = RENDER_WORKER_SECRET):
+        if not secret:
+            raise ValueError("RENDER_WORKER_SECRET must be set to run a render worker")
+        if analyzer is None or processor is None:
+            # Imported here so importing the client does not load a FaceMesh graph
+            from face_analysis import FaceAnalyzer
+            from image_processor import ImageProcessor
+            analyzer = analyzer or FaceAnalyzer()
+            processor = processor or ImageProcessor()
+        self.analyzer = analyzer
+        self.processor = processor
+        self.address = address
+        self.secret = secret
+        self._slots = threading.Semaphore(max(1, concurrency))
+        self.started = time.time()
+
+        family, bind = parse_address(address)
+        self.tcp = family == socket.AF_INET
+        if not self.tcp and os.path.exists(bind):
+            os.unlink(bind)
+        self.server = (_TCPServer if self.tcp else _UnixServer)(bind, _Handler)
+        self.server.service = self
+        self.server.lock = threading.Lock()
+        self.server.connections = set()
+
+    def call(self, meta: Dict[str, Any], array: Optional[np.ndarray],
+             connection: Optional[socket.socket] = None) -> Tuple[Dict[str, Any], Optional[np.ndarray]]:
+        op = meta.get("op")
+        if op == "ping":
+            return {"ok": True, "result": {"pid": os.getpid(), "uptime": time.time() - self.started}}, None
+        if op not in ("analyze", "render", "render_many", "morph") or array is None:
+            raise ValueError(f"Unknown call '{op}'")
+        kwargs = meta.get("kwargs", {})
+        timings = metrics.RequestTimings()
+        token = metrics.bind_timings(timings)
+        # The caller's remaining time comes along, so the worker stops at the same checkpoints,
+        # and so does a cancel the caller sends on the connection
+        deadline = (_ConnectionDeadline(meta.get("deadline"), connection) if connection is not None
+                    else deadlines.Deadline(meta.get("deadline")))
+        deadline_token = deadlines.bind_deadline(deadline)
+        try:
+            with self._slots:
+                deadlines.check(f"worker_{op}")
+                start = time.perf_counter()
+                if op == "analyze":
+                    landmarks, measurements = self.analyzer.analyze_image(
+                        array, _shape(kwargs.get("full_shape")), kwargs.get("model"))
+                    result, out = {"measurements": measurements}, landmarks
+                elif op == "render":
+                    out = self.processor.render(array, kwargs["operations"], kwargs.get("quality", "standard"),
+                                                _shape(kwargs.get("plan_shape")))
+                    result = None
+                elif op == "render_many":
+                    rendered = self.processor.render_many(array, kwargs["plans"], kwargs.get("quality", "standard"),
+                                                          _shape(kwargs.get("plan_shape")))
+                    # The frames go back to back in one payload; their shapes say where each ends
+                    result = {"names": list(rendered), "shapes": [frame.shape for frame in rendered.values()]}
+                    out = np.concatenate([frame.reshape(-1) for frame in rendered.values()]) if rendered else None
+                else:
+                    morpher = MorphGenerator(self.processor)
+                    data = morpher.generate(array, kwargs["operations"], kwargs.get("fmt", "gif"),
+                                            kwargs.get("frames", 30), kwargs.get("fps", 15),
+                                            _shape(kwargs.get("plan_shape")))
+                    result, out = None, np.frombuffer(data, dtype=np.uint8)
+                compute = time.perf_counter() - start
+        finally:
+            deadlines.unbind_deadline(deadline_token)
+            metrics.unbind_timings(token)
+        return {"ok": True, "result": result, "stages": timings.stages, "compute_seconds": compute}, out
+
+    def serve_forever(self) -> None:
+        self.server.serve_forever()
+
+    def close(self) -> None:
+        """Stop accepting calls and drop open connections, as a worker that exits does"""
+        self.server.shutdown()
+        self.server.server_close()
+        with self.server.lock:
+            connections = list(self.server.connections)
+        for sock in connections:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        if not self.tcp:
+            os.unlink(self.address[len("unix://"):])
+
+
+class _Worker:
+    """Client-side state of one worker: health, calls in flight and idle connections"""
+
+    def __init__(self, address: str, secret: str):
+        self.address = address
+        self.secret = secret
+        self.family, self.bind = parse_address(address)
+        self.healthy = True
+        self.in_flight = 0
+        self.idle: List[socket.socket] = []
+        WORKER_UP.set(1, worker=address)
+
+    def connect(self, timeout: float) -> socket.socket:
+        sock = socket.socket(self.family, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        try:
+            sock.connect(self.bind)
+        except OSError as e:
+            sock.close()
+            # Not a TimeoutError even when the connect timed out: an unreachable worker is down
+            raise ConnectionError(f"Could not connect to render worker {self.address}: {e}") from e
+        if self.family == socket.AF_INET:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            offer_handshake(sock, self.secret)
+        except (OSError, ValueError) as e:
+            sock.close()
+            raise ConnectionError(f"Handshake with render worker {self.address} failed: {e}") from e
+        return sock
+
+    def mark(self, healthy: bool) -> None:
+        self.healthy = healthy
+        WORKER_UP.set(1 if healthy else 0, worker=self.address)
+
+
+class RemoteCompute:
+    """Analysis and rendering on a list of render workers, in place of ComputePool.
+
+    Calls go to the healthy worker with the fewest calls in flight from this
+    process (round robin among ties) over a pooled connection. A pooled
+    connection the worker has since closed is replaced once, on the same
+    worker. A worker that cannot be reached or drops the call is taken out of
+    rotation and the call is retried on another one, up to `retries` times.
+    A call that times out fails with TimeoutError and is not retried: the
+    worker is busy rather than down, and sending the work elsewhere would only
+    double it. When the request is abandoned while a call is out, the worker
+    is sent a cancel and the connection is closed, so it stops at its next
+    checkpoint too. An exception raised by the computation itself is not retried
+    either. A background thread pings every worker and brings recovered ones
+    back. With no worker reachable the call runs on the local `analyzer` and
+    `processor` when `local_fallback` is set.
+    """
+
+    def __init__(self, addresses: List[str], analyzer, processor, timeout: float = RENDER_WORKER_TIMEOUT,
+                 retries: int = RENDER_WORKER_RETRIES, health_interval: float = RENDER_WORKER_HEALTH_SECONDS,
+                 local_fallback: bool = RENDER_WORKER_LOCAL_FALLBACK, secret: str = RENDER_WORKER_SECRET):
+        if not addresses:
+            raise ValueError("At least one render worker address is required")
+        if not secret:
+            raise ValueError("RENDER_WORKER_SECRET must be set to use render workers")
+        self.workers = [_Worker(address, secret) for address in addresses]
+        self.analyzer = analyzer
+        self.processor = processor
+        self.timeout = timeout
+        self.retries = retries
+        self.health_interval = health_interval
+        self.local_fallback = local_fallback
+        self._lock = threading.Lock()
+        self._turn = itertools.count()
+        self._closed = threading.Event()
+        self._health = threading.Thread(target=self._check_health, name="render-worker-health", daemon=True)
+        self._health.start()
+        atexit.register(self.close)
+
+    def analyze_image(self, image: np.ndarray, full_shape: Optional[Tuple[int, ...]] = None,
+                      model: Optional[str] = None) -> Tuple[Optional[np.ndarray], Dict]:
+        """FaceAnalyzer.analyze_image on a render worker"""
+        reply = self._call("analyze", image, {"full_shape": full_shape, "model": model})
+        if reply is None:
+            return self.analyzer.analyze_image(image, full_shape, model)
+        result, landmarks = reply
+        return landmarks, result["measurements"]
+
+    def render(self, image: np.ndarray, operations: List[Dict[str, Any]], quality: str = "standard",
+               plan_shape: Optional[Tuple[int, ...]] = None) -> np.ndarray:
+        """ImageProcessor.render on a render worker"""
+        reply = self._call("render", image, {"operations": operations, "quality": quality, "plan_shape": plan_shape})
+        if reply is None:
+            return self.processor.render(image, operations, quality, plan_shape)
+        return reply[1]
+
+    def render_many(self, image: np.ndarray, plans: Dict[str, List[Dict[str, Any]]], quality: str = "standard",
+                    plan_shape: Optional[Tuple[int, ...]] = None) -> Dict[str, np.ndarray]:
+        """ImageProcessor.render_many on a render worker, whose results come back in one payload"""
+        if not plans:
+            return {}
+        if image.nbytes * len(plans) > MAX_PAYLOAD_BYTES:
+            # Too large for one reply; each plan goes out on its own
+            return {name: self.render(image, operations, quality, plan_shape) for name, operations in plans.items()}
+        reply = self._call("render_many", image, {"plans": plans, "quality": quality, "plan_shape": plan_shape})
+        if reply is None:
+            return self.processor.render_many(image, plans, quality, plan_shape)
+        result, array = reply
+        rendered, offset = {}, 0
+        for name, shape in zip(result["names"], result["shapes"]):
+            size = int(np.prod(shape))
+            rendered[name] = array[offset:offset + size].reshape(shape)
+            offset += size
+        return rendered
+
+    def morph(self, image: np.ndarray, operations: List[Dict[str, Any]], fmt: str = "gif", frames: int = 30,
+              fps: int = 15, plan_shape: Optional[Tuple[int, ...]] = None) -> bytes:
+        """MorphGenerator.generate on a render worker"""
+        reply = self._call("morph", image, {"operations": operations, "fmt": fmt, "frames": frames, "fps": fps,
+                                            "plan_shape": plan_shape})
+        if reply is None:
+            return MorphGenerator(self.processor).generate(image, operations, fmt, frames, fps, plan_shape)
+        return reply[1].tobytes()
+
+    def _pick(self, tried: set) -> Optional[_Worker]:
+        with self._lock:
+            candidates = [w for w in self.workers if w.healthy and w not in tried]
+            if not candidates:
+                return None
+            turn = next(self._turn)
+            # Rotate before taking the least loaded so ties are spread round robin
+            start = turn % len(candidates)
+            worker = min(candidates[start:] + candidates[:start], key=lambda w: w.in_flight)
+            worker.in_flight += 1
+            return worker
+
+    def _call(self, op: str, image: np.ndarray, kwargs: Dict[str, Any]):
+        """(result, array) from the first worker that answers; None to compute locally"""
+        tried, last_error = set(), None
+        for _ in range(self.retries + 1):
+            worker = self._pick(tried)
+            if worker is None:
+                break
+            tried.add(worker)
+            try:
+                start = time.perf_counter()
+                meta, array = self._exchange(worker, {"op": op, "kwargs": kwargs, "deadline": deadlines.remaining()},
+                                             image)
+                elapsed = time.perf_counter() - start
+            except deadlines.Cancelled:
+                RPC_REQUESTS.inc(worker=worker.address, op=op, result="cancelled")
+                raise
+            except TimeoutError:
+                RPC_REQUESTS.inc(worker=worker.address, op=op, result="timeout")
+                raise TimeoutError(f"Render worker {worker.address} did not reply within {self.timeout:.0f}s")
+            except (OSError, ConnectionError) as e:
+                RPC_REQUESTS.inc(worker=worker.address, op=op, result="retried")
+                worker.mark(False)
+                last_error = e
+                continue
+            finally:
+                with self._lock:
+                    worker.in_flight -= 1
+
+            for name, seconds in meta.get("stages", []):
+                metrics.record_stage(name, seconds)
+            # Time on the wire and in the worker's queue, beyond the computation itself
+            metrics.record_stage("rpc", max(0.0, elapsed - meta.get("compute_seconds", 0.0)))
+            if "cancelled" in meta:
+                RPC_REQUESTS.inc(worker=worker.address, op=op, result="cancelled")
+                deadlines.expire(meta["cancelled"]["reason"], meta["cancelled"]["stage"])
+            if not meta.get("ok"):
+                RPC_REQUESTS.inc(worker=worker.address, op=op, result="error")
+                raise RemoteError(f"Render worker {worker.address} failed: {meta.get('error')}")
+            RPC_REQUESTS.inc(worker=worker.address, op=op, result="ok")
+            return meta.get("result"), array
+
+        if self.local_fallback:
+            RPC_FALLBACKS.inc(op=op)
+            return None
+        if tried:
+            raise ConnectionError(f"No render worker answered after {len(tried)} attempts: {last_error}")
+        raise ConnectionError("No healthy render worker")
+
+    def _exchange(self, worker: _Worker, meta: Dict[str, Any], array: Optional[np.ndarray] = None):
+        with self._lock:
+            sock = worker.idle.pop() if worker.idle else None
+        if sock is not None:
+            try:
+                return self._roundtrip(worker, sock, meta, array)
+            except _StaleConnection:
+                # Workers close idle connections when they restart; that says nothing about this call
+                pass
+        with stage("rpc_connect"):
+            sock = worker.connect(self.timeout)
+        return self._roundtrip(worker, sock, meta, array)
+
+    def _roundtrip(self, worker: _Worker, sock: socket.socket, meta: Dict[str, Any], array: Optional[np.ndarray]):
+        """One call on `sock`, which goes back to the pool if it is still usable afterwards"""
+        try:
+            try:
+                send_message(sock, meta, array)
+                self._await_reply(sock)
+                reply = recv_message(sock)
+            except (BrokenPipeError, ConnectionResetError) as e:
+                raise _StaleConnection(f"Render worker {worker.address} dropped the connection: {e}") from e
+            if reply is None:
+                raise _StaleConnection(f"Render worker {worker.address} closed the connection")
+        except BaseException:
+            sock.close()
+            raise
+        with self._lock:
+            worker.idle.append(sock)
+        return reply
+
+    def _await_reply(self, sock: socket.socket) -> None:
+        """Wait for a reply on `sock`, sending the worker a cancel if the request is abandoned first.
+
+        Raises TimeoutError after `timeout`, and Cancelled once abandoned;
+        the caller then closes the connection, which stops the worker even if
+        the cancel frame could not be sent.
+        """
+        deadline = deadlines.current()
+        give_up = time.monotonic() + self.timeout
+        while True:
+            left = give_up - time.monotonic()
+            if left <= 0:
+                raise TimeoutError("Render worker did not reply")
+            if _readable(sock, min(left, deadlines.CANCEL_POLL_SECONDS) if deadline is not None else left):
+                return
+            if deadlines.abandoned(deadline):
+                try:
+                    send_message(sock, {"op": "cancel", "reason": deadline.reason})
+                except OSError:
+                    pass
+                deadline.check("rpc")
+
+    def ping(self, worker: _Worker) -> bool:
+        """One health check on a fresh connection, so a stale pooled socket cannot hide a dead worker"""
+        try:
+            sock = worker.connect(min(self.timeout, max(1.0, self.health_interval)))
+        except OSError:
+            return False
+        try:
+            send_message(sock, {"op": "ping"})
+            reply = recv_message(sock)
+            return reply is not None and bool(reply[0].get("ok"))
+        except (OSError, ValueError):
+            return False
+        finally:
+            sock.close()
+
+    def _check_health(self) -> None:
+        while not self._closed.wait(self.health_interval):
+            for worker in self.workers:
+                healthy = self.ping(worker)
+                if not healthy:
+                    # Connections to a worker that went away are useless once it comes back
+                    with self._lock:
+                        stale, worker.idle = worker.idle, []
+                    for sock in stale:
+                        sock.close()
+                worker.mark(healthy)
+
+    def close(self) -> None:
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        with self._lock:
+            for worker in self.workers:
+                for sock in worker.idle:
+                    sock.close()
+                worker.idle = []
+
+
+def client_from_env(analyzer, processor) -> Optional[RemoteCompute]:
+    """Client for the workers listed in RENDER_WORKERS, if any"""
+    addresses = [address.strip() for address in RENDER_WORKERS.split(",") if address.strip()]
+    if not addresses:
+        return None
+    return RemoteCompute(addresses, analyzer, processor)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a Rhinovate render worker")
+    parser.add_argument("--listen", default=os.getenv("RENDER_WORKER_LISTEN", "tcp://127.0.0.1:9100"),
+                        help="tcp://host:port or unix:///path (default: loopback only)")
+    parser.add_argument("--concurrency", type=int, default=None,
+                        help="Calls computed at once (default: the execution plan's request workers)")
+    args = parser.parse_args()
+    if not RENDER_WORKER_SECRET:
+        print("❌ Set RENDER_WORKER_SECRET to the value the app uses")
+        sys.exit(2)
+
+    plan = execution.plan_from_env()
+    execution.apply(plan)
+    from face_analysis import FaceAnalyzer
+    from image_processor import ImageProcessor
+
+    service = RenderService(args.listen, FaceAnalyzer(), ImageProcessor(encode_threads=plan.library_threads),
+                            concurrency=args.concurrency or plan.request_workers)
+    # Orchestrators stop workers with SIGTERM; exit through the cleanup below
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    print(f"🛠️  Render worker listening on {args.listen} (pid {os.getpid()})", flush=True)
+    try:
+        service.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.server.server_close()
+        if not service.tcp:
+            os.unlink(args.listen[len("unix://"):])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Any, Callable, Deque, Dict, FrozenSet, Optional, Tuple
+
+import metrics
+from execution import PipelineExecutor
+
+# Interactive requests come from someone watching a spinner; batch from bulk uploads
+REQUEST_CLASSES = ("interactive", "batch")
+DEFAULT_CLASS = "interactive"
+# Share of dispatches each class gets while both are waiting
+SCHEDULER_WEIGHTS = os.getenv("SCHEDULER_WEIGHTS", "interactive=4,batch=1")
+# Pipelines one client may hold at once; by default one worker stays free for everyone else
+CLIENT_MAX_CONCURRENCY = int(os.getenv("CLIENT_MAX_CONCURRENCY", "0"))
+# Peer addresses (e.g. an authenticating gateway) whose X-Client-ID and X-Request-Class are taken as given
+TRUSTED_CLIENTS = frozenset(filter(None, (a.strip() for a in os.getenv("SCHEDULER_TRUSTED_CLIENTS", "").split(","))))
+# Requests an untrusted client may have running or queued before the rest are scheduled as batch; 0 never demotes
+BATCH_AFTER = int(os.getenv("SCHEDULER_BATCH_AFTER", "4"))
+
+QUEUE_DEPTH = metrics.REGISTRY.gauge(
+    "rhinovate_scheduler_queue_depth",
+    "Requests waiting for a pipeline worker, by request class",
+    ["request_class"],
+)
+QUEUE_WAIT_SECONDS = metrics.REGISTRY.histogram(
+    "rhinovate_scheduler_wait_seconds",
+    "Time requests waited for a pipeline worker, by request class",
+    ["request_class"],
+)
+
+
+def parse_weights(value: str) -> Dict[str, float]:
+    """Parse "interactive=4,batch=1"; classes left out keep weight 1"""
+    weights = {name: 1.0 for name in REQUEST_CLASSES}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        name, _, weight = item.partition("=")
+        if name not in weights:
+            raise ValueError(f"Unknown request class '{name}', expected one of {list(REQUEST_CLASSES)}")
+        if float(weight) <= 0:
+            raise ValueError(f"Weight of '{name}' must be positive")
+        weights[name] = float(weight)
+    return weights
+
+
+def parse_class(value: Optional[str]) -> str:
+    if value is None:
+        return DEFAULT_CLASS
+    if value not in REQUEST_CLASSES:
+        raise ValueError(f"Unknown request class '{value}', expected one of {list(REQUEST_CLASSES)}")
+    return value
+
+
+class _ClassQueue:
+    """Waiters of one request class, grouped per client in round-robin order"""
+
+    def __init__(self, weight: float):
+        self.weight = weight
+        self.clients: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        self.depth = 0
+        # Stride-scheduling position: advances by 1 / weight per dispatch
+        self.position = 0.0
+
+
+class FairScheduler:
+    """Admits requests to the pipeline pool by weighted fair queuing.
+
+    Each of the pool's workers is a slot. When one frees up, the request
+    class with the lowest stride position that has a runnable waiter is
+    served, so over time classes get slots in proportion to their weights
+    and a batch backlog cannot starve interactive requests. Within a class,
+    clients take turns, and no client holds more than `client_limit` slots,
+    so one bulk uploader cannot occupy every worker. All state lives on the
+    event loop, so no locks are needed.
+
+    Clients cannot pick their own key or class: see origin().
+    """
+
+    def __init__(self, executor: PipelineExecutor, weights: Optional[Dict[str, float]] = None,
+                 client_limit: int = CLIENT_MAX_CONCURRENCY, trusted: FrozenSet[str] = TRUSTED_CLIENTS,
+                 batch_after: int = BATCH_AFTER):
+        self.executor = executor
+        self.slots = executor.workers
+        self.client_limit = client_limit or max(1, self.slots - 1)
+        self.trusted = trusted
+        self.batch_after = batch_after
+        weights = weights or parse_weights(SCHEDULER_WEIGHTS)
+        self.classes = {name: _ClassQueue(weights[name]) for name in REQUEST_CLASSES}
+        self.running: Dict[str, int] = {}
+        self._free = self.slots
+        self._position = 0.0
+
+    def origin(self, peer: str, client_id: Optional[str], requested_class: Optional[str]) -> Tuple[str, str]:
+        """Client key and request class for a request from `peer`.
+
+        The claimed client ID and class are taken as given only from trusted
+        peers, such as a gateway that authenticates its callers. Anyone else
+        is keyed by its address, so it cannot spread its requests over several
+        keys. It may ask for batch, and once it already has `batch_after`
+        requests running or queued, the rest are scheduled as batch anyway.
+        """
+        request_class = parse_class(requested_class)
+        if peer in self.trusted:
+            return client_id or peer, request_class
+        if request_class != "batch" and self.batch_after and self.outstanding(peer) >= self.batch_after:
+            request_class = "batch"
+        return peer, request_class
+
+    def outstanding(self, client: str) -> int:
+        """Requests `client` has running or waiting"""
+        return self.running.get(client, 0) + sum(len(queue.clients.get(client, ())) for queue in self.classes.values())
+
+    async def run(self, client: str, request_class: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run `fn` on the pipeline pool once the scheduler grants `client` a slot"""
+        await self._acquire(client, request_class)
+        # Cancelling the caller cannot stop a running thread, so the slot is
+        # held until the work itself returns rather than until the caller leaves
+        work = asyncio.ensure_future(self.executor.run(fn, *args, **kwargs))
+        work.add_done_callback(lambda done: self._finished(client, done))
+        return await asyncio.shield(work)
+
+    async def _acquire(self, client: str, request_class: str) -> None:
+        queue = self.classes[request_class]
+        start = time.perf_counter()
+        if queue.depth == 0:
+            # A class returning from idle gets no credit for the time it was idle
+            queue.position = max(queue.position, self._position)
+        waiter = asyncio.get_running_loop().create_future()
+        queue.clients.setdefault(client, deque()).append(waiter)
+        self._queued(queue, request_class, 1)
+        self._dispatch()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.cancelled():
+                self._remove(queue, request_class, client, waiter)
+            else:  # granted just as the request was cancelled
+                self._release(client)
+            raise
+        waited = time.perf_counter() - start
+        QUEUE_WAIT_SECONDS.observe(waited, request_class=request_class)
+        metrics.record_stage("schedule_wait", waited)
+
+    def _finished(self, client: str, work: asyncio.Future) -> None:
+        self._release(client)
+        # Retrieve the outcome so an error nobody awaited any more is not logged as lost
+        if not work.cancelled():
+            work.exception()
+
+    def _release(self, client: str) -> None:
+        self.running[client] -= 1
+        if not self.running[client]:
+            del self.running[client]
+        self._free += 1
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        while self._free:
+            candidates = [(queue.position, name, queue) for name, queue in self.classes.items()
+                          if any(self._under_limit(client) for client in queue.clients)]
+            if not candidates:
+                return
+            _, name, queue = min(candidates, key=lambda c: c[0])
+            client = next(client for client in queue.clients if self._under_limit(client))
+            waiters = queue.clients.pop(client)
+            waiter = waiters.popleft()
+            if waiters:
+                queue.clients[client] = waiters  # back of the round-robin
+            self._queued(queue, name, -1)
+            if waiter.done():  # cancelled while queued; its request is unwinding
+                continue
+            queue.position += 1.0 / queue.weight
+            self._position = queue.position
+            self._grant(client)
+            waiter.set_result(None)
+
+    def _grant(self, client: str) -> None:
+        self.running[client] = self.running.get(client, 0) + 1
+        self._free -= 1
+
+    def _under_limit(self, client: str) -> bool:
+        return self.running.get(client, 0) < self.client_limit
+
+    def _remove(self, queue: _ClassQueue, name: str, client: str, waiter: asyncio.Future) -> None:
+        waiters = queue.clients.get(client)
+        if waiters is None or waiter not in waiters:
+            return
+        waiters.remove(waiter)
+        if not waiters:
+            del queue.clients[client]
+        self._queued(queue, name, -1)
+
+    @staticmethod
+    def _queued(queue: _ClassQueue, name: str, change: int) -> None:
+        queue.depth += change
+        QUEUE_DEPTH.set(queue.depth, request_class=name)
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Execution layout benchmark for the Rhinovate AI Backend
+
+Runs the analyze-and-preview pipeline (reduced decode, face mesh, planning,
+preview render and encode) under each execution layout, with a fixed number of
+closed-loop clients, and reports throughput and latency percentiles. Latency
+includes the time a request waits for a pipeline worker.
+
+Examples:
+    python benchmark_layouts.py
+    python benchmark_layouts.py --clients 16 --requests 64 --sizes 3024x4032
+    CPU_CORES=4 python benchmark_layouts.py --layouts latency,throughput
+"""
+
+import argparse
+import glob
+import itertools
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+import decoding  # noqa: E402
+import execution  # noqa: E402
+from beauty_rules import BeautyRulesEngine  # noqa: E402
+from face_analysis import FaceAnalyzer  # noqa: E402
+from image_processor import ImageProcessor  # noqa: E402
+
+DEFAULT_SIZES = "1242x2208"
+DEFAULT_IMAGES = "backend/uploads/before_*"
+PREVIEW_SIDE = 600
+
+
+def load_uploads(patterns, sizes):
+    """JPEG-encode each benchmark photo at every requested size, as clients would upload it"""
+    uploads = []
+    for pattern in patterns.split(","):
+        for path in sorted(glob.glob(pattern)):
+            image = cv2.imread(path)
+            if image is None:
+                print(f"⚠️  Skipping {path}: not a readable image")
+                continue
+            for width, height in sizes:
+                if (image.shape[0] > image.shape[1]) != (height > width):
+                    width, height = height, width
+                resized = cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+                uploads.append(cv2.imencode(".jpg", resized, [cv2.IMWRITE_JPEG_QUALITY, 92])[1].tobytes())
+    return uploads
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+
+def run_layout(plan, uploads, analyzer, engine, clients, requests):
+    """Closed loop: `clients` threads each submit one request at a time to a pool sized by the plan"""
+    execution.apply(plan)
+    processor = ImageProcessor(encode_threads=plan.fanout_threads)
+    pipeline = ThreadPoolExecutor(max_workers=plan.request_workers)
+
+    def handle(data):
+        header = decoding.read_header(data)
+        image = decoding.decode(data, decoding.ANALYZE_MAX_SIDE, header)
+        landmarks, measurements = analyzer.analyze_image(image, header.shape)
+        if landmarks is None:
+            return
+        operations = engine.plan_changes(measurements)
+        frame = processor.downscale(decoding.decode(data, PREVIEW_SIDE, header), PREVIEW_SIDE)
+        rendered = processor.render(frame, operations, plan_shape=header.shape)
+        processor.encode_variants(rendered, {"preview": PREVIEW_SIDE, "thumbnail": 200}, ["jpeg", "webp"])
+
+    handle(uploads[0])  # warm-up
+    tickets = itertools.count()
+    latencies = []
+    lock = threading.Lock()
+
+    def client():
+        while True:
+            n = next(tickets)
+            if n >= requests:
+                return
+            start = time.perf_counter()
+            pipeline.submit(handle, uploads[n % len(uploads)]).result()
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    pipeline.shutdown()
+    processor.encode_pool.shutdown()
+    return {
+        "workers": plan.request_workers,
+        "threads": plan.library_threads,
+        "throughput": requests / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark execution layouts")
+    parser.add_argument("--images", default=DEFAULT_IMAGES, help="Comma-separated globs of face photos")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="Comma-separated WxH upload sizes")
+    parser.add_argument("--layouts", default=",".join(execution.LAYOUTS), help="Comma-separated layouts to run")
+    parser.add_argument("--clients", type=int, default=None, help="Concurrent clients (default: 2 per core)")
+    parser.add_argument("--requests", type=int, default=32, help="Requests per layout")
+    parser.add_argument("--json", dest="json_path", default=None, help="Also write the results as JSON")
+    args = parser.parse_args()
+
+    sizes = [tuple(int(v) for v in item.lower().split("x")) for item in args.sizes.split(",")]
+    uploads = load_uploads(args.images, sizes)
+    if not uploads:
+        print("❌ No benchmark images found")
+        sys.exit(1)
+
+    cores = execution.available_cores()
+    clients = args.clients or 2 * cores
+    print(f"🖥️  {cores} usable cores (cgroup limit: {execution.cgroup_cpu_limit() or 'none'}), {clients} clients")
+
+    analyzer = FaceAnalyzer()
+    engine = BeautyRulesEngine()
+
+    results = {}
+    for layout in args.layouts.split(","):
+        plan = execution.plan_execution(cores, layout)
+        results[layout] = run_layout(plan, uploads, analyzer, engine, clients, args.requests)
+
+    print("\n📊 Pipeline throughput and latency by execution layout")
+    print("=" * 72)
+    print(f"{'layout':>12}  {'workers':>7}  {'threads':>7}  {'req/s':>7}  {'p50 ms':>7}  {'p95 ms':>7}  {'p99 ms':>7}")
+    for layout, row in results.items():
+        print(f"{layout:>12}  {row['workers']:>7}  {row['threads']:>7}  {row['throughput']:>7.2f}  "
+              f"{row['p50_ms']:>7.0f}  {row['p95_ms']:>7.0f}  {row['p99_ms']:>7.0f}")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\n📄 Results written to {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
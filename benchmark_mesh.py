@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Face mesh model benchmark for the Rhinovate AI Backend
+
+Runs every benchmark photo through each face mesh graph (base, and refined
+with the iris/eye/lip attention model) at the analysis resolution, and
+reports mesh latency per graph plus how far the base graph's landmarks,
+measurements and planned operations are from the refined graph's.
+
+Examples:
+    python benchmark_mesh.py
+    python benchmark_mesh.py --repeats 20 --images "photos/*.jpg"
+    python benchmark_mesh.py --json mesh.json
+"""
+
+import argparse
+import glob
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+import decoding  # noqa: E402
+from beauty_rules import BeautyRulesEngine  # noqa: E402
+from face_analysis import LANDMARK_COUNTS, MESH_MODELS, FaceAnalyzer  # noqa: E402
+
+DEFAULT_IMAGES = "backend/uploads/before_*"
+
+
+def flatten(measurements, prefix=""):
+    """Numeric measurements as name -> value, with nested groups joined by dots"""
+    values = {}
+    for name, value in measurements.items():
+        if isinstance(value, dict):
+            values.update(flatten(value, f"{prefix}{name}."))
+        elif isinstance(value, (int, float)):
+            values[f"{prefix}{name}"] = float(value)
+    return values
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark face mesh models")
+    parser.add_argument("--images", default=DEFAULT_IMAGES, help="Comma-separated globs of face photos")
+    parser.add_argument("--repeats", type=int, default=10, help="Timed mesh runs per photo and model")
+    parser.add_argument("--json", dest="json_path", default=None, help="Also write the results as JSON")
+    args = parser.parse_args()
+
+    frames = []
+    for pattern in args.images.split(","):
+        for path in sorted(glob.glob(pattern)):
+            data = decoding.read_file(path)
+            header = decoding.read_header(data) if data is not None else None
+            image = decoding.decode(data, decoding.ANALYZE_MAX_SIDE, header) if data is not None else None
+            if image is None:
+                print(f"⚠️  Skipping {path}: not a readable image")
+                continue
+            frames.append((os.path.basename(path), image, header.shape if header else image.shape))
+    if not frames:
+        print("❌ No benchmark images found")
+        sys.exit(1)
+
+    analyzer = FaceAnalyzer(MESH_MODELS)
+    engine = BeautyRulesEngine()
+    latencies = {model: [] for model in MESH_MODELS}
+    shared = min(LANDMARK_COUNTS.values())
+    photos = []
+
+    for name, image, full_shape in frames:
+        results = {}
+        for model in MESH_MODELS:
+            results[model] = analyzer.analyze_image(image, full_shape, model)  # warm-up and reference
+            for _ in range(args.repeats):
+                start = time.perf_counter()
+                analyzer.analyze_image(image, full_shape, model)
+                latencies[model].append(time.perf_counter() - start)
+
+        (base, base_measurements), (refined, refined_measurements) = results["base"], results["refined"]
+        if base is None or refined is None:
+            print(f"⚠️  Skipping {name}: no face detected by {'base' if base is None else 'refined'}")
+            continue
+        # Landmark drift in full-resolution pixels over the points both graphs produce
+        scale = [full_shape[1], full_shape[0]]
+        drift = (abs(base[:shared, :2] - refined[:shared, :2]) * scale).max(axis=1)
+        a, b = flatten(base_measurements), flatten(refined_measurements)
+        photos.append({
+            "photo": name,
+            "landmark_drift_px": {"mean": float(drift.mean()), "max": float(drift.max())},
+            "relative_difference": {key: abs(a[key] - b[key]) / max(abs(b[key]), 1e-9) for key in b},
+            "same_plan": engine.plan_changes(base_measurements) == engine.plan_changes(refined_measurements),
+        })
+
+    print(f"\n📊 Face mesh latency over {len(frames)} photos x {args.repeats} runs")
+    print("=" * 60)
+    print(f"{'model':>10}  {'landmarks':>9}  {'p50 ms':>7}  {'mean ms':>7}")
+    summary = {}
+    for model, samples in latencies.items():
+        summary[model] = {"p50_ms": statistics.median(samples) * 1000, "mean_ms": statistics.mean(samples) * 1000}
+        print(f"{model:>10}  {LANDMARK_COUNTS[model]:>9}  {summary[model]['p50_ms']:>7.1f}  "
+              f"{summary[model]['mean_ms']:>7.1f}")
+    print(f"\n⚡ base is {summary['refined']['p50_ms'] / summary['base']['p50_ms']:.2f}x faster at the median")
+
+    if photos:
+        print("\n📏 Base vs refined (refined as reference)")
+        print("=" * 60)
+        print(f"{'photo':>24}  {'drift px':>8}  {'max px':>7}  {'worst measurement':>26}  {'plan':>5}")
+        for row in photos:
+            key, diff = max(row["relative_difference"].items(), key=lambda item: item[1])
+            print(f"{row['photo'][:24]:>24}  {row['landmark_drift_px']['mean']:>8.2f}  "
+                  f"{row['landmark_drift_px']['max']:>7.2f}  {f'{key} {diff:.1%}':>26}  "
+                  f"{'same' if row['same_plan'] else 'diff':>5}")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"latency": summary, "photos": photos}, f, indent=2)
+        print(f"\n📄 Results written to {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
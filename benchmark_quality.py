@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Render quality tier benchmark for the Rhinovate AI Backend
+
+Plans each benchmark photo once at full resolution, then times the render of
+that same plan at every quality tier (draft, standard, high) and reports the
+median latency per image size.
+
+Examples:
+    python benchmark_quality.py
+    python benchmark_quality.py --sizes 1242x2208,3024x4032 --repeat 5
+"""
+
+import argparse
+import glob
+import json
+import os
+import statistics
+import sys
+import time
+
+import cv2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+from beauty_rules import BeautyRulesEngine  # noqa: E402
+from face_analysis import FaceAnalyzer  # noqa: E402
+from image_processor import QUALITY_TIERS, ImageProcessor  # noqa: E402
+
+DEFAULT_SIZES = "640x480,1242x2208,2316x3088,3024x4032"
+DEFAULT_IMAGES = "backend/uploads/before_*"
+
+
+def load_frames(patterns, sizes):
+    """Decode each benchmark photo and resize it to every requested size"""
+    frames = []
+    for pattern in patterns.split(","):
+        for path in sorted(glob.glob(pattern)):
+            image = cv2.imread(path)
+            if image is None:
+                print(f"⚠️  Skipping {path}: not a readable image")
+                continue
+            for width, height in sizes:
+                # Keep portrait photos portrait
+                if (image.shape[0] > image.shape[1]) != (height > width):
+                    width, height = height, width
+                frames.append((os.path.basename(path), cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)))
+    return frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark render quality tiers")
+    parser.add_argument("--images", default=DEFAULT_IMAGES, help="Comma-separated globs of face photos")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="Comma-separated WxH frame sizes")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed renders per frame and tier")
+    parser.add_argument("--json", dest="json_path", default=None, help="Also write the results as JSON")
+    args = parser.parse_args()
+
+    sizes = [tuple(int(v) for v in item.lower().split("x")) for item in args.sizes.split(",")]
+    frames = load_frames(args.images, sizes)
+    if not frames:
+        print("❌ No benchmark images found")
+        sys.exit(1)
+
+    analyzer = FaceAnalyzer()
+    engine = BeautyRulesEngine()
+    processor = ImageProcessor()
+
+    timings = {}  # (size, tier) -> [seconds]
+    for name, frame in frames:
+        landmarks, measurements = analyzer.analyze_image(frame)
+        if landmarks is None:
+            print(f"⚠️  No face in {name} at {frame.shape[1]}x{frame.shape[0]}, skipping")
+            continue
+        operations = engine.plan_changes(measurements)
+        size = f"{frame.shape[1]}x{frame.shape[0]}"
+        for tier in QUALITY_TIERS:
+            processor.render(frame, operations, tier)  # warm-up
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                processor.render(frame, operations, tier)
+                timings.setdefault((size, tier), []).append(time.perf_counter() - start)
+
+    print("\n📊 Render latency by quality tier (median ms)")
+    print("=" * 60)
+    print(f"{'size':>12}  " + "  ".join(f"{tier:>9}" for tier in QUALITY_TIERS))
+    results = {}
+    for size in dict.fromkeys(size for size, _ in timings):
+        row = {tier: statistics.median(timings[(size, tier)]) * 1000 for tier in QUALITY_TIERS if (size, tier) in timings}
+        results[size] = row
+        print(f"{size:>12}  " + "  ".join(f"{row.get(tier, float('nan')):>9.0f}" for tier in QUALITY_TIERS))
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\n📄 Results written to {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -236,7 +236,7 @@ function AnalysisResults({ data, onReset }) {
     if (url.startsWith('http://') || url.startsWith('https://')) {
       return url;
     }
-    // Otherwise, prefix with API URL (backend serves /uploads directly)
+    // Otherwise, prefix with API URL (backend serves /images directly)
     const baseUrl = API_URL || '';
     return baseUrl + url;
   };
@@ -265,7 +265,7 @@ function AnalysisResults({ data, onReset }) {
           <ImageContainer>
             <ImageLabel>After AI Enhancement</ImageLabel>
             <ImageWrapper>
-              <ResultImage src={getFullUrl(data.after_url)} alt="After analysis" />
+              <ResultImage src={getFullUrl(data.preview_url || data.after_url)} alt="After analysis" />
               <ImageBadge type="after">AI Enhanced</ImageBadge>
             </ImageWrapper>
           </ImageContainer>
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+Load generator for the Rhinovate AI Backend
+
+Drives /analyze on a local server either closed-loop (a fixed number of
+concurrent clients) or open-loop (a fixed arrival rate), using a pool of
+face photos resized to realistic phone/camera resolutions.
+
+Examples:
+    python load_test.py --concurrency 4 --requests 100
+    python load_test.py --rate 2.5 --duration 60 --sizes 1242x2208,3024x4032
+"""
+
+import argparse
+import glob
+import io
+import json
+import math
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from PIL import Image
+
+DEFAULT_SIZES = "640x480,1242x2208,2316x3088,3024x4032"
+DEFAULT_IMAGES = "backend/uploads/before_*"
+
+
+def parse_sizes(spec):
+    """Parse a "WxH,WxH" list into (width, height) tuples"""
+    sizes = []
+    for item in spec.split(","):
+        width, height = item.lower().split("x")
+        sizes.append((int(width), int(height)))
+    return sizes
+
+
+def build_image_pool(patterns, sizes, quality=90):
+    """Resize every source photo to every target size and JPEG-encode it"""
+    paths = []
+    for pattern in patterns:
+        paths.extend(sorted(glob.glob(pattern)))
+
+    sources = []
+    for path in paths:
+        try:
+            sources.append((path, Image.open(path).convert("RGB")))
+        except Exception as e:
+            print(f"⚠️  Skipping {path}: {e}")
+
+    if not sources:
+        # No photos available - fall back to blank frames (expect 400s)
+        sources = [("synthetic", Image.new("RGB", (600, 800), color="#fdbcb4"))]
+
+    pool = []
+    for path, image in sources:
+        for width, height in sizes:
+            # Keep the photo's orientation so faces are not squashed
+            if (image.width > image.height) != (width > height):
+                width, height = height, width
+            buffer = io.BytesIO()
+            image.resize((width, height)).save(buffer, format="JPEG", quality=quality)
+            pool.append({
+                "name": f"{width}x{height}",
+                "source": path,
+                "data": buffer.getvalue(),
+            })
+    return pool
+
+
+def parse_server_timing(header):
+    """Parse a Server-Timing header into {stage: milliseconds}"""
+    timings = {}
+    if not header:
+        return timings
+    for entry in header.split(","):
+        parts = [p.strip() for p in entry.split(";")]
+        name = parts[0]
+        for param in parts[1:]:
+            if param.startswith("dur="):
+                try:
+                    timings[name] = timings.get(name, 0.0) + float(param[4:])
+                except ValueError:
+                    pass
+    return timings
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an unsorted list"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+class Results:
+    """Thread-safe collector for per-request outcomes"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = []
+
+    def add(self, sample):
+        with self.lock:
+            self.samples.append(sample)
+
+
+def send_request(url, item, timeout):
+    """Send one /analyze request and return a result sample"""
+    files = {"file": (f"load_{item['name']}.jpg", item["data"], "image/jpeg")}
+    start = time.perf_counter()
+    try:
+        response = requests.post(url, files=files, timeout=timeout)
+        latency = time.perf_counter() - start
+        return {
+            "size": item["name"],
+            "status": response.status_code,
+            "latency": latency,
+            "bytes": len(response.content),
+            "stages": parse_server_timing(response.headers.get("Server-Timing")),
+        }
+    except requests.exceptions.RequestException as e:
+        return {
+            "size": item["name"],
+            "status": type(e).__name__,
+            "latency": time.perf_counter() - start,
+            "bytes": 0,
+            "stages": {},
+        }
+
+
+def run_closed_loop(url, pool, concurrency, total, duration, timeout, results):
+    """Each worker sends its next request as soon as the previous one returns"""
+    counter = {"sent": 0}
+    counter_lock = threading.Lock()
+    stop_at = time.perf_counter() + duration if duration else None
+
+    def worker(seed):
+        rng = random.Random(seed)
+        while True:
+            with counter_lock:
+                if total and counter["sent"] >= total:
+                    return
+                if stop_at and time.perf_counter() >= stop_at:
+                    return
+                counter["sent"] += 1
+            results.add(send_request(url, rng.choice(pool), timeout))
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def run_open_loop(url, pool, rate, total, duration, timeout, results, max_in_flight):
+    """Requests arrive as a Poisson process regardless of server latency"""
+    rng = random.Random(0)
+    dropped = 0
+    in_flight = threading.Semaphore(max_in_flight)
+    start = time.perf_counter()
+    next_at = start
+    sent = 0
+
+    def task(item):
+        try:
+            results.add(send_request(url, item, timeout))
+        finally:
+            in_flight.release()
+
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        while True:
+            if total and sent >= total:
+                break
+            if duration and next_at - start >= duration:
+                break
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            if in_flight.acquire(blocking=False):
+                executor.submit(task, rng.choice(pool))
+            else:
+                # Client-side saturation: record instead of silently queueing
+                dropped += 1
+            sent += 1
+            next_at += rng.expovariate(rate)
+    return dropped
+
+
+def summarize(results, elapsed, dropped=0):
+    """Aggregate samples into throughput, latency and stage statistics"""
+    samples = results.samples
+    ok = [s for s in samples if s["status"] == 200]
+    statuses = defaultdict(int)
+    for s in samples:
+        statuses[str(s["status"])] += 1
+
+    def latency_stats(group):
+        latencies = [s["latency"] * 1000 for s in group]
+        return {
+            "count": len(latencies),
+            "p50_ms": percentile(latencies, 50),
+            "p95_ms": percentile(latencies, 95),
+            "p99_ms": percentile(latencies, 99),
+            "max_ms": max(latencies) if latencies else 0.0,
+        }
+
+    by_size = defaultdict(list)
+    for s in ok:
+        by_size[s["size"]].append(s)
+
+    stage_values = defaultdict(list)
+    for s in ok:
+        for stage, ms in s["stages"].items():
+            stage_values[stage].append(ms)
+
+    return {
+        "elapsed_s": elapsed,
+        "requests": len(samples),
+        "dropped": dropped,
+        "throughput_rps": len(ok) / elapsed if elapsed > 0 else 0.0,
+        "error_rate": (len(samples) - len(ok)) / len(samples) if samples else 0.0,
+        "statuses": dict(statuses),
+        "latency": latency_stats(ok),
+        "latency_by_size": {size: latency_stats(group) for size, group in sorted(by_size.items())},
+        "stages": {
+            stage: {
+                "p50_ms": percentile(values, 50),
+                "p95_ms": percentile(values, 95),
+                "p99_ms": percentile(values, 99),
+            }
+            for stage, values in sorted(stage_values.items())
+        },
+    }
+
+
+def print_report(summary):
+    """Print a human-readable load test report"""
+    lat = summary["latency"]
+    print("=" * 60)
+    print(f"Requests:    {summary['requests']} in {summary['elapsed_s']:.1f}s"
+          f" ({summary['dropped']} dropped client-side)")
+    print(f"Throughput:  {summary['throughput_rps']:.2f} successful req/s")
+    print(f"Error rate:  {summary['error_rate']:.1%}  statuses={summary['statuses']}")
+    print(f"Latency:     p50={lat['p50_ms']:.0f}ms p95={lat['p95_ms']:.0f}ms"
+          f" p99={lat['p99_ms']:.0f}ms max={lat['max_ms']:.0f}ms")
+
+    if summary["latency_by_size"]:
+        print("\nBy image size:")
+        for size, stats in summary["latency_by_size"].items():
+            print(f"  {size:>10}  n={stats['count']:<5} p50={stats['p50_ms']:.0f}ms"
+                  f" p95={stats['p95_ms']:.0f}ms p99={stats['p99_ms']:.0f}ms")
+
+    if summary["stages"]:
+        print("\nServer-side stages (Server-Timing):")
+        for stage, stats in summary["stages"].items():
+            print(f"  {stage:<24} p50={stats['p50_ms']:.1f}ms p95={stats['p95_ms']:.1f}ms"
+                  f" p99={stats['p99_ms']:.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the /analyze endpoint")
+    parser.add_argument("--url", default="http://localhost:8000", help="Backend base URL")
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent clients (closed loop)")
+    parser.add_argument("--rate", type=float, default=None, help="Arrival rate in req/s (open loop)")
+    parser.add_argument("--max-in-flight", type=int, default=64, help="Open-loop in-flight cap")
+    parser.add_argument("--requests", type=int, default=None, help="Stop after this many requests")
+    parser.add_argument("--duration", type=float, default=None, help="Stop after this many seconds")
+    parser.add_argument("--images", default=DEFAULT_IMAGES, help="Comma-separated globs of face photos")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="Comma-separated WxH upload sizes")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-request timeout in seconds")
+    parser.add_argument("--json", dest="json_path", default=None, help="Also write the summary as JSON")
+    args = parser.parse_args()
+
+    if not args.requests and not args.duration:
+        args.requests = 50
+
+    try:
+        requests.get(f"{args.url}/health", timeout=5)
+    except requests.exceptions.ConnectionError:
+        print(f"❌ Cannot connect to backend at {args.url}")
+        sys.exit(1)
+
+    pool = build_image_pool(args.images.split(","), parse_sizes(args.sizes))
+    print(f"🧪 Load testing {args.url}/analyze with {len(pool)} images")
+
+    url = f"{args.url}/analyze"
+    results = Results()
+    dropped = 0
+    start = time.perf_counter()
+    if args.rate:
+        print(f"   Open loop: {args.rate} req/s")
+        dropped = run_open_loop(url, pool, args.rate, args.requests, args.duration,
+                                args.timeout, results, args.max_in_flight)
+    else:
+        print(f"   Closed loop: {args.concurrency} concurrent clients")
+        run_closed_loop(url, pool, args.concurrency, args.requests, args.duration,
+                        args.timeout, results)
+    elapsed = time.perf_counter() - start
+
+    summary = summarize(results, elapsed, dropped)
+    print_report(summary)
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(summary, f, indent=2)
+        print(f"\n📄 Summary written to {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The backend is run from its own directory and imports its modules flat
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend")
+sys.path.insert(0, BACKEND_DIR)
@@ -0,0 +1,57 @@
+import sqlite3
+
+import analytics
+from analytics import RECORDS, WRITER_UP, AnalyticsSink
+
+
+def counts():
+    return {result: RECORDS.value(result=result) for result in ("written", "failed", "dropped")}
+
+
+def changes(before):
+    return {result: value - before[result] for result, value in counts().items()}
+
+
+def rows(path):
+    with sqlite3.connect(path) as connection:
+        return connection.execute("SELECT source_key FROM analyses ORDER BY id").fetchall()
+
+
+def test_records_are_written_in_batches(tmp_path):
+    path = str(tmp_path / "analytics.db")
+    before = counts()
+    sink = AnalyticsSink(path, batch_size=2, flush_interval=0.05)
+    for n in range(5):
+        assert sink.record(source_key=f"key-{n}", measurements={"ipd": 61.5})
+    sink.close()
+    assert rows(path) == [(f"key-{n}",) for n in range(5)]
+    assert changes(before) == {"written": 5, "failed": 0, "dropped": 0}
+
+
+def test_failed_batch_does_not_stop_the_writer(tmp_path):
+    path = str(tmp_path / "analytics.db")
+    before = counts()
+    sink = AnalyticsSink(path, batch_size=1, flush_interval=0.05)
+    # _dumps cannot serialize this, which raises TypeError rather than a SQLite error
+    sink.record(source_key="bad", measurements={"ipd": object()})
+    sink.record(source_key="good")
+    sink.close()
+    assert sink.alive
+    assert rows(path) == [("good",)]
+    assert changes(before) == {"written": 1, "failed": 1, "dropped": 0}
+
+
+def test_writer_that_cannot_open_the_database_is_reported(tmp_path):
+    before = counts()
+    sink = AnalyticsSink(str(tmp_path / "missing" / "analytics.db"), flush_interval=0.05)
+    sink._writer.join(5)
+    assert not sink.alive
+    assert WRITER_UP.value() == 0
+    assert not sink.record(source_key="late")
+    sink.close()
+    assert changes(before)["failed"] == 1
+
+
+def test_sink_is_disabled_without_a_path(monkeypatch):
+    monkeypatch.setattr(analytics, "ANALYTICS_DB", "")
+    assert analytics.sink_from_env() is None
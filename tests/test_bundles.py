@@ -0,0 +1,35 @@
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+import bundles
+import main
+
+UPLOAD = os.path.join(os.path.dirname(main.__file__), "uploads", "before_IMG_8919.JPG")
+
+
+@pytest.fixture
+def client():
+    with TestClient(main.app) as client:
+        yield client
+
+
+def test_bundle_is_built_when_the_upload_was_evicted_before_bundling(client, monkeypatch):
+    register = main.render_cache.register
+
+    def register_then_evict(source_key, operations):
+        render_id = register(source_key, operations)
+        # Anything stored now pushes the least recently used upload out of memory
+        monkeypatch.setattr(main.image_store, "memory_limit_bytes", 1)
+        main.image_store.put(b"filler", "image/jpeg")
+        assert main.image_store.get(source_key) is None
+        return render_id
+
+    monkeypatch.setattr(main.render_cache, "register", register_then_evict)
+    with open(UPLOAD, "rb") as f:
+        response = client.post("/analyze?delivery=binary", files={"file": ("face.jpg", f, "image/jpeg")})
+    assert response.status_code == 200
+    parts = {name: (content_type, body) for name, content_type, body in bundles.decode_binary(response.content)}
+    assert "analysis" in parts
+    assert parts["after"][0] == "image/jpeg" and parts["after"][1][:2] == b"\xff\xd8"
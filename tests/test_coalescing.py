@@ -0,0 +1,88 @@
+import asyncio
+
+from coalescing import SingleFlight, request_key
+
+
+def test_concurrent_identical_keys_run_once():
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"score": 7}
+
+    async def main():
+        flights = SingleFlight("test")
+        results = await asyncio.gather(*(flights.run("key", compute) for _ in range(10)))
+        return flights, results
+
+    flights, results = asyncio.run(main())
+    assert len(calls) == 1
+    assert results == [{"score": 7}] * 10
+    # The key is forgotten once the work finishes; it is not a cache
+    assert len(flights) == 0
+
+
+def test_different_keys_run_separately():
+    calls = []
+
+    async def compute(value):
+        calls.append(value)
+        await asyncio.sleep(0.01)
+        return value
+
+    async def main():
+        flights = SingleFlight("test")
+        return await asyncio.gather(*(flights.run(f"key-{n % 3}", lambda n=n: compute(n % 3)) for n in range(9)))
+
+    assert asyncio.run(main()) == [n % 3 for n in range(9)]
+    assert sorted(calls) == [0, 1, 2]
+
+
+def test_leader_failure_reaches_every_follower():
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        raise ValueError("no face detected")
+
+    async def main():
+        flights = SingleFlight("test")
+        return await asyncio.gather(*(flights.run("key", compute) for _ in range(5)), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert len(calls) == 1
+    assert all(isinstance(result, ValueError) and str(result) == "no face detected" for result in results)
+
+
+def test_shared_work_is_abandoned_only_when_every_caller_has_gone():
+    async def main():
+        flights = SingleFlight("test")
+        started, cancelled = asyncio.Event(), asyncio.Event()
+
+        async def compute():
+            started.set()
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        first = asyncio.ensure_future(flights.run("key", compute))
+        second = asyncio.ensure_future(flights.run("key", compute))
+        await started.wait()
+        first.cancel()
+        await asyncio.sleep(0.05)
+        survived = not cancelled.is_set()
+        second.cancel()
+        await asyncio.sleep(0.05)
+        return survived, cancelled.is_set(), len(flights)
+
+    assert asyncio.run(main()) == (True, True, 0)
+
+
+def test_request_key_covers_options():
+    assert request_key(b"image", "standard", "json") == request_key(b"image", "standard", "json")
+    assert request_key(b"image", "standard", "json") != request_key(b"image", "high", "json")
+    assert request_key(b"image", "standard") != request_key(b"other", "standard")
@@ -0,0 +1,83 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+import deadlines
+from compute_pool import ComputePool
+from image_processor import ImageProcessor
+
+SHAPE = (1200, 1000, 3)
+# About a third of a second of rendering, so a short timeout gives up while the worker is mid-task
+SLOW_OPERATIONS = [{"region": "nose", "type": "shrink_width", "intensity": 0.5}] * 100
+
+
+def frame(value: int) -> np.ndarray:
+    return np.full(SHAPE, value, dtype=np.uint8)
+
+
+def test_timed_out_slot_is_not_reused_before_the_late_reply():
+    processor = ImageProcessor(encode_threads=1)
+    # One worker and one slot: the next request can only run in the slot the timed-out one used
+    pool = ComputePool(1, 1, int(np.prod(SHAPE)), None, processor, timeout=60)
+    try:
+        pool.render(frame(0), [])
+
+        pool.timeout = 0.05
+        try:
+            pool.render(frame(10), SLOW_OPERATIONS)
+        except TimeoutError:
+            pass
+        else:
+            raise AssertionError("expected the slow render to time out")
+
+        # The worker writes the abandoned render's output when it finishes; it must not land in this one
+        pool.timeout = 60
+        np.testing.assert_array_equal(pool.render(frame(200), []), frame(200))
+    finally:
+        pool.close()
+
+
+def test_abandoned_request_stops_the_worker_at_its_next_checkpoint():
+    processor = ImageProcessor(encode_threads=1)
+    pool = ComputePool(1, 1, int(np.prod(SHAPE)), None, processor, timeout=60)
+    deadline = deadlines.Deadline()
+    token = deadlines.bind_deadline(deadline)
+    try:
+        pool.render(frame(0), [])
+        # Long enough that finishing it would take seconds
+        threading.Timer(0.1, deadline.cancel, ["disconnect"]).start()
+        started = time.monotonic()
+        with pytest.raises(deadlines.Cancelled) as cancelled:
+            pool.render(frame(10), SLOW_OPERATIONS * 10)
+        assert time.monotonic() - started < 1.5
+        assert cancelled.value.reason == "disconnect"
+        assert cancelled.value.stage != "queued"
+
+        # The flag belongs to the abandoned task only
+        deadlines.unbind_deadline(token)
+        token = deadlines.bind_deadline(deadlines.Deadline())
+        np.testing.assert_array_equal(pool.render(frame(200), []), frame(200))
+    finally:
+        deadlines.unbind_deadline(token)
+        pool.close()
+
+
+def test_render_many_and_morph_match_the_local_results():
+    processor = ImageProcessor(encode_threads=1)
+    pool = ComputePool(1, 1, int(np.prod(SHAPE)) * 3, None, processor, timeout=60)
+    y, x = np.mgrid[0:SHAPE[0], 0:SHAPE[1]]
+    image = np.dstack([x % 256, y % 256, (x + y) % 256]).astype(np.uint8)
+    plans = {"moderate": SLOW_OPERATIONS[:1], "aggressive": SLOW_OPERATIONS[:2], "none": []}
+    try:
+        rendered = pool.render_many(image, plans)
+        expected = processor.render_many(image, plans)
+        assert list(rendered) == list(expected)
+        for name in plans:
+            np.testing.assert_array_equal(rendered[name], expected[name])
+        small = image[:240, :180]
+        assert pool.morph(small, SLOW_OPERATIONS[:1], "gif", frames=4) == pool.morpher.generate(
+            small, SLOW_OPERATIONS[:1], "gif", frames=4)
+    finally:
+        pool.close()
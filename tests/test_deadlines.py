@@ -0,0 +1,84 @@
+import asyncio
+import time
+
+import pytest
+
+import deadlines
+
+
+def test_expired_deadline_raises_at_the_next_checkpoint():
+    deadline = deadlines.Deadline(0.01)
+    deadline.check("decode")
+    time.sleep(0.02)
+    with pytest.raises(deadlines.Cancelled) as cancelled:
+        deadline.check("render")
+    assert (cancelled.value.reason, cancelled.value.stage) == ("deadline", "render")
+    assert cancelled.value.status_code == 504
+
+
+def test_cancel_keeps_the_first_reason_and_the_last_stage():
+    deadline = deadlines.Deadline()
+    deadline.check("analyze_face")
+    deadline.cancel("disconnect")
+    deadline.cancel("deadline")
+    with pytest.raises(deadlines.Cancelled) as cancelled:
+        deadline.check()
+    assert (cancelled.value.reason, cancelled.value.stage) == ("disconnect", "analyze_face")
+    assert cancelled.value.status_code == deadlines.CLIENT_CLOSED_REQUEST
+
+
+def test_poll_cancels_a_mirrored_deadline():
+    class Mirrored(deadlines.Deadline):
+        flagged = None
+
+        def poll(self):
+            return self.flagged
+
+    deadline = Mirrored()
+    deadline.check("render")
+    deadline.flagged = "abandoned"
+    with pytest.raises(deadlines.Cancelled) as cancelled:
+        deadline.check("encode")
+    assert cancelled.value.reason == "abandoned"
+
+
+@pytest.mark.parametrize("value, timeout", [(None, 60), ("5", 5), ("120", 60)])
+def test_request_timeout_only_shortens_the_server_limit(monkeypatch, value, timeout):
+    monkeypatch.setattr(deadlines, "REQUEST_DEADLINE_SECONDS", 60)
+    deadline = deadlines.from_header(value)
+    assert deadline.expires - deadline.started == pytest.approx(timeout)
+
+
+@pytest.mark.parametrize("value", ["soon", "0", "-1"])
+def test_invalid_request_timeout_is_rejected(value):
+    with pytest.raises(ValueError):
+        deadlines.from_header(value)
+
+
+def test_until_abandoned_returns_as_soon_as_the_client_disconnects():
+    async def main():
+        deadline = deadlines.Deadline()
+        deadlines.bind_deadline(deadline)
+        work = asyncio.ensure_future(asyncio.sleep(5))
+        asyncio.get_running_loop().call_later(0.05, deadline.cancel, "disconnect")
+        started = time.monotonic()
+        with pytest.raises(deadlines.Cancelled) as cancelled:
+            await deadlines.until_abandoned(work)
+        await asyncio.sleep(0)
+        return time.monotonic() - started, cancelled.value.reason, work.cancelled()
+
+    elapsed, reason, work_cancelled = asyncio.run(main())
+    assert elapsed < 1.0
+    assert reason == "disconnect"
+    assert work_cancelled
+
+
+def test_until_abandoned_gives_up_at_the_deadline():
+    async def main():
+        deadlines.bind_deadline(deadlines.Deadline(0.05))
+        await deadlines.until_abandoned(asyncio.sleep(5))
+
+    with pytest.raises(deadlines.Cancelled) as cancelled:
+        asyncio.run(main())
+    assert cancelled.value.reason == "deadline"
+
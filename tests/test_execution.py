@@ -0,0 +1,14 @@
+import logging
+
+import execution
+
+
+def test_apply_warns_when_blas_threads_cannot_be_limited(monkeypatch, caplog):
+    monkeypatch.setattr(execution, "threadpoolctl", None)
+    for name in execution.BLAS_ENV_VARS:
+        monkeypatch.delenv(name, raising=False)
+    plan = execution.plan_execution(cores=4, layout="balanced")
+    with caplog.at_level(logging.WARNING, logger="execution"):
+        execution.apply(plan)
+    assert "threadpoolctl is not installed" in caplog.text
+    assert all(execution.os.environ[name] == "2" for name in execution.BLAS_ENV_VARS)
@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+import face_analysis
+from face_analysis import LANDMARK_COUNTS, MESH_MODELS, FaceAnalyzer, mesh_model_for, parse_measurements
+
+
+def test_named_measurements_get_the_lightest_graph_that_covers_them(monkeypatch):
+    monkeypatch.setattr(face_analysis, "FACE_MESH_MODEL", "refined")
+    assert mesh_model_for() == "refined"
+    assert mesh_model_for(["ipd", "facial_thirds"]) == "base"
+    assert mesh_model_for(["ipd", "iris_ipd"]) == "refined"
+    monkeypatch.setattr(face_analysis, "FACE_MESH_MODEL", "auto")
+    assert mesh_model_for() == "base"
+
+
+def test_parse_measurements():
+    assert parse_measurements(None) is None
+    assert parse_measurements("ipd, ipd,nose_width") == ["ipd", "nose_width"]
+    with pytest.raises(ValueError):
+        parse_measurements("ipd,ear_size")
+
+
+def test_both_graphs_are_preloaded():
+    analyzer = FaceAnalyzer()
+    assert set(analyzer.meshes) == set(MESH_MODELS)
+
+
+def test_iris_measurement_needs_refined_landmarks():
+    analyzer = FaceAnalyzer(models=["base"])
+    rng = np.random.default_rng(0)
+    shape = (640, 480, 3)
+    assert "iris_ipd" not in analyzer.measure(rng.random((LANDMARK_COUNTS["base"], 3)), shape)
+    assert "iris_ipd" in analyzer.measure(rng.random((LANDMARK_COUNTS["refined"], 3)), shape)
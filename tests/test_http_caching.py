@@ -0,0 +1,49 @@
+import pytest
+
+from http_caching import etag_for, immutable_response, parse_range
+
+
+@pytest.mark.parametrize("header, size, expected", [
+    (None, 100, None),
+    ("bytes=0-9", 100, (0, 9)),
+    ("bytes=90-200", 100, (90, 99)),   # end clamped to the last byte
+    ("bytes=50-", 100, (50, 99)),      # open-ended
+    ("bytes=-10", 100, (90, 99)),      # suffix
+    ("bytes=-500", 100, (0, 99)),      # suffix longer than the body
+    ("bytes=0-0", 1, (0, 0)),
+    ("bytes=9-3", 100, None),          # invalid, so ignored
+    ("bytes=0-9,20-29", 100, None),    # multiple ranges are not served
+    ("items=0-9", 100, None),
+    ("bytes=-", 100, None),
+])
+def test_parse_range(header, size, expected):
+    assert parse_range(header, size) == expected
+
+
+@pytest.mark.parametrize("header, size", [
+    ("bytes=100-", 100),   # starts past the end
+    ("bytes=150-200", 100),
+    ("bytes=-0", 100),     # zero-length suffix
+    ("bytes=0-", 0),       # nothing to take a range of
+    ("bytes=-5", 0),
+])
+def test_parse_range_not_satisfiable(header, size):
+    with pytest.raises(ValueError):
+        parse_range(header, size)
+
+
+def test_immutable_response_ranges():
+    data = bytes(range(100))
+    partial = immutable_response(data, "image/jpeg", "abc", range_header="bytes=-10")
+    assert partial.status_code == 206
+    assert partial.body == data[90:]
+    assert partial.headers["Content-Range"] == "bytes 90-99/100"
+
+    unsatisfiable = immutable_response(data, "image/jpeg", "abc", range_header="bytes=-0")
+    assert unsatisfiable.status_code == 416
+    assert unsatisfiable.headers["Content-Range"] == "bytes */100"
+
+    assert immutable_response(data, "image/jpeg", "abc", if_none_match=etag_for("abc")).status_code == 304
+    # A stale If-Range gets the whole body
+    stale = immutable_response(data, "image/jpeg", "abc", range_header="bytes=0-9", if_range='"old"')
+    assert stale.status_code == 200 and stale.body == data
@@ -0,0 +1,32 @@
+import io
+
+import numpy as np
+from PIL import Image, ImageSequence
+
+from image_processor import ImageProcessor
+from morph import MorphGenerator
+
+OPERATIONS = [{"region": "nose", "type": "shrink_width", "intensity": 0.5}]
+
+
+def gradient(height=240, width=180):
+    y, x = np.mgrid[0:height, 0:width]
+    return np.dstack([x * 255 // width, y * 255 // height, (x + y) * 255 // (width + height)]).astype(np.uint8)
+
+
+def test_streamed_gif_decodes_to_every_frame():
+    generator = MorphGenerator(ImageProcessor(encode_threads=2))
+    image = gradient()
+    gif = Image.open(io.BytesIO(generator.generate(image, OPERATIONS, "gif", frames=8, fps=10)))
+    assert (gif.n_frames, gif.info["loop"], gif.info["duration"]) == (8, 0, 100)
+
+    decoded = [np.asarray(frame.convert("RGB")) for frame in ImageSequence.Iterator(gif)]
+    deformation = generator.deform(image, OPERATIONS)
+    palette = generator._palette(deformation)
+    for i, frame in enumerate(decoded):
+        t = 0.5 - 0.5 * np.cos(np.pi * i / 7)
+        expected = Image.fromarray(generator.frame(deformation, t)[:, :, ::-1]).quantize(
+            palette=palette, dither=Image.Dither.NONE)
+        np.testing.assert_array_equal(frame, np.asarray(expected.convert("RGB")))
+    # The first and last frames differ, so the plan actually moved pixels
+    assert not np.array_equal(decoded[0], decoded[-1])
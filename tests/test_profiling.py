@@ -0,0 +1,39 @@
+import threading
+import tracemalloc
+
+import numpy as np
+
+import profiling
+
+
+def test_overlapping_sections_do_not_clear_each_others_peak(monkeypatch):
+    monkeypatch.setattr(profiling, "MEMORY_PROFILING", True)
+    freed, records = threading.Event(), {}
+
+    def large():
+        profile = profiling.start_request("large")
+        with profiling.section("large"):
+            block = np.ones(32 * 1024 * 1024, dtype=np.uint8)
+            del block
+            freed.set()
+            # Another request enters its section here; it must not reset this one's peak
+            threading.Event().wait(0.2)
+        records["large"] = profile.records
+        profiling.finish_request(profile)
+
+    def small():
+        freed.wait()
+        profile = profiling.start_request("small")
+        with profiling.section("small"):
+            pass
+        records["small"] = profile.records
+        profiling.finish_request(profile)
+
+    threads = [threading.Thread(target=large), threading.Thread(target=small)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    tracemalloc.stop()
+    assert records["large"][0]["peak_alloc_bytes"] >= 32 * 1024 * 1024
+    assert records["small"][0]["stage"] == "small"
@@ -0,0 +1,187 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+import deadlines
+from image_processor import ImageProcessor
+from morph import MorphGenerator
+from render_service import RPC_REQUESTS, WORKER_UP, RenderService, RemoteCompute
+
+SECRET = "test-secret"
+
+
+class FakeProcessor:
+    """Stands in for ImageProcessor: adds 1 to every pixel after an optional delay, with a checkpoint every 10ms"""
+
+    def __init__(self):
+        self.calls = 0
+        self.cancelled = []
+        self.lock = threading.Lock()
+
+    def render(self, image, operations, quality="standard", plan_shape=None):
+        with self.lock:
+            self.calls += 1
+        until = time.monotonic() + (operations[0].get("sleep", 0) if operations else 0)
+        try:
+            while time.monotonic() < until:
+                deadlines.check("step")
+                time.sleep(0.01)
+        except deadlines.Cancelled as e:
+            self.cancelled.append(e.reason)
+            raise
+        return image + 1
+
+
+def start_worker(path, concurrency=4):
+    processor = FakeProcessor()
+    service = RenderService(f"unix://{path}", analyzer=object(), processor=processor, concurrency=concurrency,
+                            secret=SECRET)
+    threading.Thread(target=service.serve_forever, daemon=True).start()
+    return service, processor
+
+
+@pytest.fixture
+def frame():
+    return np.zeros((8, 6, 3), dtype=np.uint8)
+
+
+def client(paths, **options):
+    options.setdefault("health_interval", 60)
+    options.setdefault("local_fallback", False)
+    options.setdefault("secret", SECRET)
+    return RemoteCompute([f"unix://{path}" for path in paths], None, None, **options)
+
+
+def test_timeout_fails_the_call_without_taking_the_worker_down(tmp_path, frame):
+    a, a_processor = start_worker(tmp_path / "a.sock")
+    b, b_processor = start_worker(tmp_path / "b.sock")
+    remote = client([tmp_path / "a.sock", tmp_path / "b.sock"], timeout=0.2)
+    try:
+        with pytest.raises(TimeoutError):
+            remote.render(frame, [{"sleep": 1.0}])
+        # Neither resent elsewhere nor marked down
+        assert a_processor.calls + b_processor.calls == 1
+        assert all(worker.healthy for worker in remote.workers)
+    finally:
+        remote.close()
+        a.close()
+        b.close()
+
+
+def test_stale_pooled_connection_is_replaced_on_the_same_worker(tmp_path, frame):
+    path = tmp_path / "a.sock"
+    service, _ = start_worker(path)
+    remote = client([path])
+    try:
+        np.testing.assert_array_equal(remote.render(frame, []), frame + 1)
+        assert len(remote.workers[0].idle) == 1
+        # The worker restarts; the pooled connection now leads nowhere
+        service.close()
+        service, processor = start_worker(path)
+        np.testing.assert_array_equal(remote.render(frame, []), frame + 1)
+        assert processor.calls == 1
+        assert remote.workers[0].healthy
+    finally:
+        remote.close()
+        service.close()
+
+
+def test_calls_spread_over_workers_and_fail_over(tmp_path, frame):
+    a, a_processor = start_worker(tmp_path / "a.sock")
+    b, b_processor = start_worker(tmp_path / "b.sock")
+    remote = client([tmp_path / "a.sock", tmp_path / "b.sock"])
+    try:
+        threads = [threading.Thread(target=remote.render, args=(frame, [{"sleep": 0.1}])) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # The least loaded worker gets each call, so concurrent calls split evenly
+        assert (a_processor.calls, b_processor.calls) == (4, 4)
+
+        a.close()
+        retried = RPC_REQUESTS.value(worker=f"unix://{tmp_path / 'a.sock'}", op="render", result="retried")
+        for _ in range(4):
+            np.testing.assert_array_equal(remote.render(frame, []), frame + 1)
+        assert b_processor.calls == 8
+        assert not remote.workers[0].healthy and remote.workers[1].healthy
+        assert WORKER_UP.value(worker=f"unix://{tmp_path / 'a.sock'}") == 0
+        # Only the first call after the failure tried the dead worker
+        assert RPC_REQUESTS.value(worker=f"unix://{tmp_path / 'a.sock'}", op="render", result="retried") == retried + 1
+
+        # A restarted worker rejoins after the next health check
+        a, a_processor = start_worker(tmp_path / "a.sock")
+        assert remote.ping(remote.workers[0])
+    finally:
+        remote.close()
+        a.close()
+        b.close()
+
+
+def test_abandoned_request_cancels_the_call_on_the_worker(tmp_path, frame):
+    service, processor = start_worker(tmp_path / "a.sock")
+    remote = client([tmp_path / "a.sock"])
+    deadline = deadlines.Deadline()
+    token = deadlines.bind_deadline(deadline)
+    try:
+        threading.Timer(0.1, deadline.cancel, ["disconnect"]).start()
+        started = time.monotonic()
+        with pytest.raises(deadlines.Cancelled):
+            remote.render(frame, [{"sleep": 5.0}])
+        assert time.monotonic() - started < 1.0
+        # The worker stops at its next checkpoint instead of finishing the render
+        for _ in range(100):
+            if processor.cancelled:
+                break
+            time.sleep(0.01)
+        assert processor.cancelled == ["disconnect"]
+        assert remote.workers[0].healthy
+    finally:
+        deadlines.unbind_deadline(token)
+        remote.close()
+        service.close()
+
+
+def test_render_many_and_morph_run_on_the_worker(tmp_path):
+    processor = ImageProcessor(encode_threads=1)
+    service = RenderService(f"unix://{tmp_path / 'a.sock'}", analyzer=object(), processor=processor, secret=SECRET)
+    threading.Thread(target=service.serve_forever, daemon=True).start()
+    remote = client([tmp_path / "a.sock"])
+    y, x = np.mgrid[0:240, 0:180]
+    image = np.dstack([x, y, x + y]).astype(np.uint8)
+    operations = [{"region": "nose", "type": "shrink_width", "intensity": 0.5}]
+    plans = {"moderate": operations, "aggressive": operations * 2}
+    try:
+        rendered = remote.render_many(image, plans)
+        expected = processor.render_many(image, plans)
+        assert list(rendered) == list(expected)
+        for name in plans:
+            np.testing.assert_array_equal(rendered[name], expected[name])
+        assert remote.morph(image, operations, "gif", frames=4) == MorphGenerator(processor).generate(
+            image, operations, "gif", frames=4)
+        address = f"unix://{tmp_path / 'a.sock'}"
+        assert RPC_REQUESTS.value(worker=address, op="render_many", result="ok") == 1
+        assert RPC_REQUESTS.value(worker=address, op="morph", result="ok") == 1
+    finally:
+        remote.close()
+        service.close()
+
+
+def test_wrong_secret_is_refused(tmp_path, frame):
+    service, processor = start_worker(tmp_path / "a.sock")
+    remote = client([tmp_path / "a.sock"], secret="not-the-secret")
+    try:
+        with pytest.raises(ConnectionError):
+            remote.render(frame, [])
+        assert processor.calls == 0
+        assert not remote.ping(remote.workers[0])
+    finally:
+        remote.close()
+        service.close()
+
+
+def test_service_requires_a_secret(tmp_path):
+    with pytest.raises(ValueError):
+        RenderService(f"unix://{tmp_path / 'a.sock'}", analyzer=object(), processor=FakeProcessor(), secret="")
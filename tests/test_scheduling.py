@@ -0,0 +1,111 @@
+import asyncio
+import threading
+
+import pytest
+
+from execution import PipelineExecutor
+from scheduling import FairScheduler, parse_class, parse_weights
+
+
+def run_contended(weights, requests_per_class, clients_per_class=4):
+    """Dispatch order of requests queued behind a busy single-worker pool"""
+    order = []
+    release = threading.Event()
+
+    async def main():
+        scheduler = FairScheduler(PipelineExecutor(1), weights, client_limit=1)
+        blocker = asyncio.ensure_future(scheduler.run("warmup", "interactive", release.wait))
+        await asyncio.sleep(0.01)
+        requests = []
+        for request_class in ("interactive", "batch"):
+            for n in range(requests_per_class):
+                client = f"{request_class}-{n % clients_per_class}"
+                requests.append(asyncio.ensure_future(scheduler.run(client, request_class, order.append, request_class)))
+        await asyncio.sleep(0.01)
+        release.set()
+        await asyncio.gather(blocker, *requests)
+        scheduler.executor.pool.shutdown()
+
+    asyncio.run(main())
+    return order
+
+
+def test_weights_split_dispatches_under_contention():
+    order = run_contended({"interactive": 3.0, "batch": 1.0}, 40)
+    # While both classes are waiting, dispatches follow the 3:1 weights
+    first = order[:40]
+    assert first.count("interactive") == 30
+    assert first.count("batch") == 10
+    # Batch is not starved: it gets a turn within every four dispatches
+    assert all("batch" in order[i:i + 4] for i in range(0, 36, 4))
+
+
+def test_equal_weights_share_evenly():
+    order = run_contended({"interactive": 1.0, "batch": 1.0}, 10)
+    assert order[:10].count("batch") == 5
+
+
+def test_client_limit_leaves_a_worker_for_others():
+    running = []
+    peak = {}
+    lock = threading.Lock()
+    release = threading.Event()
+
+    def work(client):
+        with lock:
+            running.append(client)
+            peak[client] = max(peak.get(client, 0), running.count(client))
+        release.wait(1)
+        with lock:
+            running.remove(client)
+
+    async def main():
+        scheduler = FairScheduler(PipelineExecutor(3), {"interactive": 1.0, "batch": 1.0})
+        bulk = [asyncio.ensure_future(scheduler.run("bulk", "batch", work, "bulk")) for _ in range(6)]
+        await asyncio.sleep(0.05)
+        # The bulk client holds two of three workers, so this one starts at once
+        other = asyncio.ensure_future(scheduler.run("other", "interactive", work, "other"))
+        await asyncio.sleep(0.05)
+        assert "other" in running
+        release.set()
+        await asyncio.gather(other, *bulk)
+        scheduler.executor.pool.shutdown()
+
+    asyncio.run(main())
+    assert peak["bulk"] == 2
+
+
+def test_parse_weights_and_class():
+    assert parse_weights("interactive=4,batch=1") == {"interactive": 4.0, "batch": 1.0}
+    assert parse_weights("batch=2") == {"interactive": 1.0, "batch": 2.0}
+    assert parse_class(None) == "interactive"
+    with pytest.raises(ValueError):
+        parse_weights("bulk=1")
+    with pytest.raises(ValueError):
+        parse_weights("batch=0")
+    with pytest.raises(ValueError):
+        parse_class("urgent")
+
+
+def test_untrusted_clients_cannot_choose_their_key_or_class():
+    async def main():
+        scheduler = FairScheduler(PipelineExecutor(2), trusted=frozenset({"10.0.0.1"}), batch_after=2)
+        release = threading.Event()
+        # Headers from a trusted gateway are taken as given
+        assert scheduler.origin("10.0.0.1", "partner-a", "interactive") == ("partner-a", "interactive")
+        # Anyone else is keyed by address, whatever ID it claims
+        assert scheduler.origin("203.0.113.5", "rotating-1", None) == ("203.0.113.5", "interactive")
+        assert scheduler.origin("203.0.113.5", None, "batch") == ("203.0.113.5", "batch")
+        running = [asyncio.ensure_future(scheduler.run(*scheduler.origin("203.0.113.5", f"id-{n}", None),
+                                                       release.wait)) for n in range(2)]
+        await asyncio.sleep(0.01)
+        assert scheduler.outstanding("203.0.113.5") == 2
+        # With two requests out, its next one is batch even if it claims otherwise
+        demoted = scheduler.origin("203.0.113.5", "id-2", "interactive")
+        assert scheduler.origin("198.51.100.7", None, None) == ("198.51.100.7", "interactive")
+        release.set()
+        await asyncio.gather(*running)
+        scheduler.executor.pool.shutdown()
+        return demoted
+
+    assert asyncio.run(main()) == ("203.0.113.5", "batch")
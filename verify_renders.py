@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+Differential render check for the Rhinovate AI Backend
+
+Renders every operation type, across the parameter range BeautyRulesEngine
+can emit, with the plain reference renderer and with each optimized path
+(ROI strips, full frame, shared-prefix batches, quality tiers, the morph end
+frame) on synthetic and stored faces. Reports the worst PSNR and largest
+absolute pixel difference per operation next to the speedup over the
+reference, and exits non-zero when a path falls below its PSNR threshold or
+an operation type never changes a pixel in any case.
+
+Examples:
+    python verify_renders.py
+    python verify_renders.py --candidates standard,render_many --min-psnr 50
+    python verify_renders.py --sizes 3024x4032 --per-type 8 --json renders.json
+"""
+
+import argparse
+import glob
+import itertools
+import json
+import math
+import os
+import sys
+import time
+from collections import defaultdict
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+from beauty_rules import INTENSITY_LEVELS, BeautyRulesEngine  # noqa: E402
+from image_processor import ImageProcessor  # noqa: E402
+from morph import MorphGenerator  # noqa: E402
+from render_reference import ReferenceRenderer  # noqa: E402
+
+DEFAULT_SIZES = "1242x2208"
+DEFAULT_SYNTHETIC_SIZES = "480x640,1242x2208"
+DEFAULT_IMAGES = "backend/uploads/before_*"
+
+# Worst PSNR (dB) each path may reach against the reference. Exact paths only
+# differ by the reference's warpPerspective rounding; tiers and the morph
+# approximate on purpose.
+THRESHOLDS = {
+    "standard": 60.0,
+    "full_frame": 60.0,
+    "render_many": 60.0,
+    "high": 45.0,
+    "draft": 35.0,
+    "morph": 35.0,
+}
+
+# Measurements swept through plan_changes to collect what it can emit
+MEASUREMENT_GRID = {
+    "symmetry_score": [0.6, 0.75, 0.85, 0.89, 0.95],
+    "nose_to_ipd_ratio": [0.5, 0.62, 0.7, 0.8, 0.86, 0.9, 1.0, 1.2],
+    "jaw_asymmetry": [0.5, 1.5, 2.5],
+    "chin_projection": [0.0, 10.0, 30.0],
+    "facial_thirds": [
+        {"upper": 0.33, "middle": 0.33, "lower": 0.34},
+        {"upper": 0.27, "middle": 0.36, "lower": 0.37},
+        {"upper": 0.40, "middle": 0.30, "lower": 0.30},
+        {"upper": 0.20, "middle": 0.45, "lower": 0.35},
+        {"upper": 0.25, "middle": 0.30, "lower": 0.45},
+        {"upper": 0.38, "middle": 0.25, "lower": 0.37},
+    ],
+}
+# Operations the renderer draws but plan_changes cannot emit: thirds are only
+# flagged 5% off their ideal, and a Botox brow lift is only drawn up to 2%
+EXTRA_OPERATIONS = [
+    {"region": "face", "type": "adjust_upper_third", "current": 0.345, "target": 0.33, "priority": 5},
+    {"region": "face", "type": "adjust_upper_third", "current": 0.31, "target": 0.33, "priority": 5},
+]
+# The parameter that varies within each operation type
+PARAMETERS = ("factor", "amount", "mm", "current")
+
+
+def parse_sizes(value):
+    return [tuple(int(v) for v in item.lower().split("x")) for item in value.split(",") if item]
+
+
+def synthetic_face(width, height, seed):
+    """A drawn face with skin texture, so interpolation and blending differences show"""
+    rng = np.random.default_rng(seed)
+    ys, xs = np.mgrid[0:height, 0:width].astype(np.float32)
+    background = np.dstack([180 + 40 * xs / width, 170 + 30 * ys / height, 160 * np.ones_like(xs)])
+    image = background.astype(np.uint8)
+    cx, cy, s = width // 2, height // 2, min(width, height)
+    cv2.ellipse(image, (cx, cy), (int(s * 0.33), int(height * 0.38)), 0, 0, 360, (150, 175, 225), -1)
+    for side in (-1, 1):
+        eye = (cx + side * int(s * 0.12), int(height * 0.40))
+        cv2.ellipse(image, eye, (int(s * 0.05), int(s * 0.025)), 0, 0, 360, (255, 255, 255), -1)
+        cv2.circle(image, eye, int(s * 0.015), (40, 30, 20), -1)
+        cv2.line(image, (eye[0] - int(s * 0.06), eye[1] - int(s * 0.05)),
+                 (eye[0] + int(s * 0.06), eye[1] - int(s * 0.06)), (40, 50, 70), max(1, s // 120))
+    nose = np.array([[cx, int(height * 0.30)], [cx - int(s * 0.06), int(height * 0.45)],
+                     [cx + int(s * 0.06), int(height * 0.45)]], np.int32)
+    cv2.fillPoly(image, [nose], (135, 160, 210))
+    cv2.polylines(image, [nose], True, (90, 110, 160), max(1, s // 200))
+    cv2.ellipse(image, (cx, int(height * 0.58)), (int(s * 0.09), int(s * 0.03)), 0, 0, 360, (90, 90, 200), -1)
+    noise = rng.normal(0, 6, image.shape)
+    return np.clip(image + noise, 0, 255).astype(np.uint8)
+
+
+def load_corpus(patterns, sizes, synthetic_sizes):
+    frames = [(f"synthetic_{w}x{h}", synthetic_face(w, h, seed)) for seed, (w, h) in enumerate(synthetic_sizes)]
+    for pattern in patterns.split(","):
+        for path in sorted(glob.glob(pattern)):
+            image = cv2.imread(path)
+            if image is None:
+                print(f"⚠️  Skipping {path}: not a readable image")
+                continue
+            for width, height in sizes:
+                if (image.shape[0] > image.shape[1]) != (height > width):
+                    width, height = height, width
+                frames.append((os.path.basename(path),
+                               cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)))
+    return frames
+
+
+def spread(items, count):
+    """Up to `count` items evenly spaced through a sorted list, both ends included"""
+    if len(items) <= count:
+        return items
+    if count == 1:
+        return items[-1:]
+    return [items[round(i * (len(items) - 1) / (count - 1))] for i in range(count)]
+
+
+def emitted_plans(engine, per_type, plan_count):
+    """Single-operation plans per operation type, plus whole plans, as plan_changes emits them"""
+    operations, plans = {}, {}
+    names = list(MEASUREMENT_GRID)
+    for values in itertools.product(*MEASUREMENT_GRID.values()):
+        measurements = dict(zip(names, values))
+        for level in INTENSITY_LEVELS.values():
+            plan = engine.plan_changes(measurements, engine.rules_for_intensity(level))
+            plans[json.dumps(plan, sort_keys=True)] = plan
+            for operation in plan:
+                operations[json.dumps(operation, sort_keys=True)] = operation
+
+    by_type = defaultdict(list)
+    for operation in operations.values():
+        by_type[f"{operation['region']}_{operation['type']}"].append(operation)
+    cases = []
+    for label, ops in sorted(by_type.items()):
+        ops.sort(key=lambda op: next((op[p] for p in PARAMETERS if p in op), 0))
+        cases.extend((label, [op]) for op in spread(ops, per_type))
+    cases.extend((f"{op['region']}_{op['type']}", [op]) for op in EXTRA_OPERATIONS)
+    whole = sorted(plans.values(), key=len)
+    cases.extend(("plan", plan) for plan in spread(whole, plan_count) if plan)
+    return cases
+
+
+def psnr(a, b):
+    mse = np.mean((a.astype(np.float64) - b.astype(np.float64)) ** 2)
+    return math.inf if mse == 0 else 10 * math.log10(255.0 ** 2 / mse)
+
+
+def candidate_renderers():
+    """Optimized paths under test, each taking (frame, operations) to a rendered frame"""
+    strips = ImageProcessor()
+    full = ImageProcessor(memory_budget_mb=0)
+    morpher = MorphGenerator(strips)
+    return {
+        "standard": lambda image, ops: strips.render(image, ops),
+        "full_frame": lambda image, ops: full.render(image, ops),
+        "render_many": lambda image, ops: strips.render_many(image, {"plan": ops})["plan"],
+        "high": lambda image, ops: strips.render(image, ops, "high"),
+        "draft": lambda image, ops: strips.render(image, ops, "draft"),
+        "morph": lambda image, ops: morpher.frame(morpher.deform(image, ops), 1.0),
+    }
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check optimized render paths against the reference renderer")
+    parser.add_argument("--images", default=DEFAULT_IMAGES, help="Comma-separated globs of face photos")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="Comma-separated WxH sizes for the photos")
+    parser.add_argument("--synthetic-sizes", default=DEFAULT_SYNTHETIC_SIZES,
+                        help="Comma-separated WxH sizes of drawn faces")
+    parser.add_argument("--candidates", default=",".join(THRESHOLDS), help="Comma-separated paths to check")
+    parser.add_argument("--per-type", type=int, default=4, help="Parameter values checked per operation type")
+    parser.add_argument("--plans", type=int, default=4, help="Whole plans checked as well")
+    parser.add_argument("--min-psnr", type=float, default=None, help="One PSNR threshold for every path")
+    parser.add_argument("--json", dest="json_path", default=None, help="Also write the results as JSON")
+    args = parser.parse_args()
+
+    renderers = candidate_renderers()
+    names = [name for name in args.candidates.split(",") if name]
+    unknown = [name for name in names if name not in renderers]
+    if unknown:
+        print(f"❌ Unknown candidates {unknown}, expected some of {list(renderers)}")
+        sys.exit(2)
+
+    frames = load_corpus(args.images, parse_sizes(args.sizes), parse_sizes(args.synthetic_sizes))
+    cases = emitted_plans(BeautyRulesEngine(), args.per_type, args.plans)
+    print(f"🧪 {len(cases)} plans x {len(frames)} frames x {len(names)} paths")
+
+    reference = ReferenceRenderer()
+    # (path, label) -> worst psnr, largest max-abs, seconds spent on plans that draw something, case counts
+    rows = defaultdict(lambda: {"psnr": math.inf, "max_abs": 0, "reference_s": 0.0, "candidate_s": 0.0,
+                                "cases": 0, "noop": 0})
+    for _, frame in frames:
+        for label, operations in cases:
+            expected, reference_s = timed(reference.render, frame, operations)
+            # Some parameters are not drawn (e.g. brow lifts beyond Botox range); those only check the copy
+            noop = np.array_equal(expected, frame)
+            for name in names:
+                actual, candidate_s = timed(renderers[name], frame, operations)
+                if actual.shape != expected.shape:
+                    # Tiers that work at a lower resolution are judged at that resolution
+                    target = cv2.resize(expected, (actual.shape[1], actual.shape[0]), interpolation=cv2.INTER_AREA)
+                else:
+                    target = expected
+                row = rows[(name, label)]
+                row["psnr"] = min(row["psnr"], psnr(actual, target))
+                row["max_abs"] = max(row["max_abs"], int(np.abs(actual.astype(np.int16) - target).max()))
+                row["cases"] += 1
+                row["noop"] += noop
+                if not noop:
+                    row["reference_s"] += reference_s
+                    row["candidate_s"] += candidate_s
+
+    print("\n📊 Optimized paths vs reference (worst case over frames and parameters)")
+    print("=" * 92)
+    print(f"{'path':>12}  {'operation':>24}  {'cases':>5}  {'no-op':>5}  {'min PSNR':>8}  {'max abs':>7}  "
+          f"{'speedup':>7}  {'limit':>6}")
+    failures = []
+    results = []
+    for (name, label), row in sorted(rows.items()):
+        threshold = args.min_psnr if args.min_psnr is not None else THRESHOLDS[name]
+        ok = row["psnr"] >= threshold
+        speedup = row["reference_s"] / row["candidate_s"] if row["candidate_s"] else None
+        shown = "inf" if math.isinf(row["psnr"]) else f"{row['psnr']:.1f}"
+        faster = "-" if speedup is None else f"{speedup:.2f}x"
+        print(f"{name:>12}  {label:>24}  {row['cases']:>5}  {row['noop']:>5}  {shown:>8}  {row['max_abs']:>7}  "
+              f"{faster:>7}  {threshold:>6.1f} {'✅' if ok else '❌'}")
+        results.append({"path": name, "operation": label, "cases": row["cases"], "noop_cases": row["noop"],
+                        "min_psnr": None if math.isinf(row["psnr"]) else row["psnr"],
+                        "max_abs_diff": row["max_abs"], "speedup": speedup, "threshold": threshold, "ok": ok})
+        if not ok:
+            failures.append(f"{name}/{label}")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\n📄 Results written to {args.json_path}")
+
+    # An operation that never draws anything would pass every comparison without testing the renderer
+    idle = sorted({label for (_, label), row in rows.items() if row["noop"] == row["cases"]})
+    if idle:
+        print(f"\n❌ No change in any case: {', '.join(idle)}")
+    if failures:
+        print(f"\n❌ Below threshold: {', '.join(failures)}")
+    if idle or failures:
+        sys.exit(1)
+    print("\n✅ All paths within their thresholds")
+
+
+if __name__ == "__main__":
+    main()